@@ -1,9 +1,17 @@
 import os
 import json
 import uuid
+import hashlib
 from openai import OpenAI
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from llm_client import create_completion
+from llm_schema import parse_structured
+from llm_usage import tracked
+from datetime import date, datetime, timedelta
+from habit_history import (
+    month_key, set_day, window_counts, recent_history, logged_days,
+    STRUGGLE_MISS_THRESHOLD, STRUGGLE_WINDOW_DAYS
+)
 
 # --- Firebase Admin SDK for Database ---
 # You'll need to install this library: pip install firebase-admin
@@ -44,14 +52,15 @@ class HabitAgent:
     """
     A comprehensive AI agent for habit formation, using Firestore as its memory.
     """
-    def __init__(self, user_id: str, db_client, model: str = "deepseek-chat"):
+    def __init__(self, user_id: str, db_client, model: str = None):
         """
         Initializes the agent with a user ID and database/AI clients.
+        Pass a model to pin it; by default model_router picks one per call.
         """
         self.user_id = user_id
         self.model = model
         self.db = db_client
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0)  # create_completion retries within the deadline
         # The user's entire state is represented by a single document in Firestore.
         self.user_ref = self.db.collection('users').document(self.user_id)
         self.memory = self._load_memory()
@@ -63,7 +72,13 @@ class HabitAgent:
         try:
             doc = self.user_ref.get()
             if doc.exists:
-                return doc.to_dict()
+                memory = doc.to_dict()
+                for details in memory.get('habits', {}).values():
+                    # The old undated ArrayUnion 'history' can't be mapped to days,
+                    # so it is left in place (and saved back as-is) until an
+                    # explicit migration decides what to do with it
+                    details.setdefault('history_months', {})
+                return memory
             else:
                 # First-time user setup: create the initial structure.
                 default_memory = {
@@ -109,6 +124,7 @@ class HabitAgent:
 
     # --- Agent "Skills" / Tools (Logic remains the same, relies on _save_memory) ---
 
+    @tracked('agent.deconstruct_complex_habit', user_attr='user_id')
     def deconstruct_complex_habit(self, complex_habit: str) -> dict:
         """Skill: Breaks a complex goal into a 4-week progression plan."""
         self.memory["main_goal"] = complex_habit
@@ -122,41 +138,43 @@ You are an expert AI habit formation coach. Your task is to deconstruct a user's
         user_prompt = f"Please deconstruct this complex goal into a 4-week plan: '{complex_habit}'"
 
         try:
-            response = self.client.chat.completions.create(
+            response = create_completion(dict(
                 model=self.model,
                 messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
                 temperature=0.7, response_format={"type": "json_object"}
-            )
-            data = json.loads(response.choices[0].message.content)
+            ), self.client, task='agent_progression_plan')
+            data = parse_structured(response.choices[0].message.content, 'agent_progression_plan')
             self.memory['identity_shift'] = data.get('identity_shift')
             for week_plan in data.get("progression_plan", []):
                 habit_name = week_plan['action']
                 if habit_name not in self.memory['habits']:
-                    self.memory['habits'][habit_name] = {"history": [], "stacked_on": None}
+                    self.memory['habits'][habit_name] = {"history_months": {}, "stacked_on": None}
             self._save_memory()
             return data
         except Exception as e:
             print(f"An error occurred in deconstruct_complex_habit: {e}")
             return {}
 
+    @tracked('agent.analyze_and_adjust_habit', user_attr='user_id')
     def analyze_and_adjust_habit(self, habit: str) -> dict:
         """Skill: Analyzes a struggling habit and suggests adjustments."""
-        history = self.memory["habits"].get(habit, {}).get("history", [])
-        if not history: return {}
+        months = self.memory["habits"].get(habit, {}).get("history_months", {})
+        history = recent_history(months, date.today(), 7)
+        if not any(status is not None for status in history): return {}
         self._log_interaction("agent", f"Analyzing struggling habit: {habit}")
 
         system_prompt = """
 You are an empathetic AI habit coach. You have noticed the user is struggling. Offer gentle suggestions based on "Atomic Habits". Respond with a JSON object with "observation" and "suggestions".
 """
-        user_prompt = f"I'm trying to build the habit: '{habit}'. Here is my completion history for the last 7 days (True=completed, False=missed): {history[-7:]}. Please give me some suggestions."
+        user_prompt = f"I'm trying to build the habit: '{habit}'. Here is my completion history for the last 7 days, oldest first (True=completed, False=missed, None=not logged): {history}. Please give me some suggestions."
 
         try:
-            response = self.client.chat.completions.create(
+            response = create_completion(dict(
                 model=self.model,
                 messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
                 temperature=0.8, response_format={"type": "json_object"}
-            )
-            adjustment = json.loads(response.choices[0].message.content)
+            ), self.client, task='adjustment')
+            adjustment = parse_structured(response.choices[0].message.content, 'adjustment')
             self._log_interaction("agent", f"Suggested adjustment for {habit}: {adjustment['suggestions']}")
             return adjustment # No need to save here, as no memory was changed.
         except Exception as e:
@@ -176,16 +194,21 @@ You are an empathetic AI habit coach. You have noticed the user is struggling. O
     # --- Agent's Reasoning Loop ---
 
     def run_daily_check(self):
-        """Simulates the agent's proactive daily check."""
+        """Simulates the agent's proactive daily check.
+
+        Only habits queued by log_habit_completion are looked at, so the check
+        costs nothing for users whose habits are on track.
+        """
         print(f"\n--- AGENT: Running daily check for user {self.user_id} on {datetime.now().date()} ---")
         self._log_interaction("agent", "Running daily check.")
         
-        struggling_habits = []
-        for habit, details in self.memory["habits"].items():
-            recent_history = details.get("history", [])[-7:]
-            missed_days = recent_history.count(False)
-            if missed_days >= 3:
-                struggling_habits.append(habit)
+        queued = {}
+        for doc in intervention_queue(self.db).where('user_id', '==', self.user_id).stream():
+            if doc.get('habit') in self.memory["habits"]:
+                queued.setdefault(doc.get('habit'), []).append(doc)
+            else:
+                doc.reference.delete()  # The habit is gone; nothing left to adjust
+        struggling_habits = list(queued)
         
         if not struggling_habits:
             print("AGENT: User is on track. Great work!")
@@ -200,23 +223,71 @@ You are an empathetic AI habit coach. You have noticed the user is struggling. O
                 print(f"MESSAGE TO USER: {adjustment['observation']}")
                 for i, suggestion in enumerate(adjustment['suggestions']):
                     print(f"Suggestion {i+1}: {suggestion}")
+                # Dequeue only once the user has had their adjustment; a failed
+                # call leaves the entry for the next check to retry
+                for doc in queued[habit]:
+                    doc.reference.delete()
         self._save_memory()
 
-    def log_habit_completion(self, habit: str, did_complete: bool):
-        """Logs the completion status of a habit."""
+    def log_habit_completion(self, habit: str, did_complete: bool, day: date = None):
+        """Logs the completion status of a habit for a day (default today)."""
+        day = day or date.today()
         if habit in self.memory.get('habits', {}):
-            # This is a key change for Firestore: update the specific field.
+            # One month of history is a single integer field, so logging (or
+            # re-logging) a day rewrites just that field.
+            months = self.memory['habits'][habit].setdefault('history_months', {})
+            key = month_key(day)
+            months[key] = set_day(months.get(key, 0), day, did_complete)
             self.user_ref.update({
-                f'habits.{habit}.history': firestore.ArrayUnion([did_complete])
+                firestore.FieldPath('habits', habit, 'history_months', key).to_api_repr(): months[key]
             })
-            # Also update local memory to stay in sync for the rest of the session.
-            self.memory['habits'][habit]['history'].append(did_complete)
             status = "Completed" if did_complete else "Missed"
-            print(f"USER: Logged '{habit}' as '{status}' for {datetime.now().date()}.")
+            print(f"USER: Logged '{habit}' as '{status}' for {day}.")
             self._log_interaction("user", f"Logged habit '{habit}' as {did_complete}")
+            if not did_complete:
+                self._check_struggle(habit, day)
         else:
             print(f"AGENT: Error - Habit '{habit}' not found in memory.")
 
+    def _check_struggle(self, habit: str, day: date):
+        """Queue the habit for the daily check if this miss took it over the threshold."""
+        today = date.today()
+        if not today - timedelta(days=STRUGGLE_WINDOW_DAYS - 1) <= day <= today:
+            return
+        details = self.memory['habits'][habit]
+        missed = window_counts(details['history_months'], today, STRUGGLE_WINDOW_DAYS)['missed']
+        last_queued = details.get('last_intervention')
+        if missed < STRUGGLE_MISS_THRESHOLD or (
+            last_queued and date.fromisoformat(last_queued) > today - timedelta(days=STRUGGLE_WINDOW_DAYS)
+        ):
+            return  # On track, or already queued in this window
+        
+        # Deterministic ID, so a repeated enqueue overwrites instead of duplicating
+        doc_id = hashlib.sha1(f"{self.user_id}\0{habit}".encode('utf-8')).hexdigest()
+        intervention_queue(self.db).document(doc_id).set({
+            "user_id": self.user_id,
+            "habit": habit,
+            "misses": missed,
+            "window_end": today.isoformat(),
+            "enqueued_at": firestore.SERVER_TIMESTAMP
+        })
+        details['last_intervention'] = today.isoformat()
+        self.user_ref.update({
+            firestore.FieldPath('habits', habit, 'last_intervention').to_api_repr(): details['last_intervention']
+        })
+        print(f"AGENT: '{habit}' has {missed} misses in {STRUGGLE_WINDOW_DAYS} days, queued for support.")
+
+def intervention_queue(db_client):
+    """Collection of habits waiting for a proactive check-in, one document per habit"""
+    return db_client.collection('intervention_queue')
+
+def run_queued_checks(db_client, limit: int = 500):
+    """Fleet-wide daily job: run the check for users with queued habits only."""
+    user_ids = {doc.get('user_id') for doc in intervention_queue(db_client).limit(limit).stream()}
+    for user_id in user_ids:
+        HabitAgent(user_id, db_client).run_daily_check()
+    return len(user_ids)
+
 # --- Main Execution Block: Simulating a User's Journey ---
 
 if __name__ == '__main__':
@@ -242,17 +313,15 @@ if __name__ == '__main__':
 
         # Simulate a week of progress
         habits_to_log = list(agent.memory['habits'].keys())
-        # To prevent re-logging on every run, we'll check the history length
-        if len(agent.memory['habits'][habits_to_log[0]]['history']) < 2:
-            agent.log_habit_completion(habits_to_log[0], True)
-            agent.log_habit_completion(habits_to_log[0], True)
-
-        if len(habits_to_log) > 1 and len(agent.memory['habits'][habits_to_log[1]]['history']) < 5:
-            agent.log_habit_completion(habits_to_log[1], True)
-            agent.log_habit_completion(habits_to_log[1], False)
-            agent.log_habit_completion(habits_to_log[1], True)
-            agent.log_habit_completion(habits_to_log[1], False)
-            agent.log_habit_completion(habits_to_log[1], False)
+        # To prevent re-logging on every run, we'll check how many days are logged
+        today = date.today()
+        if logged_days(agent.memory['habits'][habits_to_log[0]]['history_months']) < 2:
+            agent.log_habit_completion(habits_to_log[0], True, today - timedelta(days=1))
+            agent.log_habit_completion(habits_to_log[0], True, today)
+
+        if len(habits_to_log) > 1 and logged_days(agent.memory['habits'][habits_to_log[1]]['history_months']) < 5:
+            for days_ago, did_complete in enumerate([False, False, True, False, True]):
+                agent.log_habit_completion(habits_to_log[1], did_complete, today - timedelta(days=days_ago))
 
         # Proactive Agent Intervention
         agent.run_daily_check()
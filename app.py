@@ -1,25 +1,55 @@
 from flask import Flask, request, jsonify, render_template, session
 import os
 import sys
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 import json
-from datetime import datetime
+import asyncio
+import click
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
 # Add the parent directory to the sys.path to allow importing habit_builder
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from habit_builder import goal_decomposition
-from habit_stacker import generate_habit_stacks # Import the new function
-from reduce_friction import deconstruct_complex_habit, analyze_and_adjust_habit
+# Async LLM calls for the async views (see asgi.py for serving them under ASGI)
+from habit_builder import goal_decomposition_async
+from habit_stacker import generate_habit_stacks_async
+from reduce_friction import deconstruct_complex_habit_async, analyze_and_adjust_habit_async, adjustment_fingerprint
+from llm_client import DeadlineExceeded, set_deadline, llm_stats
+from llm_schema import structured_output_stats
 
 # Database imports
 from models import db, init_db_tables
 from database_service import DatabaseService
+from habit_history import STRUGGLE_MISS_THRESHOLD
+from storage import apply_storage_profile
+from replica import primary_read, replica_read, replica_router, REPLICA_BIND
+from session_auth import session_auth, current_user_id, request_token, admin_authorized
+from idempotency import idempotency
+from slow_query import slow_query_log
+from llm_usage import ledger as llm_usage_ledger, set_usage_user
+from live_updates import live_updates, EVENT_STREAM_HEADERS
+from search_index import search_index
+from group_commit import GroupCommitter, CommitPending
+from data_export import encode_export, EXPORT_FORMATS
+from static_assets import StaticAssetManifest
+from json_provider import init_json
 
-app = Flask(__name__, static_folder='frontend/habit-builder-react/build', static_url_path='')
+# The React build is served by the precompressed asset manifest below rather
+# than Flask's static route, so the app has no static_folder of its own
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frontend', 'habit-builder-react', 'build')
+
+app = Flask(__name__, static_folder=None)
 CORS(app)
 
+# orjson-backed JSON (when installed) and gzip for API responses above the threshold
+app.config['JSON_COMPRESS_MIN_SIZE'] = int(os.getenv('JSON_COMPRESS_MIN_SIZE', 1024))  # 0 disables
+init_json(app, min_compress_size=app.config['JSON_COMPRESS_MIN_SIZE'])
+
+static_assets = StaticAssetManifest(STATIC_DIR).build()
+
 # Database configuration - flexible for different environments
 if os.getenv('DATABASE_URL'):
     # Production - use environment variable (Heroku, Railway, etc.)
@@ -34,14 +64,59 @@ else:
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# Optional read replica for DatabaseService's read-only queries. Reads fall back to
+# the primary for REPLICA_STICKY_SECONDS after a user's write, and whenever the
+# replica is more than REPLICA_MAX_LAG_SECONDS behind.
+if os.getenv('REPLICA_DATABASE_URL'):
+    app.config['SQLALCHEMY_BINDS'] = {REPLICA_BIND: os.getenv('REPLICA_DATABASE_URL')}
+app.config['REPLICA_MAX_LAG_SECONDS'] = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 5))
+app.config['REPLICA_STICKY_SECONDS'] = float(os.getenv('REPLICA_STICKY_SECONDS', 5))
+app.config['REPLICA_HEARTBEAT_SECONDS'] = float(os.getenv('REPLICA_HEARTBEAT_SECONDS', 1))
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-change-this-in-production')
 
+# Storage profile ('default' or 'wal') and optional group commit for habit logs
+app.config['STORAGE_PROFILE'] = os.getenv('STORAGE_PROFILE', 'default')
+app.config['GROUP_COMMIT_WINDOW_MS'] = float(os.getenv('GROUP_COMMIT_WINDOW_MS', 0))  # 0 disables
+app.config['GROUP_COMMIT_MAX_BATCH'] = int(os.getenv('GROUP_COMMIT_MAX_BATCH', 256))
+
+# Session tokens: lifetime, validation cache and expiry sweep
+app.config['SESSION_TTL_SECONDS'] = int(os.getenv('SESSION_TTL_SECONDS', 30 * 24 * 3600))
+app.config['SESSION_CACHE_TTL'] = float(os.getenv('SESSION_CACHE_TTL', 60))
+app.config['SESSION_CACHE_SIZE'] = int(os.getenv('SESSION_CACHE_SIZE', 65536))
+app.config['SESSION_SWEEP_SECONDS'] = float(os.getenv('SESSION_SWEEP_SECONDS', 300))  # 0 disables
+app.config['ADMIN_TOKEN'] = os.getenv('ADMIN_TOKEN')  # Sent as X-Admin-Token to /api/admin/...; unset disables them
+
+# How long an Idempotency-Key's stored response is replayed, and how often expired keys are purged
+app.config['IDEMPOTENCY_TTL_SECONDS'] = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 24 * 3600))
+app.config['IDEMPOTENCY_SWEEP_SECONDS'] = float(os.getenv('IDEMPOTENCY_SWEEP_SECONDS', 3600))  # 0 disables
+
+# Statements slower than this are logged with their plan at /api/admin/slow_queries
+app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', 100))
+app.config['SLOW_QUERY_LOG_SIZE'] = int(os.getenv('SLOW_QUERY_LOG_SIZE', 200))
+
+# LLM usage rows are written in batches of up to this many, at least this often
+app.config['LLM_USAGE_BATCH_SIZE'] = int(os.getenv('LLM_USAGE_BATCH_SIZE', 200))
+app.config['LLM_USAGE_FLUSH_SECONDS'] = float(os.getenv('LLM_USAGE_FLUSH_SECONDS', 2))
+
+# Live dashboard streams: keepalive interval, per-connection backlog, and a
+# directory for the unix sockets that fan events out across worker processes
+app.config['LIVE_UPDATES_HEARTBEAT_SECONDS'] = float(os.getenv('LIVE_UPDATES_HEARTBEAT_SECONDS', 15))
+app.config['LIVE_UPDATES_QUEUE_SIZE'] = int(os.getenv('LIVE_UPDATES_QUEUE_SIZE', 100))
+app.config['LIVE_UPDATES_SOCKET_DIR'] = os.getenv('LIVE_UPDATES_SOCKET_DIR', '')  # Empty: this process only
+
+# Time budget for a request's LLM calls; clients may ask for less with X-Request-Deadline-Ms
+app.config['REQUEST_DEADLINE_MS'] = float(os.getenv('REQUEST_DEADLINE_MS', 30000))
+
 # Initialize database
 db.init_app(app)
 
 # Create tables and default data
 with app.app_context():
-    db.create_all()
+    for engine in db.engines.values():
+        apply_storage_profile(engine, app.config['STORAGE_PROFILE'])
+    slow_query_log.init_app(app, db)
+    db.create_all(bind_key=None)  # The replica gets its schema from replication
     
     # Create a default user for testing if none exists
     from models import User
@@ -57,18 +132,241 @@ with app.app_context():
         print(f"✅ Created default user: {default_user.username}")
     else:
         print("✅ Database already initialized")
+    
+    # Backfill the daily rollup the first time it is deployed against existing logs
+    from models import DailyUserStats, HabitLog
+    if not DailyUserStats.query.first() and HabitLog.query.first():
+        rows = DatabaseService.rebuild_daily_stats()
+        print(f"✅ Backfilled {rows} daily stats rows")
+    
+    # Full-text index over habits and log notes, built on first start
+    search_index.init_app(app, db)
+    
+    replica_router.init_app(app, db)
+    if replica_router.enabled:
+        print(f"✅ Routing read-only queries to the replica (lag limit {replica_router.max_lag}s)")
+
+# Bounded pool for database work issued from async views: however many LLM
+# calls are in flight, at most DB_POOL_THREADS of them touch the database at once
+app.config['DB_POOL_THREADS'] = int(os.getenv('DB_POOL_THREADS', 8))
+db_executor = ThreadPoolExecutor(max_workers=app.config['DB_POOL_THREADS'], thread_name_prefix='db')
+
+async def run_db(func, *args):
+    """Run a blocking database call on the DB pool, inside its own app context"""
+    def call():
+        with app.app_context():
+            return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(db_executor, call)
+
+idempotency.init_app(app, run_db)
+llm_usage_ledger.init_app(app)
+live_updates.init_app(app)
+
+group_committer = None
+if app.config['GROUP_COMMIT_WINDOW_MS'] > 0:
+    group_committer = GroupCommitter(
+        app,
+        window_ms=app.config['GROUP_COMMIT_WINDOW_MS'],
+        max_batch=app.config['GROUP_COMMIT_MAX_BATCH']
+    )
+
+@app.cli.command('rebuild-daily-stats')
+def rebuild_daily_stats_command():
+    """Recompute the daily_user_stats rollup from habit_logs"""
+    rows = DatabaseService.rebuild_daily_stats()
+    print(f"✅ Rebuilt {rows} daily stats rows")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Re-index every habit and log note for full-text search"""
+    if not search_index.enabled:
+        raise click.ClickException("Full-text search needs SQLite with FTS5 or PostgreSQL")
+    documents = search_index.rebuild(db.session)
+    print(f"✅ Indexed {documents} habits and notes for search")
+
+@app.cli.command('sync-replica')
+def sync_replica_command():
+    """Copy the primary onto the replica (SQLite only, for trying replica routing locally)"""
+    primary, replica = db.engines[None], db.engines.get(REPLICA_BIND)
+    if replica is None or primary.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+        raise click.ClickException("sync-replica needs SQLite DATABASE_URL and REPLICA_DATABASE_URL")
+    replica_router.beat()  # So the copy reports zero lag
+    source, target = primary.raw_connection(), replica.raw_connection()
+    try:
+        source.driver_connection.backup(target.driver_connection)
+    finally:
+        source.close()
+        target.close()
+    print("✅ Copied the primary database onto the replica")
+
+@app.cli.command('archive-logs')
+@click.option('--batch-size', default=500, help='Habits archived per transaction')
+def archive_logs_command(batch_size):
+    """Move habit logs older than ARCHIVE_AFTER_DAYS into the monthly archive table"""
+    moved = DatabaseService.archive_old_logs(habit_batch_size=batch_size)
+    print(f"✅ Archived {moved['logs_archived']} logs into {moved['archive_rows']} monthly rows"
+          + (f", restored {moved['logs_restored']} logs newer than the horizon" if moved['logs_restored'] else ""))
+
+@app.cli.command('import-agent-memory')
+@click.argument('source')
+@click.option('--chunk-size', default=500, help='Memory documents per transaction')
+@click.option('--checkpoint', default=None, help='File recording progress, for resuming an interrupted import')
+def import_agent_memory_command(source, chunk_size, checkpoint):
+    """Import HabitAgent memory (JSON directory, JSON-lines file or firestore:<collection>)"""
+    from memory_import import import_memory
+    
+    totals = import_memory(source, chunk_size=chunk_size, checkpoint=checkpoint)
+    print(f"✅ Imported {totals['users']} users, {totals['habits']} habits and {totals['logs']} logs "
+          f"from {totals['documents']} documents in {totals['elapsed_s']}s ({totals['rows_per_sec']:,} rows/sec)")
+    if totals['undated_skipped'] or totals['invalid']:
+        print(f"⚠️  Skipped {totals['undated_skipped']} undated legacy history entries "
+              f"and {totals['invalid']} invalid documents")
+
+@app.cli.command('precompute-adjustments')
+@click.option('--limit', default=1000, help='Maximum at-risk habits to consider in this run')
+@click.option('--min-misses', default=STRUGGLE_MISS_THRESHOLD, help='Missed days in the struggle window that make a habit at risk')
+@click.option('--workers', default=4, help='Concurrent LLM calls')
+def precompute_adjustments_command(limit, min_misses, workers):
+    """Generate adjustment suggestions for at-risk habits ahead of time (run off-peak)"""
+    from reduce_friction import analyze_and_adjust_habit
+    
+    at_risk = DatabaseService.find_at_risk_habits(min_misses=min_misses, limit=limit)
+    stored = DatabaseService.get_precomputed_fingerprints([habit_id for _, habit_id, _, _ in at_risk])
+    jobs = []
+    for user_id, habit_id, name, misses in at_risk:
+        history = DatabaseService.get_recent_history(user_id, habit_id)
+        fingerprint = adjustment_fingerprint(name, history)
+        if stored.get(habit_id) != fingerprint:  # Suggestions for this exact history are already stored
+            jobs.append((user_id, habit_id, name, misses, history, fingerprint))
+    
+    def generate(job):
+        set_usage_user(job[0])
+        return analyze_and_adjust_habit(job[2], job[4])
+    
+    generated = failed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='precompute') as pool:
+        for (user_id, habit_id, _, misses, history, fingerprint), suggestions in zip(jobs, pool.map(generate, jobs)):
+            if not suggestions:
+                failed += 1
+                continue
+            DatabaseService.save_precomputed_adjustment(user_id, habit_id, fingerprint, history, misses, suggestions)
+            generated += 1
+    llm_usage_ledger.flush()
+    print(f"✅ Precomputed suggestions for {generated} of {len(at_risk)} at-risk habits "
+          f"({len(at_risk) - len(jobs)} already up to date, {failed} failed)")
+
+@app.cli.command('process-interventions')
+@click.option('--limit', default=100, help='Maximum queued interventions to handle in this run')
+def process_interventions_command(limit):
+    """Ask the coach for suggestions for each habit queued as struggling"""
+    from reduce_friction import analyze_and_adjust_habit
+    
+    processed = failed = 0
+    for intervention in DatabaseService.get_pending_interventions(limit):
+        habit = DatabaseService.get_habit(intervention.user_id, intervention.habit_id)
+        if habit:
+            history = DatabaseService.get_recent_history(intervention.user_id, intervention.habit_id)
+            set_usage_user(intervention.user_id)
+            suggestions = analyze_and_adjust_habit(habit.name, history)
+            if not suggestions:
+                failed += 1  # Left pending for the next run
+                continue
+        else:
+            suggestions = {}
+        DatabaseService.complete_intervention(intervention.id, suggestions)
+        processed += 1
+    llm_usage_ledger.flush()
+    print(f"✅ Processed {processed} interventions ({failed} left pending after LLM errors)")
+
+@app.before_request
+def start_request_deadline():
+    """Start the clock that bounds this request's LLM calls"""
+    budget_ms = app.config['REQUEST_DEADLINE_MS']
+    requested_ms = request.headers.get('X-Request-Deadline-Ms', type=float)
+    if requested_ms and requested_ms > 0:
+        budget_ms = min(budget_ms, requested_ms)
+    set_deadline(budget_ms / 1000)
+
+@app.teardown_request
+def clear_request_deadline(exc=None):
+    set_deadline(None)  # Worker threads are reused across requests
+
+session_auth.init_app(app)
+
+@app.before_request
+def require_admin_token():
+    """/api/admin/... exposes statements, usage and internals: require the admin token"""
+    if request.path.startswith('/api/admin/') and not admin_authorized():
+        return jsonify({"error": "Admin token required"}), 403
+
+@app.before_request
+def attribute_llm_usage():
+    """Charge this request's LLM calls to its user (registered after session_auth sets g.user_id)"""
+    data = request.get_json(silent=True) if request.is_json else None
+    requested = data.get('user_id') if isinstance(data, dict) else None
+    set_usage_user(g.user_id if g.get('user_id') is not None else requested)
+
+@app.teardown_request
+def clear_llm_usage_user(exc=None):
+    set_usage_user(None)
+
+@app.errorhandler(DeadlineExceeded)
+def handle_deadline_exceeded(e):
+    return jsonify({"error": "The AI coach took too long to respond, please try again"}), 504
+
+@app.errorhandler(CommitPending)
+def handle_commit_pending(e):
+    # The write may still land; retrying is safe because log writes are upserts
+    response = jsonify({"error": "Saving took too long, please try again"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@replica_read
+def conditional_json(user_id, build_body, *variant):
+    """Return build_body() as JSON with a weak ETag, or a bare 304 if the client's copy is current
+
+    The tag combines the user's data version (bumped by every DatabaseService
+    write) with today's date, since streaks and "completed today" roll over at
+    midnight without any write. build_body is only called on a miss.
+
+    The version and the body are read under one replica routing decision, so a
+    lagging replica can't serve an old body under the primary's newer tag.
+    """
+    version = DatabaseService.get_data_version(user_id)
+    etag = '-'.join(str(part) for part in (user_id, version, datetime.now().date().isoformat(), *variant))
+    
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build_body())
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def serve_index():
+    response = static_assets.serve('index.html', request)
+    if response is None:
+        return jsonify({"error": "Frontend build not found, run `npm run build`"}), 404
+    return response
 
 @app.route('/')
 def index():
-    return send_from_directory(app.static_folder, 'index.html')
+    if app.debug:
+        static_assets.refresh_if_changed()
+    return serve_index()
 
 @app.route('/<path:path>')
 def serve_static(path):
-    try:
-        return send_from_directory(app.static_folder, path)
-    except:
-        # For React router, return index.html for non-API routes
-        return send_from_directory(app.static_folder, 'index.html')
+    if app.debug:
+        static_assets.refresh_if_changed()
+    response = static_assets.serve(path, request)
+    if response is not None:
+        return response
+    # A missing build file (e.g. a stale bundle) is a real 404; anything else
+    # is a React router path, so hand back index.html
+    if static_assets.is_missing_asset(path):
+        return jsonify({"error": "File not found"}), 404
+    return serve_index()
 
 # User management endpoints
 @app.route('/api/users', methods=['POST'])
@@ -84,37 +382,84 @@ def create_or_get_user():
     user = DatabaseService.get_or_create_user(username, email)
     return jsonify(user.to_dict())
 
+@app.route('/api/sessions', methods=['POST'])
+def create_session():
+    """Start a session for a user (by username, as POST /api/users) and return its token"""
+    data = request.get_json()
+    username = data.get('username')
+    
+    if not username:
+        return jsonify({"error": "Username is required"}), 400
+    
+    user = DatabaseService.get_or_create_user(username, data.get('email'))
+    user_session = DatabaseService.create_session(user.id, app.config['SESSION_TTL_SECONDS'])
+    return jsonify({
+        "session_token": user_session.session_token,
+        "expires_at": user_session.expires_at.isoformat(),
+        "user": user.to_dict()
+    })
+
+@app.route('/api/sessions', methods=['DELETE'])
+def end_session():
+    """Log out: deactivate the request's session token"""
+    token = request_token()
+    if not token:
+        return jsonify({"error": "No session token provided"}), 400
+    DatabaseService.end_session(token)
+    session_auth.invalidate(token)
+    return jsonify({"success": True})
+
 @app.route('/api/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     """Get user information"""
-    from models import User
-    user = User.query.get(user_id)
+    user = DatabaseService.get_user(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
     return jsonify(user.to_dict())
 
+def save_decomposition(user_id, goal, identity_shift, atomic_habits):
+    """Store a goal decomposition and return the created habits as dicts"""
+    # Update user's main goal and identity shift
+    DatabaseService.update_user_goal(user_id, goal, identity_shift)
+    
+    # Create habits in database
+    created_habits = []
+    for habit_data in atomic_habits:
+        habit = DatabaseService.create_habit_from_decomposition(user_id, habit_data)
+        created_habits.append(habit.to_dict())
+    return created_habits
+
+def save_habit_stacks(user_id, habit_stacks):
+    """Store habit stacks and return the created habits as dicts"""
+    created_habits = []
+    for stack_data in habit_stacks:
+        habit = DatabaseService.create_habit_stack(user_id, stack_data)
+        created_habits.append(habit.to_dict())
+    return created_habits
+
 @app.route('/decompose_goal', methods=['POST'])
-def decompose_goal():
+@idempotency.idempotent
+async def decompose_goal():
     data = request.get_json()
     user_goal = data.get('goal')
-    user_id = data.get('user_id', 1)  # Default to user 1 for now
+    user_id = current_user_id(data.get('user_id'))  # The session's user, else user 1 for now
 
     if not user_goal:
         return jsonify({"error": "Goal not provided"}), 400
 
     # Get AI decomposition
-    decomposed_habits = goal_decomposition(user_goal)
+    decomposed_habits = await goal_decomposition_async(user_goal)
+    if not decomposed_habits:
+        # Unrepairable model output: say so instead of silently creating nothing
+        return jsonify({"error": "The AI coach returned an unusable answer, please try again"}), 502
     
-    # Update user's main goal and identity shift
-    identity_shift = decomposed_habits.get('identity_shift')
-    DatabaseService.update_user_goal(user_id, user_goal, identity_shift)
-    
-    # Create habits in database
-    created_habits = []
-    atomic_habits = decomposed_habits.get('atomic_habits', [])
-    for habit_data in atomic_habits:
-        habit = DatabaseService.create_habit_from_decomposition(user_id, habit_data)
-        created_habits.append(habit.to_dict())
+    created_habits = await run_db(
+        save_decomposition,
+        user_id,
+        user_goal,
+        decomposed_habits.get('identity_shift'),
+        decomposed_habits.get('atomic_habits', [])
+    )
     
     # Return the original AI response plus database IDs
     response = decomposed_habits.copy()
@@ -123,24 +468,24 @@ def decompose_goal():
     return jsonify(response)
 
 @app.route('/stack_habits', methods=['POST'])
-def stack_habits():
+@idempotency.idempotent
+async def stack_habits():
     data = request.get_json()
     current_habits = data.get('current_habits')
     desired_habits = data.get('desired_habits')
-    user_id = data.get('user_id', 1)  # Default to user 1 for now
+    user_id = current_user_id(data.get('user_id'))  # The session's user, else user 1 for now
 
     if not current_habits or not desired_habits:
         return jsonify({"error": "Current habits and desired habits must be provided"}), 400
 
     # Get AI habit stacking
-    stacked_result = generate_habit_stacks(current_habits, desired_habits)
+    stacked_result = await generate_habit_stacks_async(current_habits, desired_habits)
+    if not stacked_result:
+        # Unrepairable model output: say so instead of silently creating nothing
+        return jsonify({"error": "The AI coach returned an unusable answer, please try again"}), 502
     
     # Create stacked habits in database
-    created_habits = []
-    habit_stacks = stacked_result.get('habit_stacks', [])
-    for stack_data in habit_stacks:
-        habit = DatabaseService.create_habit_stack(user_id, stack_data)
-        created_habits.append(habit.to_dict())
+    created_habits = await run_db(save_habit_stacks, user_id, stacked_result.get('habit_stacks', []))
     
     # Return the original AI response plus database IDs
     response = stacked_result.copy()
@@ -153,7 +498,7 @@ def stack_habits():
 def track_habit():
     """Track habit completion"""
     data = request.get_json()
-    user_id = data.get('user_id', 1)  # Default to user 1 for now
+    user_id = current_user_id(data.get('user_id'))  # The session's user, else user 1 for now
     habit_id = data.get('habit_id')
     habit_name = data.get('habit_name')
     completed = data.get('completed', True)
@@ -164,8 +509,7 @@ def track_habit():
     
     # Get habit by ID or name
     if habit_id:
-        from models import Habit
-        habit = Habit.query.filter_by(user_id=user_id, id=habit_id).first()
+        habit = DatabaseService.get_habit(user_id, habit_id)
     elif habit_name:
         habit = DatabaseService.get_habit_by_name(user_id, habit_name)
     else:
@@ -175,24 +519,57 @@ def track_habit():
         return jsonify({"error": "Habit not found"}), 404
     
     # Log the habit completion
-    log = DatabaseService.log_habit_completion(
-        user_id, habit.id, date, completed, notes, difficulty_rating
-    )
+    if group_committer:
+        log_data = group_committer.submit(
+            user_id, habit.id, date, completed, notes, difficulty_rating
+        )
+    else:
+        log = DatabaseService.log_habit_completion(
+            user_id, habit.id, date, completed, notes, difficulty_rating
+        )
+        log_data = log.to_dict() if log else None
     
-    if log:
+    if log_data:
         return jsonify({
             "success": True,
             "message": f"Habit '{habit.name}' marked as {'completed' if completed else 'not completed'} for {date}",
-            "log": log.to_dict()
+            "log": log_data
         })
     else:
         return jsonify({"error": "Failed to log habit completion"}), 500
 
+@app.route('/api/users/<int:user_id>/events', methods=['GET'])
+def user_events(user_id):
+    """Server-sent events: the habit's streak and today's counts each time one of the user's habits is logged
+
+    Under asgi.py this endpoint is served on the event loop instead (see asgi.dispatch_event_stream).
+    """
+    return Response(live_updates.stream(user_id), headers=EVENT_STREAM_HEADERS)
+
+@app.route('/api/users/<int:user_id>/search', methods=['GET'])
+@primary_read  # The index is only kept on the primary; the ETag version is read there too
+def search_habits(user_id):
+    """Full-text search over the user's habits and log notes: ?q=...&page=1&per_page=20"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    if not search_index.enabled:
+        return jsonify({"error": "Search is not available on this database"}), 503
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    
+    def build_body():
+        results, has_more = DatabaseService.search_habits(user_id, query, page, per_page)
+        return {"query": query, "page": page, "per_page": per_page, "has_more": has_more, "results": results}
+    query_key = hashlib.sha1(query.encode('utf-8')).hexdigest()[:12]
+    return conditional_json(user_id, build_body, query_key, page, per_page)
+
 @app.route('/api/users/<int:user_id>/habits', methods=['GET'])
 def get_user_habits(user_id):
     """Get all habits for a user"""
-    habits = DatabaseService.get_user_habits(user_id)
-    return jsonify([habit.to_dict() for habit in habits])
+    def build_body():
+        return DatabaseService.list_user_habits(user_id)
+    return conditional_json(user_id, build_body)
 
 @app.route('/get_habit_progress/<int:user_id>/<int:habit_id>', methods=['GET'])
 def get_habit_progress(user_id, habit_id):
@@ -200,32 +577,131 @@ def get_habit_progress(user_id, habit_id):
     days = request.args.get('days', 30, type=int)
     
     # Get habit info
-    from models import Habit
-    habit = Habit.query.filter_by(user_id=user_id, id=habit_id).first()
+    habit = DatabaseService.get_habit(user_id, habit_id)
     if not habit:
         return jsonify({"error": "Habit not found"}), 404
     
-    # Get progress data
-    logs = DatabaseService.get_habit_progress(user_id, habit_id, days)
-    current_streak = DatabaseService.get_current_streak(user_id, habit_id)
-    success_rate = DatabaseService.get_success_rate(user_id, habit_id, days)
-    
-    return jsonify({
-        "habit": habit.to_dict(),
-        "current_streak": current_streak,
-        "success_rate": round(success_rate, 1),
-        "total_logs": len(logs),
-        "logs": [log.to_dict() for log in logs[-10:]]  # Last 10 logs
-    })
+    def build_body():
+        # Get progress data
+        logs = DatabaseService.list_habit_progress(user_id, habit_id, days)
+        current_streak = DatabaseService.get_current_streak(user_id, habit_id)
+        success_rate = DatabaseService.get_success_rate(user_id, habit_id, days)
+        
+        return {
+            "habit": habit.to_dict(),
+            "current_streak": current_streak,
+            "success_rate": round(success_rate, 1),
+            "total_logs": len(logs),
+            "logs": logs[-10:]  # Last 10 logs
+        }
+    return conditional_json(user_id, build_body, habit_id, days)
 
 @app.route('/api/users/<int:user_id>/dashboard', methods=['GET'])
 def get_dashboard_stats(user_id):
     """Get comprehensive dashboard statistics"""
-    stats = DatabaseService.get_user_dashboard_stats(user_id)
-    return jsonify(stats)
+    return conditional_json(user_id, lambda: DatabaseService.get_user_dashboard_stats(user_id))
+
+@app.route('/api/users/<int:user_id>/trend', methods=['GET'])
+def get_trend(user_id):
+    """Get daily completion stats for a date range from the rollup table"""
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    return conditional_json(user_id, lambda: DatabaseService.get_daily_trend(user_id, days), days)
+
+@app.route('/api/users/<int:user_id>/interventions', methods=['GET'])
+def get_interventions(user_id):
+    """Habits flagged as struggling and the coach's suggestions for them"""
+    def build_body():
+        return DatabaseService.list_user_interventions(user_id)
+    return conditional_json(user_id, build_body)
+
+@app.route('/api/users/<int:user_id>/export', methods=['GET'])
+def export_user_data(user_id):
+    """Stream a user's profile, habits and logs as NDJSON or CSV"""
+    fmt = request.args.get('format', 'ndjson').lower()
+    compress = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+    
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unsupported format '{fmt}', use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    
+    if not DatabaseService.get_user(user_id):
+        return jsonify({"error": "User not found"}), 404
+    
+    records = DatabaseService.iter_user_export(user_id)
+    body = encode_export(records, fmt, compress)
+    
+    filename = f"user_{user_id}_export.{fmt}"
+    mimetype = EXPORT_FORMATS[fmt]
+    if compress:
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@app.route('/api/admin/cache_stats', methods=['GET'])
+def get_cache_stats():
+    """Report hit rates for the User/Habit lookup cache"""
+    return jsonify(DatabaseService.cache_stats())
+
+@app.route('/api/admin/static_assets', methods=['GET'])
+def get_static_asset_stats():
+    """Report what the precompressed asset manifest holds"""
+    return jsonify(static_assets.stats())
+
+@app.route('/api/admin/group_commit_stats', methods=['GET'])
+def get_group_commit_stats():
+    """Report batch sizes for the group-commit write path"""
+    if not group_committer:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **group_committer.stats()})
+
+@app.route('/api/admin/session_stats', methods=['GET'])
+def get_session_stats():
+    """Report the session-token cache hit rate and how often tokens needed a query"""
+    return jsonify(session_auth.stats())
+
+@app.route('/api/admin/idempotency_stats', methods=['GET'])
+def get_idempotency_stats():
+    """Report how many Idempotency-Key requests were stored, replayed or refused"""
+    return jsonify(idempotency.stats())
+
+@app.route('/api/admin/slow_queries', methods=['GET'])
+def get_slow_queries():
+    """Report recent slow statements with their plans, and statement totals by fingerprint"""
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return jsonify(slow_query_log.report(limit))
+
+@app.route('/api/admin/slow_queries', methods=['DELETE'])
+def reset_slow_queries():
+    """Start the slow-query log and totals afresh, e.g. before a load test"""
+    slow_query_log.reset()
+    return jsonify({"success": True})
+
+@app.route('/api/admin/live_stats', methods=['GET'])
+def get_live_stats():
+    """Report open live-update connections and how many events were published and delivered"""
+    return jsonify(live_updates.stats())
+
+@app.route('/api/admin/replica_stats', methods=['GET'])
+def get_replica_stats():
+    """Report replica lag and how many reads it served or handed back to the primary"""
+    return jsonify(replica_router.stats())
+
+@app.route('/api/admin/llm_usage', methods=['GET'])
+def get_llm_usage():
+    """Summarize the LLM usage ledger per feature and model over the last `hours` (default 24)"""
+    hours = request.args.get('hours', 24, type=float)
+    summary = DatabaseService.llm_usage_summary(datetime.now(timezone.utc) - timedelta(hours=hours))
+    return jsonify({**summary, "ledger": llm_usage_ledger.stats()})
+
+@app.route('/api/admin/llm_stats', methods=['GET'])
+def get_llm_stats():
+    """Report LLM latency percentiles, hedge rate, deadline misses and output repair rates"""
+    return jsonify({**llm_stats(), "structured_output": structured_output_stats()})
 
 @app.route('/reduce_friction', methods=['POST'])
-def reduce_friction():
+async def reduce_friction():
     """Get a simplified progression plan for a complex habit"""
     data = request.get_json()
     complex_habit = data.get('habit')
@@ -233,20 +709,37 @@ def reduce_friction():
     if not complex_habit:
         return jsonify({"error": "Habit not provided"}), 400
     
-    progression_plan = deconstruct_complex_habit(complex_habit)
+    progression_plan = await deconstruct_complex_habit_async(complex_habit)
     return jsonify(progression_plan)
 
 @app.route('/adjust_habit', methods=['POST'])
-def adjust_habit():
-    """Get suggestions for a struggling habit"""
+async def adjust_habit():
+    """Get suggestions for a struggling habit
+
+    With a habit_id the habit's name and recent history are read from its logs.
+    Suggestions precomputed for the same history are returned without an LLM call.
+    """
     data = request.get_json()
     habit = data.get('habit')
     history = data.get('history', [])
+    user_id = current_user_id(data.get('user_id'))
+    
+    if data.get('habit_id') is not None:
+        adjustment_input = await run_db(DatabaseService.get_adjustment_input, user_id, data['habit_id'])
+        if adjustment_input is None:
+            return jsonify({"error": "Habit not found"}), 404
+        habit, history = adjustment_input
     
     if not habit:
         return jsonify({"error": "Habit not provided"}), 400
     
-    suggestions = analyze_and_adjust_habit(habit, history)
+    precomputed = await run_db(DatabaseService.get_precomputed_adjustment, user_id, adjustment_fingerprint(habit, history))
+    if precomputed is not None:
+        response = jsonify(precomputed)
+        response.headers['X-Precomputed'] = 'true'
+        return response
+    
+    suggestions = await analyze_and_adjust_habit_async(habit, history)
     return jsonify(suggestions)
 
 if __name__ == '__main__':
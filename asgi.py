@@ -0,0 +1,225 @@
+"""
+ASGI entry point for HabitBuilder
+
+    uvicorn asgi:application --port 5001
+
+Flask's own async support runs every async view in a fresh event loop on a
+worker thread, so each slow LLM call still pins a thread. Here the async views
+(decompose_goal, stack_habits, reduce_friction, adjust_habit) are awaited
+directly on the server's event loop instead: hundreds of LLM calls can be in
+flight at once with one shared connection pool, and their database work is
+bounded by app.db_executor. Live-update streams (user_events) are served on
+the loop too, so an idle connection holds a queue rather than a thread. All
+other routes are plain WSGI and run on a thread pool of ASGI_WSGI_THREADS
+threads.
+"""
+import asyncio
+import inspect
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from flask import g, request
+from werkzeug.exceptions import HTTPException
+
+from app import app as flask_app, db_executor, run_db
+from live_updates import live_updates, EVENT_STREAM_HEADERS, RETRY_MESSAGE, KEEPALIVE_MESSAGE
+from session_auth import session_auth, request_token
+
+# Endpoints whose view functions are coroutines and can run on the event loop
+ASYNC_ENDPOINTS = {
+    endpoint for endpoint, view in flask_app.view_functions.items()
+    if inspect.iscoroutinefunction(view)
+}
+
+wsgi_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ASGI_WSGI_THREADS', 32)),
+    thread_name_prefix='wsgi'
+)
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope and its body into a WSGI environ"""
+    script_name = scope.get('root_path', '').encode('utf8').decode('latin1')
+    path_info = scope['path'].encode('utf8').decode('latin1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        value = value.decode('latin1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+def response_start(status, headers):
+    return {
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+    }
+
+def handle_view_error(e):
+    try:
+        return flask_app.handle_user_exception(e)
+    except Exception as unhandled:
+        return flask_app.handle_exception(unhandled)
+
+async def send_response(response, send):
+    body = response.get_data()
+    response.close()
+    await send(response_start(response.status_code, response.headers.to_wsgi_list()))
+    await send({'type': 'http.response.body', 'body': body})
+
+async def resolve_session():
+    """Look the request's session token up on the DB pool when that takes a query
+
+    preprocess_request runs session_auth.authenticate on the event loop; it
+    finds the result in g instead of querying there.
+    """
+    token = request_token()
+    if token is None:
+        return
+    g.session_lookup = session_auth.cached(token) or await run_db(session_auth.lookup, token)
+
+async def dispatch_async_view(environ, send):
+    """Run a coroutine view on this event loop with the normal Flask request lifecycle"""
+    with flask_app.request_context(environ):
+        try:
+            await resolve_session()
+            rv = flask_app.preprocess_request()
+            if rv is None:
+                view = flask_app.view_functions[request.url_rule.endpoint]
+                rv = await view(**request.view_args)
+        except Exception as e:
+            rv = handle_view_error(e)
+        await send_response(flask_app.finalize_request(rv), send)
+
+async def dispatch_event_stream(environ, receive, send):
+    """Serve a live-update stream from an asyncio queue until the client disconnects"""
+    with flask_app.request_context(environ):
+        try:
+            await resolve_session()
+            rv = flask_app.preprocess_request()  # Session checks may refuse the stream
+        except Exception as e:
+            rv = handle_view_error(e)
+        if rv is not None:
+            await send_response(flask_app.finalize_request(rv), send)
+            return
+        user_id = request.view_args['user_id']
+
+    subscription = live_updates.subscribe(user_id, loop=asyncio.get_running_loop())
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send(response_start(200, list(EVENT_STREAM_HEADERS.items())))
+        await send({'type': 'http.response.body', 'body': RETRY_MESSAGE.encode(), 'more_body': True})
+        while not disconnected.done():
+            next_message = asyncio.ensure_future(subscription.get_async(live_updates.heartbeat))
+            await asyncio.wait([next_message, disconnected], return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                next_message.cancel()
+                break
+            message = next_message.result() or KEEPALIVE_MESSAGE
+            await send({'type': 'http.response.body', 'body': message.encode(), 'more_body': True})
+    finally:
+        live_updates.unsubscribe(subscription)
+        disconnected.cancel()
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+def run_wsgi(environ, send_sync):
+    """Run the Flask WSGI app on a worker thread, streaming its body back to the loop"""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['message'] = response_start(int(status.split(' ', 1)[0]), headers)
+
+    result = flask_app.wsgi_app(environ, start_response)
+    try:
+        sent_start = False
+        for chunk in result:
+            if not sent_start:
+                send_sync(started['message'])
+                sent_start = True
+            if chunk:
+                send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        if not sent_start:
+            send_sync(started['message'])
+        send_sync({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            wsgi_executor.shutdown(wait=False)
+            db_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    environ = build_environ(scope, await read_body(receive))
+
+    try:
+        endpoint, _ = flask_app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        endpoint = None
+
+    if endpoint in ASYNC_ENDPOINTS:
+        await dispatch_async_view(environ, send)
+        return
+    if endpoint == 'user_events':
+        await dispatch_event_stream(environ, receive, send)
+        return
+
+    loop = asyncio.get_running_loop()
+
+    def send_sync(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    await loop.run_in_executor(wsgi_executor, run_wsgi, environ, send_sync)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark sustained /track_habit writes/sec on SQLite with and without group commit
+
+Each scenario runs in a fresh process (app configuration is read at import
+time) against a throwaway database file. Usage:
+
+    python benchmarks/bench_group_commit.py [--threads 32] [--writes 100]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = [
+    ('baseline', {'STORAGE_PROFILE': 'default', 'GROUP_COMMIT_WINDOW_MS': '0'}),
+    ('wal', {'STORAGE_PROFILE': 'wal', 'GROUP_COMMIT_WINDOW_MS': '0'}),
+    ('wal + group commit', {'STORAGE_PROFILE': 'wal', 'GROUP_COMMIT_WINDOW_MS': '5'}),
+]
+
+def run_scenario(threads, writes_per_thread):
+    """Drive concurrent /track_habit calls through the test client and report writes/sec"""
+    sys.path.append(ROOT)
+    import app as app_module
+    from database_service import DatabaseService
+
+    app = app_module.app
+    with app.app_context():
+        user = DatabaseService.get_or_create_user('bench_user')
+        user_id = user.id
+        habit_ids = [
+            DatabaseService.create_habit_from_decomposition(user_id, {'habit_name': f'Bench habit {i}'}).id
+            for i in range(threads)
+        ]
+
+    errors = []
+    start_day = date.today() - timedelta(days=writes_per_thread)
+
+    def worker(habit_id):
+        client = app.test_client()
+        for n in range(writes_per_thread):
+            response = client.post('/track_habit', json={
+                'user_id': user_id,
+                'habit_id': habit_id,
+                'completed': n % 2 == 0,
+                'date': (start_day + timedelta(days=n)).isoformat()
+            })
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    workers = [threading.Thread(target=worker, args=(habit_id,)) for habit_id in habit_ids]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    total = threads * writes_per_thread
+    result = {'writes': total, 'errors': len(errors), 'seconds': round(elapsed, 3),
+              'writes_per_sec': round((total - len(errors)) / elapsed, 1)}
+    if app_module.group_committer:
+        result['avg_batch'] = app_module.group_committer.stats()['avg_batch']
+    print(json.dumps(result))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--writes', type=int, default=100, help='writes per thread')
+    parser.add_argument('--scenario', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        run_scenario(args.threads, args.writes)
+        return
+
+    print(f"{args.threads} threads x {args.writes} writes\n")
+    print(f"{'scenario':<22}{'writes/sec':>12}{'errors':>8}{'avg batch':>11}")
+    for name, overrides in SCENARIOS:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, **overrides)
+            env['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            env.setdefault('DEEPSEEK_API_KEY', 'benchmark')
+            output = subprocess.run(
+                [sys.executable, __file__, '--scenario', '--threads', str(args.threads), '--writes', str(args.writes)],
+                env=env, capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{name:<22}{result['writes_per_sec']:>12}{result['errors']:>8}{result.get('avg_batch', '-'):>11}")
+
+if __name__ == '__main__':
+    main()
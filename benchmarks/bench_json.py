@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for API response serialization and compression
+
+Seeds a throwaway SQLite database with a user who has many habits and one
+habit with a long log history, then times /api/users/<id>/habits and
+/get_habit_progress through the test client with Flask's default JSON
+provider vs. the orjson provider, with and without gzip. Usage:
+
+    python benchmarks/bench_json.py [--habits 2000] [--days 3650] [--runs 30]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def seed(app, habits, days):
+    """Bulk-insert habits and logs directly, bypassing the service layer"""
+    from models import db, Habit, HabitLog, User
+
+    with app.app_context():
+        user = User(username='bench_json_user')
+        db.session.add(user)
+        db.session.commit()
+        now = datetime.now()
+        db.session.execute(Habit.__table__.insert(), [{
+            'user_id': user.id,
+            'name': f'Habit {i}',
+            'description': f'Do habit number {i} every day',
+            'two_minute_version': 'Just start for two minutes',
+            'rationale': 'Small wins compound into identity change',
+            'created_at': now,
+            'updated_at': now,
+            'is_active': True
+        } for i in range(habits)])
+        habit_id = db.session.query(db.func.min(Habit.id)).filter_by(user_id=user.id).scalar()
+        today = date.today()
+        db.session.execute(HabitLog.__table__.insert(), [{
+            'user_id': user.id,
+            'habit_id': habit_id,
+            'date': today - timedelta(days=d),
+            'completed': d % 4 != 0,
+            'notes': f'Day {d}',
+            'difficulty_rating': d % 5 + 1,
+            'logged_at': now
+        } for d in range(days)])
+        db.session.commit()
+        return user.id, habit_id
+
+def timed(client, url, runs, headers):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        response = client.get(url, headers=headers)
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.status_code
+    return statistics.median(samples), len(response.data)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--habits', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=3650)
+    parser.add_argument('--runs', type=int, default=30)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp.name, 'bench.db')}"
+    os.environ.setdefault('DEEPSEEK_API_KEY', 'benchmark')
+    sys.path.append(ROOT)
+    import app as app_module
+    from json_provider import ISODateJSONProvider, OrjsonProvider, orjson
+
+    app = app_module.app
+    user_id, habit_id = seed(app, args.habits, args.days)
+    client = app.test_client()
+
+    urls = {
+        f'habits ({args.habits} habits)': f'/api/users/{user_id}/habits',
+        f'progress ({args.days} days)': f'/get_habit_progress/{user_id}/{habit_id}?days={args.days}'
+    }
+    providers = [('default', ISODateJSONProvider)]
+    if orjson is not None:
+        providers.append(('orjson', OrjsonProvider))
+
+    print(f"{'endpoint':<26}{'provider':<10}{'encoding':<10}{'median ms':>10}{'bytes':>10}")
+    for label, url in urls.items():
+        for name, provider in providers:
+            app.json = provider(app)
+            for encoding in ('identity', 'gzip'):
+                ms, size = timed(client, url, args.runs, {'Accept-Encoding': encoding})
+                print(f"{label:<26}{name:<10}{encoding:<10}{ms:>10.2f}{size:>10}")
+
+    # Serialization alone, without the query and ORM work
+    with app.app_context():
+        from database_service import DatabaseService
+        payload = [habit.to_dict() for habit in DatabaseService.get_user_habits(user_id)]
+        print(f"\njsonify only, {len(payload)} habit dicts:")
+        for name, provider in providers:
+            app.json = provider(app)
+            with app.test_request_context():
+                started = time.perf_counter()
+                for _ in range(args.runs):
+                    app.json.response(payload)
+                print(f"  {name:<10}{(time.perf_counter() - started) / args.runs * 1000:>8.2f} ms")
+
+if __name__ == '__main__':
+    main()
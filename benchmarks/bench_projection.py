@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Per-row cost of ORM hydration vs. column projection for read-only listings
+
+Compares DatabaseService.get_user_habits / get_habit_progress + to_dict()
+against the list_user_habits / list_habit_progress projection queries, and
+times the two endpoints that now use them. Usage:
+
+    python benchmarks/bench_projection.py [--habits 2000] [--days 3650] [--runs 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from bench_json import ROOT, seed
+
+def per_row_us(func, rows, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) / rows * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--habits', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=3650)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp.name, 'bench.db')}"
+    os.environ.setdefault('DEEPSEEK_API_KEY', 'benchmark')
+    sys.path.append(ROOT)
+    import app as app_module
+    from database_service import DatabaseService
+    from models import db
+
+    app = app_module.app
+    user_id, habit_id = seed(app, args.habits, args.days)
+
+    with app.app_context():
+        def orm_habits():
+            result = [habit.to_dict() for habit in DatabaseService.get_user_habits(user_id)]
+            db.session.expunge_all()  # Measure cold hydration every run
+            return result
+
+        def orm_logs():
+            result = [log.to_dict() for log in DatabaseService.get_habit_progress(user_id, habit_id, args.days)]
+            db.session.expunge_all()
+            return result
+
+        cases = [
+            (f'habits x{args.habits}', args.habits, orm_habits,
+             lambda: DatabaseService.list_user_habits(user_id)),
+            (f'logs x{args.days}', args.days, orm_logs,
+             lambda: DatabaseService.list_habit_progress(user_id, habit_id, args.days)),
+        ]
+        print(f"{'listing':<16}{'ORM us/row':>12}{'projection us/row':>20}{'speedup':>9}")
+        for label, rows, orm, projection in cases:
+            orm_cost = per_row_us(orm, rows, args.runs)
+            projection_cost = per_row_us(projection, rows, args.runs)
+            print(f"{label:<16}{orm_cost:>12.2f}{projection_cost:>20.2f}{orm_cost / projection_cost:>8.1f}x")
+
+    client = app.test_client()
+    print("\nendpoint medians (ms):")
+    for url in (f'/api/users/{user_id}/habits',
+                f'/get_habit_progress/{user_id}/{habit_id}?days={args.days}',
+                f'/api/users/{user_id}/dashboard'):
+        samples = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            assert client.get(url).status_code == 200
+            samples.append((time.perf_counter() - started) * 1000)
+        print(f"  {url.split('?')[0]:<40}{statistics.median(samples):>8.2f}")
+
+if __name__ == '__main__':
+    main()
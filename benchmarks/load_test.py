@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+End-to-end load generator for a running HabitBuilder server
+
+Drives a weighted mix of the app's endpoints from concurrent virtual users
+(closed loop: each one sends its next request as soon as the previous one
+finishes, after an optional think time) and reports throughput, latency
+percentiles and error rates per endpoint. Run the app against the mock LLM
+so the coaching endpoints don't hit DeepSeek:
+
+    python benchmarks/mock_llm_server.py --port 8900 &
+    DEEPSEEK_API_KEY=mock DEEPSEEK_BASE_URL=http://127.0.0.1:8900 uvicorn asgi:application --port 5001 &
+    python benchmarks/load_test.py --base-url http://127.0.0.1:5001 --users 50 --duration 60
+
+Use --mix to change the traffic mix, e.g. --mix track_habit=10,dashboard=5.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import requests
+
+GOALS = ['Learn to play guitar', 'Run a 10k', 'Read 20 books this year', 'Learn Spanish', 'Sleep better']
+CURRENT_HABITS = ['Make my morning coffee', 'Finish dinner', 'Get into bed', 'Arrive at my office desk', 'Brush my teeth']
+DESIRED_HABITS = ['Read one page of a book', 'Floss my teeth', 'Meditate for 1 minute', 'Review my to-do list', 'Tidy up the kitchen']
+
+# Relative weights: mostly check-ins and reads, with a trickle of LLM-backed calls
+DEFAULT_MIX = {
+    'track_habit': 40,
+    'list_habits': 15,
+    'habit_progress': 12,
+    'dashboard': 15,
+    'trend': 5,
+    'decompose_goal': 5,
+    'stack_habits': 3,
+    'reduce_friction': 3,
+    'adjust_habit': 2
+}
+
+class VirtualUser:
+    """One simulated client with its own account, habits and HTTP connection"""
+
+    def __init__(self, base_url, index, timeout):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.http = requests.Session()
+        self.username = f"loadtest_{int(time.time())}_{index}"
+        self.user_id = None
+        self.habit_ids = []
+        self.etags = {}
+
+    def setup(self):
+        """Create the account and give it a few habits to work with"""
+        response = self.http.post(f"{self.base_url}/api/users", json={'username': self.username}, timeout=self.timeout)
+        response.raise_for_status()
+        self.user_id = response.json()['id']
+        response = self.http.post(f"{self.base_url}/decompose_goal", json={
+            'user_id': self.user_id, 'goal': random.choice(GOALS)
+        }, timeout=self.timeout)
+        response.raise_for_status()
+        self.habit_ids = [habit['id'] for habit in response.json().get('created_habits', [])]
+
+    def get(self, path):
+        # Revalidate like a browser would, so ETag hits show up in the numbers
+        headers = {'If-None-Match': self.etags[path]} if path in self.etags else {}
+        response = self.http.get(f"{self.base_url}{path}", headers=headers, timeout=self.timeout)
+        if response.status_code == 200 and response.headers.get('ETag'):
+            self.etags[path] = response.headers['ETag']
+        return response
+
+    def post(self, path, body):
+        return self.http.post(f"{self.base_url}{path}", json=body, timeout=self.timeout)
+
+    def request(self, name):
+        habit_id = random.choice(self.habit_ids) if self.habit_ids else 1
+        if name == 'track_habit':
+            day = date.today() - timedelta(days=random.randint(0, 13))
+            return self.post('/track_habit', {
+                'user_id': self.user_id,
+                'habit_id': habit_id,
+                'date': day.isoformat(),
+                'completed': random.random() < 0.8,
+                'difficulty_rating': random.randint(1, 5)
+            })
+        if name == 'list_habits':
+            return self.get(f"/api/users/{self.user_id}/habits")
+        if name == 'habit_progress':
+            return self.get(f"/get_habit_progress/{self.user_id}/{habit_id}")
+        if name == 'dashboard':
+            return self.get(f"/api/users/{self.user_id}/dashboard")
+        if name == 'trend':
+            return self.get(f"/api/users/{self.user_id}/trend?days=30")
+        if name == 'decompose_goal':
+            return self.post('/decompose_goal', {'user_id': self.user_id, 'goal': random.choice(GOALS)})
+        if name == 'stack_habits':
+            return self.post('/stack_habits', {
+                'user_id': self.user_id,
+                'current_habits': random.sample(CURRENT_HABITS, 3),
+                'desired_habits': random.sample(DESIRED_HABITS, 2)
+            })
+        if name == 'reduce_friction':
+            return self.post('/reduce_friction', {'habit': random.choice(GOALS)})
+        if name == 'adjust_habit':
+            return self.post('/adjust_habit', {
+                'habit': random.choice(DESIRED_HABITS),
+                'history': [random.random() < 0.4 for _ in range(7)]
+            })
+        raise ValueError(f"Unknown endpoint in mix: {name}")
+
+class Results:
+    """Latency samples and error counts per endpoint, shared by all workers"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    def record(self, name, elapsed_ms, error=None):
+        with self.lock:
+            self.latencies[name].append(elapsed_ms)
+            if error is not None:
+                self.errors[name][error] += 1
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def parse_mix(value):
+    mix = dict(DEFAULT_MIX) if not value else {}
+    for item in filter(None, (value or '').split(',')):
+        name, _, weight = item.partition('=')
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown endpoint '{name}' (choose from {', '.join(DEFAULT_MIX)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+def worker(user, mix, deadline, think_time, results):
+    names, weights = list(mix), list(mix.values())
+    while time.monotonic() < deadline:
+        name = random.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            response = user.request(name)
+            error = None if response.status_code < 400 else f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            error = type(e).__name__
+        results.record(name, (time.perf_counter() - started) * 1000, error)
+        if think_time:
+            time.sleep(random.expovariate(1 / think_time))
+
+def report(results, elapsed, as_json=False):
+    rows = []
+    for name in sorted(results.latencies, key=lambda n: -len(results.latencies[n])):
+        samples = results.latencies[name]
+        errors = sum(results.errors[name].values())
+        rows.append({
+            'endpoint': name,
+            'requests': len(samples),
+            'rps': len(samples) / elapsed,
+            'p50_ms': percentile(samples, 50),
+            'p95_ms': percentile(samples, 95),
+            'p99_ms': percentile(samples, 99),
+            'max_ms': max(samples),
+            'mean_ms': statistics.fmean(samples),
+            'error_rate': errors / len(samples),
+            'errors': dict(results.errors[name])
+        })
+
+    all_samples = [s for samples in results.latencies.values() for s in samples]
+    total_errors = sum(sum(e.values()) for e in results.errors.values())
+    summary = {
+        'duration_s': elapsed,
+        'requests': len(all_samples),
+        'rps': len(all_samples) / elapsed,
+        'p50_ms': percentile(all_samples, 50) if all_samples else None,
+        'p95_ms': percentile(all_samples, 95) if all_samples else None,
+        'p99_ms': percentile(all_samples, 99) if all_samples else None,
+        'error_rate': total_errors / len(all_samples) if all_samples else None,
+        'endpoints': rows
+    }
+    if as_json:
+        print(json.dumps(summary, indent=2))
+        return summary
+
+    print(f"\n{'endpoint':<16}{'reqs':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'errors':>9}")
+    for row in rows:
+        print(f"{row['endpoint']:<16}{row['requests']:>8}{row['rps']:>9.1f}{row['p50_ms']:>9.1f}"
+              f"{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}{row['error_rate']:>9.1%}")
+    if all_samples:
+        print(f"{'total':<16}{len(all_samples):>8}{summary['rps']:>9.1f}{summary['p50_ms']:>9.1f}"
+              f"{summary['p95_ms']:>9.1f}{summary['p99_ms']:>9.1f}{max(all_samples):>9.1f}{summary['error_rate']:>9.1%}")
+    for row in rows:
+        for error, count in row['errors'].items():
+            print(f"  ⚠️  {row['endpoint']}: {count} x {error}")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:5001')
+    parser.add_argument('--users', type=int, default=20, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load after setup')
+    parser.add_argument('--think-time', type=float, default=0, help='mean seconds between a user\'s requests')
+    parser.add_argument('--timeout', type=float, default=60, help='per-request timeout in seconds')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help='endpoint=weight,... (default: built-in mix)')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    users = [VirtualUser(args.base_url.rstrip('/'), i, args.timeout) for i in range(args.users)]
+    print(f"🚀 Setting up {len(users)} virtual users against {args.base_url}...")
+    setup_errors = []
+    threads = [threading.Thread(target=lambda u=user: setup_user(u, setup_errors)) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if setup_errors:
+        print(f"❌ Setup failed for {len(setup_errors)} users: {setup_errors[0]}")
+        sys.exit(1)
+
+    print(f"📈 Running {args.duration:.0f}s of load: " + ', '.join(f"{k}={v:g}" for k, v in args.mix.items()))
+    results = Results()
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(user, args.mix, deadline, args.think_time, results))
+        for user in users
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(results, time.monotonic() - started, as_json=args.json)
+
+def setup_user(user, errors):
+    try:
+        user.setup()
+    except requests.RequestException as e:
+        errors.append(f"{user.username}: {e}")
+
+if __name__ == '__main__':
+    main()
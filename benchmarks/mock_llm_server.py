@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible mock of the DeepSeek chat completions API
+
+Answers POST .../chat/completions with a schema-valid JSON body for each of
+the coaching prompts (goal decomposition, habit stacking, progression plan,
+adjustment), picked by looking at the system prompt. Latency, error and
+malformed-output rates are configurable so the app can be load-tested
+without paying for real calls. Point the app at it with:
+
+    python benchmarks/mock_llm_server.py --port 8900 --latency-ms 800 --latency-dist lognormal
+    DEEPSEEK_API_KEY=mock DEEPSEEK_BASE_URL=http://127.0.0.1:8900 python app.py
+
+GET /stats returns request counts per prompt kind and injected failures.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal')
+
+def sample_latency(dist, median_ms, spread):
+    """Draw one response delay in seconds
+
+    spread is the lognormal sigma, or the +/- fraction of the median for uniform.
+    """
+    if dist == 'fixed' or median_ms <= 0:
+        delay = median_ms
+    elif dist == 'uniform':
+        delay = random.uniform(median_ms * (1 - spread), median_ms * (1 + spread))
+    elif dist == 'exponential':
+        delay = random.expovariate(1 / median_ms)
+    else:  # lognormal: a long right tail like the real API
+        delay = random.lognormvariate(0, spread) * median_ms
+    return max(delay, 0) / 1000
+
+def quoted_items(text):
+    """Pull the quoted strings out of a user prompt (goal, habit names...)"""
+    return re.findall(r'"([^"\n]+)"|\'([^\'\n]+)\'', text)
+
+def first_quoted(text, default):
+    for double, single in quoted_items(text):
+        return double or single
+    return default
+
+def build_content(system_prompt, user_prompt):
+    """Return (kind, content dict) matching the schema the system prompt asks for"""
+    if 'habit_stacks' in system_prompt:
+        # The user prompt lists current habits then desired habits as JSON arrays
+        arrays = re.findall(r'\[[^\]]*\]', user_prompt)
+        try:
+            current, desired = json.loads(arrays[0]), json.loads(arrays[1])
+        except (IndexError, ValueError):
+            current, desired = ['Make my morning coffee'], ['Read one page of a book']
+        stacks = [{
+            'anchor_habit': current[i % len(current)],
+            'new_habit': new_habit,
+            'stack_formula': f"After I {current[i % len(current)].lower()}, I will {new_habit.lower()}.",
+            'reasoning': 'Both happen in the same place at the same time of day.'
+        } for i, new_habit in enumerate(desired)] if current else []
+        return 'stacking', {'habit_stacks': stacks}
+
+    if 'progression_plan' in system_prompt:
+        habit = first_quoted(user_prompt, 'the habit')
+        plan = [{
+            'week': week,
+            'focus': focus,
+            'action': f"{action} ({habit})"
+        } for week, (focus, action) in enumerate([
+            ('Show up', 'Spend two minutes getting started'),
+            ('Build consistency', 'Do five minutes every day'),
+            ('Extend', 'Do ten minutes every day'),
+            ('Own it', 'Do the full session every day')
+        ], start=1)]
+        content = {'progression_plan': plan}
+        if 'identity_shift' in system_prompt:
+            content['identity_shift'] = f"You are becoming someone who makes time for {habit}."
+        return 'progression', content
+
+    if 'atomic_habits' in system_prompt:
+        goal = first_quoted(user_prompt, 'your goal')
+        suffix = uuid.uuid4().hex[:6]
+        habits = [{
+            'habit_name': f"{name} for {goal} ({suffix})",
+            'two_minute_version': two_minute,
+            'rationale': 'A tiny daily action that reinforces the new identity.'
+        } for name, two_minute in [
+            ('Practice daily', 'Set up your materials'),
+            ('Review progress weekly', 'Open your notes'),
+            ('Learn one new thing', 'Read one paragraph')
+        ][:random.randint(2, 3)]]
+        return 'decomposition', {
+            'identity_shift': f"You are becoming someone who works on {goal} every day.",
+            'atomic_habits': habits
+        }
+
+    if 'observation' in system_prompt:
+        return 'adjustment', {
+            'observation': "You've kept showing up even on hard days, and that counts.",
+            'suggestions': [
+                'Shrink the habit to a two-minute version for the next week.',
+                'Put everything you need in plain sight the night before.',
+                'Stack it right after something you already do every day.'
+            ][:random.randint(2, 3)]
+        }
+
+    return 'unknown', {}
+
+def completion_body(model, content_text):
+    return {
+        'id': f"chatcmpl-{uuid.uuid4().hex}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'finish_reason': 'stop',
+            'message': {'role': 'assistant', 'content': content_text}
+        }],
+        'usage': {
+            'prompt_tokens': 350,
+            'completion_tokens': len(content_text) // 4,
+            'total_tokens': 350 + len(content_text) // 4
+        }
+    }
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    # Set by serve(): the parsed command-line options and shared counters
+    options = None
+    stats = None
+    stats_lock = threading.Lock()
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.options.verbose:
+            super().log_message(format, *args)
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            with self.stats_lock:
+                self.send_json(200, dict(self.stats))
+        else:
+            self.send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self.send_json(400, {'error': {'message': 'Invalid JSON body', 'type': 'invalid_request_error'}})
+            return
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_json(404, {'error': {'message': 'Not found'}})
+            return
+
+        messages = payload.get('messages') or []
+        system_prompt = next((m.get('content', '') for m in messages if m.get('role') == 'system'), '')
+        user_prompt = next((m.get('content', '') for m in messages if m.get('role') == 'user'), '')
+        kind, content = build_content(system_prompt, user_prompt)
+        self.count('requests')
+        self.count(kind)
+
+        time.sleep(sample_latency(self.options.latency_dist, self.options.latency_ms, self.options.latency_spread))
+
+        roll = random.random()
+        if roll < self.options.error_rate:
+            self.count('errors')
+            status = random.choice((429, 500, 503))
+            self.send_json(status, {'error': {'message': 'Injected failure', 'type': 'server_error', 'code': status}})
+            return
+
+        content_text = json.dumps(content)
+        if roll < self.options.error_rate + self.options.malformed_rate:
+            # Truncated output, like a response that ran into max_tokens
+            self.count('malformed')
+            content_text = content_text[:len(content_text) // 2]
+
+        self.send_json(200, completion_body(payload.get('model', 'deepseek-chat'), content_text))
+
+def serve(options):
+    MockLLMHandler.options = options
+    MockLLMHandler.stats = {}
+    server = ThreadingHTTPServer((options.host, options.port), MockLLMHandler)
+    server.daemon_threads = True
+    print(f"🤖 Mock LLM listening on http://{options.host}:{options.port} "
+          f"({options.latency_dist} latency, median {options.latency_ms}ms, "
+          f"error rate {options.error_rate:.0%}, malformed rate {options.malformed_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency-ms', type=float, default=800, help='median response delay')
+    parser.add_argument('--latency-dist', choices=LATENCY_DISTRIBUTIONS, default='lognormal')
+    parser.add_argument('--latency-spread', type=float, default=0.6,
+                        help='lognormal sigma, or +/- fraction of the median for uniform')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 429/500/503')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='fraction of requests with truncated JSON content')
+    parser.add_argument('--seed', type=int, help='seed the random generator for repeatable runs')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    options = parse_args()
+    if options.seed is not None:
+        random.seed(options.seed)
+    serve(options)
@@ -0,0 +1,51 @@
+"""
+Shared fixtures for the app.test_client() behaviour tests
+app.py configures itself on import, so the environment is set here first: a
+throwaway SQLite database and a dummy API key (no test reaches a real LLM).
+test_database.py and test_endpoints.py are scripts for a running server and
+are not collected.
+"""
+import itertools
+import os
+import tempfile
+
+import pytest
+
+_db_dir = tempfile.mkdtemp(prefix='habitbuilder-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.setdefault('DEEPSEEK_API_KEY', 'test-key')
+
+collect_ignore = ['test_database.py', 'test_endpoints.py', 'benchmarks']
+
+_usernames = itertools.count(1)
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app
+    flask_app.config['TESTING'] = True
+    return flask_app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+
+@pytest.fixture
+def user(app):
+    """A fresh user (as a dict), so tests don't see each other's habits and logs"""
+    from database_service import DatabaseService
+    with app.app_context():
+        return DatabaseService.get_or_create_user(f"test_user_{os.getpid()}_{next(_usernames)}").to_dict()
+
+@pytest.fixture
+def habit(app, user):
+    """An active habit (as a dict) belonging to `user`"""
+    from database_service import DatabaseService
+    with app.app_context():
+        return DatabaseService.create_habit_from_decomposition(user['id'], {
+            'habit_name': 'Read one page', 'two_minute_version': 'Open the book', 'rationale': 'Reading daily'
+        }).to_dict()
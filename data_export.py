@@ -0,0 +1,71 @@
+"""
+Streaming encoders for user data exports (NDJSON / CSV, optional gzip)
+Every encoder consumes an iterator of (record_type, row) pairs and yields
+chunks, so nothing is held in memory beyond the current buffer.
+"""
+import csv
+import io
+import json
+import zlib
+
+# Flush encoded output to the client once the buffer reaches this size
+CHUNK_SIZE = 64 * 1024
+
+# Union of User, Habit and HabitLog columns, prefixed by the record type
+# ('type', the same key the NDJSON records use)
+CSV_COLUMNS = [
+    'type', 'id', 'user_id', 'habit_id',
+    'username', 'email', 'main_goal', 'identity_shift',
+    'name', 'description', 'two_minute_version', 'rationale',
+    'anchor_habit', 'stack_formula', 'is_active',
+    'date', 'completed', 'notes', 'difficulty_rating',
+    'created_at', 'updated_at', 'logged_at'
+]
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+def ndjson_chunks(records):
+    """Encode records as newline-delimited JSON, one object per line"""
+    buffer = []
+    size = 0
+    for record_type, row in records:
+        line = json.dumps({'type': record_type, **row}, ensure_ascii=False) + '\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+def csv_chunks(records):
+    """Encode records as a single CSV table keyed by type"""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for record_type, row in records:
+        writer.writerow({'type': record_type, **row})
+        if out.tell() >= CHUNK_SIZE:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    if out.tell():
+        yield out.getvalue()
+
+def gzip_chunks(chunks):
+    """Gzip-compress a stream of text chunks without buffering the whole body"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def encode_export(records, fmt='ndjson', compress=False):
+    """Return a chunk generator for the requested export format"""
+    chunks = csv_chunks(records) if fmt == 'csv' else ndjson_chunks(records)
+    return gzip_chunks(chunks) if compress else chunks
@@ -2,12 +2,110 @@
 Database service layer for HabitBuilder app
 Handles all database operations and business logic
 """
-from models import db, User, Habit, HabitLog, UserSession
-from datetime import datetime, timedelta, timezone
-from sqlalchemy import func, and_, desc
+from models import (
+    db, User, Habit, HabitLog, HabitLogArchive, UserSession, IdempotencyKey, UserDataVersion,
+    DailyUserStats, HabitIntervention, LLMUsage, PrecomputedAdjustment
+)
+from datetime import datetime, date as date_type, timedelta, timezone
+from bisect import bisect_right
+from collections import defaultdict
+import heapq
+from itertools import groupby
+from sqlalchemy import func, and_, or_, desc, case, select, update, insert, inspect as sa_inspect
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import make_transient_to_detached
+from lookup_cache import LRUCache
+from habit_history import STRUGGLE_MISS_THRESHOLD, STRUGGLE_WINDOW_DAYS, month_key, set_day, clear_day, day_status, iter_days
+from replica import primary_read, replica_read, replica_router
+from live_updates import live_updates
+from search_index import search_index
+from llm_usage import percentile
+import json
+import os
+import secrets
 import uuid
 
+# Read-through cache for User/Habit rows. Entries are column snapshots so they
+# can be re-attached to any request's session without a query. The TTL bounds
+# staleness across worker processes, which don't see each other's invalidations.
+_lookup_cache = LRUCache(
+    maxsize=int(os.getenv('LOOKUP_CACHE_SIZE', 4096)),
+    ttl=float(os.getenv('LOOKUP_CACHE_TTL', 300))
+)
+
+def _snapshot(obj):
+    """Copy the column values of a loaded ORM instance"""
+    return {attr.key: getattr(obj, attr.key) for attr in sa_inspect(obj).mapper.column_attrs}
+
+def _attach(model, snapshot):
+    """Rebuild an instance from a snapshot and attach it to the session without SQL"""
+    obj = model(**snapshot)
+    make_transient_to_detached(obj)
+    return db.session.merge(obj, load=False)
+
+# Columns for the read-only projection queries (same keys as to_dict()). Rows
+# come back as plain tuples: no ORM instances, identity map or change tracking.
+HABIT_COLUMNS = (
+    Habit.id, Habit.user_id, Habit.name, Habit.description, Habit.two_minute_version,
+    Habit.rationale, Habit.anchor_habit, Habit.stack_formula, Habit.is_active,
+    Habit.created_at, Habit.updated_at
+)
+LOG_COLUMNS = (
+    HabitLog.id, HabitLog.user_id, HabitLog.habit_id, HabitLog.date, HabitLog.completed,
+    HabitLog.notes, HabitLog.difficulty_rating, HabitLog.logged_at
+)
+
+# Logs older than this many days (rounded down to a month) are moved into
+# habit_log_archive by archive_old_logs; reads before the cutoff consult both tiers
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 365))
+
+def _archive_cutoff():
+    """First day of the oldest month still kept in habit_logs"""
+    return (datetime.now().date() - timedelta(days=ARCHIVE_AFTER_DAYS)).replace(day=1)
+
+def _archived_log_dict(user_id, habit_id, day, completed):
+    """A LOG_COLUMNS-shaped dict for a day read from the archive"""
+    return {
+        'id': None, 'user_id': user_id, 'habit_id': habit_id, 'date': day, 'completed': completed,
+        'notes': None, 'difficulty_rating': None, 'logged_at': None
+    }
+
+def _merge_daily_counts(log_counts, archive_rows):
+    """Merge (user_id, date, completed, possible) rows from habit_logs with the archive
+
+    log_counts is ordered by user and date, archive_rows by user. A habit's day
+    is in exactly one of the tiers, so the counts simply add up.
+    """
+    def archived_counts():
+        for user_id, rows in groupby(archive_rows, key=lambda row: row.user_id):
+            counts = defaultdict(lambda: [0, 0])
+            for row in rows:
+                for day, completed in iter_days({month_key(row.month): row.days}):
+                    counts[day][0] += completed
+                    counts[day][1] += 1
+            for day in sorted(counts):
+                yield user_id, day, *counts[day]
+    
+    log_rows = ((user_id, day, int(completed or 0), possible) for user_id, day, completed, possible in log_counts)
+    merged = heapq.merge(log_rows, archived_counts(), key=lambda row: (row[0], row[1]))
+    for (user_id, day), rows in groupby(merged, key=lambda row: (row[0], row[1])):
+        completed = possible = 0
+        for row in rows:
+            completed += row[2]
+            possible += row[3]
+        yield user_id, day, completed, possible
+
+def _as_utc(value):
+    """Treat a naive datetime read back from the database (e.g. SQLite) as UTC"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def _as_int(value):
+    """Coerce an ID from request JSON to int, or None if it isn't one"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
 class DatabaseService:
     """Service class to handle all database operations"""
     
@@ -23,7 +121,11 @@ class DatabaseService:
     
     @staticmethod
     def create_habit_from_decomposition(user_id, habit_data):
-        """Create a habit from goal decomposition data"""
+        """Create a habit from goal decomposition data (or return the user's active habit of that name)"""
+        existing = DatabaseService.get_habit_by_name(user_id, habit_data.get('habit_name'))
+        if existing:
+            return existing  # A repeated decomposition must not duplicate habits
+        
         habit = Habit(
             user_id=user_id,
             name=habit_data.get('habit_name'),
@@ -32,12 +134,21 @@ class DatabaseService:
             rationale=habit_data.get('rationale')
         )
         db.session.add(habit)
+        db.session.flush()
+        search_index.index_habits(db.session, [habit])
+        DatabaseService._refresh_active_habits(user_id)
+        DatabaseService._bump_data_version(user_id)
         db.session.commit()
+        _lookup_cache.pop(('habit_name', _as_int(user_id), habit.name))
         return habit
     
     @staticmethod
     def create_habit_stack(user_id, stack_data):
-        """Create a habit from habit stacking data"""
+        """Create a habit from habit stacking data (or return the user's active habit of that name)"""
+        existing = DatabaseService.get_habit_by_name(user_id, stack_data.get('new_habit'))
+        if existing:
+            return existing
+        
         habit = Habit(
             user_id=user_id,
             name=stack_data.get('new_habit'),
@@ -46,44 +157,24 @@ class DatabaseService:
             rationale=stack_data.get('reasoning')
         )
         db.session.add(habit)
+        db.session.flush()
+        search_index.index_habits(db.session, [habit])
+        DatabaseService._refresh_active_habits(user_id)
+        DatabaseService._bump_data_version(user_id)
         db.session.commit()
+        _lookup_cache.pop(('habit_name', _as_int(user_id), habit.name))
         return habit
     
     @staticmethod
     def log_habit_completion(user_id, habit_id, date, completed, notes=None, difficulty_rating=None):
         """Log habit completion for a specific date"""
         try:
-            # Parse date if it's a string
-            if isinstance(date, str):
-                date = datetime.strptime(date, '%Y-%m-%d').date()
-            
-            # Check if log already exists
-            existing_log = HabitLog.query.filter_by(
-                user_id=user_id,
-                habit_id=habit_id,
-                date=date
-            ).first()
-            
-            if existing_log:
-                # Update existing log
-                existing_log.completed = completed
-                existing_log.notes = notes
-                existing_log.difficulty_rating = difficulty_rating
-                existing_log.logged_at = datetime.now(timezone.utc)
-                log = existing_log
-            else:
-                # Create new log
-                log = HabitLog(
-                    user_id=user_id,
-                    habit_id=habit_id,
-                    date=date,
-                    completed=completed,
-                    notes=notes,
-                    difficulty_rating=difficulty_rating
-                )
-                db.session.add(log)
-            
+            log = DatabaseService._apply_habit_log(
+                user_id, habit_id, date, completed, notes, difficulty_rating
+            )
+            DatabaseService._bump_data_version(user_id)
             db.session.commit()
+            live_updates.publish_log(user_id, habit_id, date)
             return log
             
         except IntegrityError:
@@ -91,6 +182,96 @@ class DatabaseService:
             return None
     
     @staticmethod
+    def log_habit_completions(entries):
+        """Apply many habit log writes in a single transaction (group commit)
+
+        entries is a list of (user_id, habit_id, date, completed, notes,
+        difficulty_rating) tuples. Returns one log dict (or None) per entry;
+        dicts rather than ORM objects because the callers live on other threads.
+        An entry that fails on its own gets the exception it raised instead.
+        """
+        try:
+            logs = [DatabaseService._apply_habit_log(*entry) for entry in entries]
+            for user_id in {entry[0] for entry in entries}:
+                DatabaseService._bump_data_version(user_id)
+            db.session.flush()
+            results = [log.to_dict() for log in logs]
+            db.session.commit()
+            for user_id, habit_id, date, *_ in entries:
+                live_updates.publish_log(user_id, habit_id, date)
+            return results
+        
+        except Exception:
+            # A concurrent writer got in first, or one entry is bad (a DataError,
+            # a date that won't parse...): retry one transaction per entry so a
+            # single failure doesn't fail the whole batch
+            db.session.rollback()
+            results = []
+            for entry in entries:
+                try:
+                    log = DatabaseService.log_habit_completion(*entry)
+                    results.append(log.to_dict() if log else None)
+                except Exception as e:
+                    db.session.rollback()
+                    results.append(e)
+            return results
+    
+    @staticmethod
+    def _apply_habit_log(user_id, habit_id, date, completed, notes=None, difficulty_rating=None):
+        """Create or update a habit log and its rollup row without committing"""
+        # Parse date if it's a string
+        if isinstance(date, str):
+            date = datetime.strptime(date, '%Y-%m-%d').date()
+        
+        # Check if log already exists
+        existing_log = HabitLog.query.filter_by(
+            user_id=user_id,
+            habit_id=habit_id,
+            date=date
+        ).first()
+        
+        previous_completed = existing_log.completed if existing_log else None
+        previous_notes = existing_log.notes if existing_log else None
+        if existing_log is None and date < _archive_cutoff():
+            previous_completed = DatabaseService._unarchive_day(user_id, habit_id, date)
+        
+        if existing_log:
+            # Update existing log
+            existing_log.completed = completed
+            existing_log.notes = notes
+            existing_log.difficulty_rating = difficulty_rating
+            existing_log.logged_at = datetime.now(timezone.utc)
+            log = existing_log
+        else:
+            # Create new log
+            log = HabitLog(
+                user_id=user_id,
+                habit_id=habit_id,
+                date=date,
+                completed=completed,
+                notes=notes,
+                difficulty_rating=difficulty_rating
+            )
+            db.session.add(log)
+        
+        if notes or (previous_notes and previous_notes != notes):
+            db.session.flush()  # A new log needs its id for the index
+            search_index.index_log(db.session, log)
+        
+        habit = DatabaseService.get_habit(user_id, habit_id)
+        if habit and habit.is_active:
+            DatabaseService._update_daily_stats(
+                user_id, date,
+                completed_delta=int(bool(completed)) - int(bool(previous_completed)),
+                possible_delta=0 if previous_completed is not None else 1
+            )
+            if not completed:
+                # Only a miss can push a habit over the struggle threshold
+                DatabaseService._check_struggle(user_id, habit_id, date)
+        return log
+    
+    @staticmethod
+    @replica_read
     def get_user_habits(user_id, active_only=True):
         """Get all habits for a user"""
         query = Habit.query.filter_by(user_id=user_id)
@@ -99,6 +280,7 @@ class DatabaseService:
         return query.order_by(Habit.created_at.desc()).all()
     
     @staticmethod
+    @replica_read
     def get_habit_progress(user_id, habit_id, days=30):
         """Get habit progress for the last N days"""
         end_date = datetime.now().date()
@@ -113,19 +295,109 @@ class DatabaseService:
             )
         ).order_by(HabitLog.date.desc()).all()
         
+        archived = DatabaseService._archived_days(user_id, habit_id, start_date, end_date)
+        if archived:
+            logs += [
+                HabitLog(**_archived_log_dict(user_id, habit_id, day, completed))
+                for day, completed in archived.items()
+            ]
+            logs.sort(key=lambda log: log.date, reverse=True)
         return logs
     
     @staticmethod
+    @replica_read
+    def list_user_habits(user_id, active_only=True):
+        """Read-only get_user_habits returning plain dicts instead of ORM objects
+
+        Dates are left as date/datetime values for the JSON provider to encode.
+        """
+        query = select(*HABIT_COLUMNS).where(Habit.user_id == user_id)
+        if active_only:
+            query = query.where(Habit.is_active == True)
+        rows = db.session.execute(query.order_by(Habit.created_at.desc()))
+        return [row._asdict() for row in rows]
+    
+    @staticmethod
+    @replica_read
+    def list_habit_progress(user_id, habit_id, days=30):
+        """Read-only get_habit_progress returning plain dicts instead of ORM objects"""
+        end_date = datetime.now().date()
+        start_date = end_date - timedelta(days=days)
+        
+        rows = db.session.execute(select(*LOG_COLUMNS).where(
+            HabitLog.user_id == user_id,
+            HabitLog.habit_id == habit_id,
+            HabitLog.date >= start_date,
+            HabitLog.date <= end_date
+        ).order_by(HabitLog.date.desc()))
+        logs = [row._asdict() for row in rows]
+        
+        archived = DatabaseService._archived_days(user_id, habit_id, start_date, end_date)
+        if archived:
+            logs += [_archived_log_dict(user_id, habit_id, day, completed) for day, completed in archived.items()]
+            logs.sort(key=lambda log: log['date'], reverse=True)
+        return logs
+
+    @staticmethod
+    @primary_read
+    def search_habits(user_id, query, page=1, per_page=20):
+        """Full-text search over a user's habits and log notes, best match first
+
+        Returns (results, has_more). Each result is a habit or a log note with
+        its habit's name, a snippet with the matched words in [brackets] and a
+        relevance score. Always reads the primary, where the index is kept,
+        even when called under @replica_read.
+        """
+        offset = (page - 1) * per_page
+        rows = search_index.search(db.session, user_id, query, per_page + 1, offset)
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if not rows:
+            return [], False
+
+        habit_ids = {row.habit_id for row in rows}
+        habits = {row.id: row for row in db.session.execute(
+            select(Habit.id, Habit.name, Habit.is_active).where(Habit.id.in_(habit_ids))
+        )}
+        log_ids = [row.doc_id // 2 for row in rows if row.doc_id % 2]
+        log_dates = dict(db.session.execute(
+            select(HabitLog.id, HabitLog.date).where(HabitLog.id.in_(log_ids))
+        ).all()) if log_ids else {}
+
+        results = []
+        for row in rows:
+            habit = habits.get(row.habit_id)
+            if habit is None:
+                continue
+            result = {
+                'type': 'log' if row.doc_id % 2 else 'habit',
+                'habit_id': row.habit_id,
+                'habit_name': habit.name,
+                'is_active': habit.is_active,
+                'snippet': row.snippet,
+                'score': round(float(row.score), 6)
+            }
+            if row.doc_id % 2:
+                result['log_id'] = row.doc_id // 2
+                result['date'] = log_dates.get(row.doc_id // 2)
+            results.append(result)
+        return results, has_more
+
+    @staticmethod
+    @replica_read
     def get_current_streak(user_id, habit_id):
         """Calculate current streak for a habit"""
         today = datetime.now().date()
         streak = 0
         
-        # Get logs in reverse chronological order
-        logs = HabitLog.query.filter_by(
-            user_id=user_id,
-            habit_id=habit_id
-        ).order_by(desc(HabitLog.date)).all()
+        # Get (date, completed) rows in reverse chronological order; the loop
+        # below stops at the first gap, so only the streak's rows are fetched
+        logs = db.session.execute(
+            select(HabitLog.date, HabitLog.completed).where(
+                HabitLog.user_id == user_id,
+                HabitLog.habit_id == habit_id
+            ).order_by(desc(HabitLog.date))
+        )
         
         # Calculate streak from most recent completed day
         current_date = today
@@ -143,23 +415,52 @@ class DatabaseService:
                     break
                 else:
                     break
+        else:
+            # Every hot row was part of the streak: it may continue into the archive
+            if current_date < _archive_cutoff():
+                archived = DatabaseService._archived_days(user_id, habit_id, date_type.min, current_date)
+                while archived.get(current_date):
+                    streak += 1
+                    current_date -= timedelta(days=1)
         
         return streak
     
     @staticmethod
+    @replica_read
     def get_success_rate(user_id, habit_id, days=30):
         """Calculate success rate for a habit over the last N days"""
-        logs = DatabaseService.get_habit_progress(user_id, habit_id, days)
-        if not logs:
+        end_date = datetime.now().date()
+        start_date = end_date - timedelta(days=days)
+        
+        completed_days, total_days = db.session.query(
+            func.sum(case((HabitLog.completed == True, 1), else_=0)),
+            func.count(HabitLog.id)
+        ).filter(
+            HabitLog.user_id == user_id,
+            HabitLog.habit_id == habit_id,
+            HabitLog.date >= start_date,
+            HabitLog.date <= end_date
+        ).one()
+        
+        archived = DatabaseService._archived_days(user_id, habit_id, start_date, end_date)
+        completed_days = (completed_days or 0) + sum(archived.values())
+        total_days += len(archived)
+        if not total_days:
             return 0.0
         
-        completed_days = sum(1 for log in logs if log.completed)
-        return (completed_days / len(logs)) * 100
+        return (completed_days / total_days) * 100
     
     @staticmethod
+    @replica_read
     def get_user_dashboard_stats(user_id):
         """Get comprehensive dashboard statistics for a user"""
-        habits = DatabaseService.get_user_habits(user_id)
+        # Only ids and names are needed, so skip hydrating Habit objects
+        habits = db.session.execute(
+            select(Habit.id, Habit.name).where(
+                Habit.user_id == user_id,
+                Habit.is_active == True
+            ).order_by(Habit.created_at.desc())
+        ).all()
         today = datetime.now().date()
         
         stats = {
@@ -170,74 +471,954 @@ class DatabaseService:
             'longest_streak': 0
         }
         
-        total_possible_today = 0
         total_completed_today = 0
         weekly_completions = 0
         weekly_possible = 0
         
+        # A streak has to include today, so only habits completed today can have one
+        completed_today = set(db.session.execute(
+            select(HabitLog.habit_id).where(
+                HabitLog.user_id == user_id,
+                HabitLog.date == today,
+                HabitLog.completed == True
+            )
+        ).scalars())
+        
         for habit in habits:
-            # Today's completion
-            today_log = HabitLog.query.filter_by(
-                user_id=user_id,
-                habit_id=habit.id,
-                date=today
-            ).first()
-            
-            total_possible_today += 1
-            if today_log and today_log.completed:
-                total_completed_today += 1
-            
             # Current streak
-            streak = DatabaseService.get_current_streak(user_id, habit.id)
+            streak = DatabaseService.get_current_streak(user_id, habit.id) if habit.id in completed_today else 0
             stats['habits_with_streaks'][habit.name] = streak
             stats['longest_streak'] = max(stats['longest_streak'], streak)
             
-            # Weekly progress
-            week_ago = today - timedelta(days=7)
-            weekly_logs = HabitLog.query.filter(
-                and_(
-                    HabitLog.user_id == user_id,
-                    HabitLog.habit_id == habit.id,
-                    HabitLog.date >= week_ago,
-                    HabitLog.date <= today
-                )
-            ).all()
-            
             weekly_possible += 7  # 7 days per habit
-            weekly_completions += sum(1 for log in weekly_logs if log.completed)
+        
+        # Today's completions and weekly progress come from the daily rollup
+        today_stats = db.session.get(DailyUserStats, (user_id, today))
+        if today_stats:
+            total_completed_today = today_stats.completed
+        
+        week_start = today - timedelta(days=6)  # The 7 days ending today, matching weekly_possible
+        weekly_completions = db.session.query(
+            func.coalesce(func.sum(DailyUserStats.completed), 0)
+        ).filter(
+            DailyUserStats.user_id == user_id,
+            DailyUserStats.date >= week_start,
+            DailyUserStats.date <= today
+        ).scalar()
         
         stats['completed_today'] = total_completed_today
         stats['weekly_progress'] = (weekly_completions / weekly_possible * 100) if weekly_possible > 0 else 0
         
         return stats
     
+    @staticmethod
+    def get_user(user_id):
+        """Get a user by ID through the lookup cache"""
+        user_id = _as_int(user_id)
+        key = ('user', user_id)
+        snapshot = _lookup_cache.get(key)
+        if snapshot is not None:
+            return _attach(User, snapshot)
+        
+        user = db.session.get(User, user_id)
+        if user:
+            _lookup_cache.set(key, _snapshot(user))
+        return user
+    
+    @staticmethod
+    def get_habit(user_id, habit_id):
+        """Get a user's habit by ID through the lookup cache"""
+        user_id, habit_id = _as_int(user_id), _as_int(habit_id)
+        if user_id is None or habit_id is None:
+            return None
+        key = ('habit', habit_id)
+        snapshot = _lookup_cache.get(key)
+        if snapshot is not None:
+            if snapshot['user_id'] != user_id:
+                return None
+            return _attach(Habit, snapshot)
+        
+        habit = db.session.get(Habit, habit_id)
+        if not habit:
+            return None
+        _lookup_cache.set(key, _snapshot(habit))
+        return habit if habit.user_id == user_id else None
+    
+    @staticmethod
+    def create_session(user_id, ttl_seconds):
+        """Start a session for a user, valid for ttl_seconds"""
+        user_session = UserSession(
+            user_id=user_id,
+            session_token=secrets.token_urlsafe(32),
+            expires_at=datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+        )
+        db.session.add(user_session)
+        db.session.commit()
+        return user_session
+    
+    @staticmethod
+    def get_session_user(session_token):
+        """(user_id, expires_at) for an active, unexpired session token, or None"""
+        row = db.session.execute(
+            select(UserSession.user_id, UserSession.expires_at).where(
+                UserSession.session_token == session_token,
+                UserSession.is_active == True
+            )
+        ).first()
+        if row is None:
+            return None
+        expires_at = _as_utc(row.expires_at)
+        if expires_at <= datetime.now(timezone.utc):
+            return None
+        return row.user_id, expires_at
+    
+    @staticmethod
+    def end_session(session_token):
+        """Deactivate a session (logout); returns the user_id, or None if it wasn't active"""
+        user_session = UserSession.query.filter_by(session_token=session_token, is_active=True).first()
+        if not user_session:
+            return None
+        user_session.is_active = False
+        db.session.commit()
+        live_updates.publish_session_end(session_token)  # Drops it from every worker's session cache
+        return user_session.user_id
+    
+    @staticmethod
+    def expire_sessions(purge_after_days=30):
+        """Deactivate every session past its expiry, and delete ones expired long ago
+
+        Two set-based statements on the (is_active, expires_at) index, however
+        many sessions there are. Returns (expired, purged) counts.
+        """
+        now = datetime.now(timezone.utc)
+        expired = UserSession.query.filter(
+            UserSession.is_active == True,
+            UserSession.expires_at <= now
+        ).update({UserSession.is_active: False}, synchronize_session=False)
+        purged = UserSession.query.filter(
+            UserSession.is_active == False,
+            UserSession.expires_at <= now - timedelta(days=purge_after_days)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return expired, purged
+    
+    @staticmethod
+    def claim_idempotency_key(user_id, endpoint, key, request_hash, ttl_seconds, stale_after_seconds):
+        """Reserve an Idempotency-Key for a request, or report what became of its earlier use
+
+        Returns (outcome, record dict) where outcome is 'claimed' (run the
+        request), 'replay' (send the stored response), 'in_progress' or
+        'mismatch' (the key was used with a different body). Expired keys, and
+        pending ones older than stale_after_seconds (their request died), are
+        claimed afresh.
+        """
+        now = datetime.now(timezone.utc)
+        for _ in range(2):
+            record = IdempotencyKey.query.filter_by(user_id=user_id, endpoint=endpoint, key=key).first()
+            if record is not None:
+                stale = record.status == 'pending' and _as_utc(record.created_at) <= now - timedelta(seconds=stale_after_seconds)
+                if _as_utc(record.expires_at) > now and not stale:
+                    if record.request_hash != request_hash:
+                        return 'mismatch', record.to_dict()
+                    return ('replay' if record.status == 'done' else 'in_progress'), record.to_dict()
+                db.session.delete(record)
+                db.session.flush()
+            
+            record = IdempotencyKey(
+                user_id=user_id, endpoint=endpoint, key=key, request_hash=request_hash,
+                status='pending', created_at=now, expires_at=now + timedelta(seconds=ttl_seconds)
+            )
+            db.session.add(record)
+            try:
+                db.session.commit()
+                return 'claimed', record.to_dict()
+            except IntegrityError:
+                # A concurrent retry claimed it first; report on its claim instead
+                db.session.rollback()
+        return 'in_progress', None
+    
+    @staticmethod
+    def complete_idempotency_key(record_id, status_code, body, mimetype):
+        """Store the response for a claimed key so retries replay it"""
+        IdempotencyKey.query.filter_by(id=record_id).update({
+            IdempotencyKey.status: 'done',
+            IdempotencyKey.response_status: status_code,
+            IdempotencyKey.response_body: body,
+            IdempotencyKey.mimetype: mimetype
+        }, synchronize_session=False)
+        db.session.commit()
+    
+    @staticmethod
+    def release_idempotency_key(record_id):
+        """Drop a claim whose request failed, so a retry runs it again"""
+        IdempotencyKey.query.filter_by(id=record_id).delete(synchronize_session=False)
+        db.session.commit()
+    
+    @staticmethod
+    def purge_idempotency_keys():
+        """Delete every expired key in one statement; returns how many"""
+        purged = IdempotencyKey.query.filter(
+            IdempotencyKey.expires_at <= datetime.now(timezone.utc)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return purged
+    
+    @staticmethod
+    def record_llm_usage(rows):
+        """Bulk-insert a batch of LLM call rows (dicts of LLMUsage columns)"""
+        if rows:
+            db.session.execute(insert(LLMUsage), rows)
+            db.session.commit()
+    
+    @staticmethod
+    def llm_usage_summary(since, batch_size=5000):
+        """Per-feature and per-model call counts, token totals, cache and parse rates and latency percentiles since `since`"""
+        groups = defaultdict(lambda: {
+            'calls': 0, 'errors': 0, 'parsed': 0, 'parse_failures': 0, 'cache_hits': 0,
+            'prompt_tokens': 0, 'completion_tokens': 0, 'cache_hit_tokens': 0, 'latencies': []
+        })
+        query = db.session.query(
+            LLMUsage.feature, LLMUsage.model, LLMUsage.prompt_tokens, LLMUsage.completion_tokens,
+            LLMUsage.cache_hit_tokens, LLMUsage.cache_hit, LLMUsage.latency_ms, LLMUsage.parse_ok, LLMUsage.error
+        ).filter(LLMUsage.created_at >= since).execution_options(yield_per=batch_size)
+        for row in query:
+            for group in (groups[('feature', row.feature)], groups[('model', row.model)]):
+                group['calls'] += 1
+                group['errors'] += row.error is not None
+                group['parsed'] += row.parse_ok is True
+                group['parse_failures'] += row.parse_ok is False
+                group['cache_hits'] += bool(row.cache_hit)
+                group['prompt_tokens'] += row.prompt_tokens or 0
+                group['completion_tokens'] += row.completion_tokens or 0
+                group['cache_hit_tokens'] += row.cache_hit_tokens or 0
+                group['latencies'].append(row.latency_ms)
+        
+        summary = {'since': since.isoformat(), 'by_feature': {}, 'by_model': {}}
+        for (kind, name), group in groups.items():
+            latencies = sorted(group.pop('latencies'))
+            calls = group['calls']
+            parse_attempts = group['parsed'] + group['parse_failures']
+            summary['by_' + kind][name or 'unknown'] = {
+                **group,
+                'error_rate': round(group['errors'] / calls, 4),
+                'parse_failure_rate': round(group['parse_failures'] / parse_attempts, 4) if parse_attempts else None,
+                'cache_hit_rate': round(group['cache_hits'] / calls, 4),
+                'latency_ms': {
+                    'mean': round(sum(latencies) / calls, 1),
+                    'p50': percentile(latencies, 50),
+                    'p95': percentile(latencies, 95),
+                    'p99': percentile(latencies, 99),
+                    'max': latencies[-1]
+                }
+            }
+        return summary
+    
     @staticmethod
     def update_user_goal(user_id, main_goal, identity_shift=None):
         """Update user's main goal and identity shift"""
-        user = User.query.get(user_id)
+        user = DatabaseService.get_user(user_id)
         if user:
             user.main_goal = main_goal
             if identity_shift:
                 user.identity_shift = identity_shift
             user.updated_at = datetime.now(timezone.utc)
+            DatabaseService._bump_data_version(user_id)
             db.session.commit()
+            _lookup_cache.pop(('user', _as_int(user_id)))
         return user
     
     @staticmethod
     def deactivate_habit(user_id, habit_id):
         """Deactivate a habit instead of deleting it"""
-        habit = Habit.query.filter_by(user_id=user_id, id=habit_id).first()
+        habit = DatabaseService.get_habit(user_id, habit_id)
         if habit:
+            was_active = habit.is_active
             habit.is_active = False
             habit.updated_at = datetime.now(timezone.utc)
+            if was_active:
+                started_on = habit.created_at.date() if habit.created_at else date_type.min
+                DatabaseService._remove_habit_from_daily_stats(user_id, habit.id, started_on)
+            DatabaseService._refresh_active_habits(user_id)
+            DatabaseService._bump_data_version(user_id)
             db.session.commit()
+            _lookup_cache.pop(('habit', _as_int(habit_id)))
+            _lookup_cache.pop(('habit_name', _as_int(user_id), habit.name))
         return habit
     
+    @staticmethod
+    @replica_read
+    def get_daily_trend(user_id, days=30):
+        """Daily completion stats for the last N days, read from the rollup
+
+        Days without any logs are filled in with zero completions and the
+        most recent known active-habit count.
+        """
+        end_date = datetime.now().date()
+        start_date = end_date - timedelta(days=days - 1)
+        
+        rows = {row.date: row for row in DailyUserStats.query.filter(
+            DailyUserStats.user_id == user_id,
+            DailyUserStats.date >= start_date,
+            DailyUserStats.date <= end_date
+        )}
+        previous = DailyUserStats.query.filter(
+            DailyUserStats.user_id == user_id,
+            DailyUserStats.date < start_date
+        ).order_by(DailyUserStats.date.desc()).first()
+        
+        active_habits = previous.active_habits if previous else 0
+        trend = []
+        day = start_date
+        while day <= end_date:
+            row = rows.get(day)
+            if row:
+                active_habits = row.active_habits
+                trend.append(row.to_dict())
+            else:
+                trend.append(DailyUserStats(
+                    user_id=user_id, date=day, completed=0, possible=0, active_habits=active_habits
+                ).to_dict())
+            day += timedelta(days=1)
+        return trend
+    
+    @staticmethod
+    def rebuild_daily_stats(user_id=None, batch_size=1000, user_ids=None):
+        """Recompute the daily rollup from habit_logs and the archive (backfill / repair job)
+
+        Rebuilds every user when neither user_id nor user_ids is given. Returns
+        the number of rows written.
+        """
+        first_archived = db.session.query(
+            HabitLogArchive.habit_id, func.min(HabitLogArchive.month).label('month')
+        ).group_by(HabitLogArchive.habit_id).subquery()
+        first_archive_row = db.aliased(HabitLogArchive)
+        
+        delete_query = DailyUserStats.query
+        habits_query = db.session.query(
+            Habit.user_id, Habit.created_at, func.min(HabitLog.date), first_archive_row.month, first_archive_row.days
+        ).outerjoin(HabitLog, HabitLog.habit_id == Habit.id).outerjoin(
+            first_archived, first_archived.c.habit_id == Habit.id
+        ).outerjoin(first_archive_row, and_(
+            first_archive_row.habit_id == Habit.id, first_archive_row.month == first_archived.c.month
+        )).filter(
+            Habit.is_active == True
+        ).group_by(Habit.id, Habit.user_id, Habit.created_at, first_archive_row.month, first_archive_row.days)
+        logs_query = db.session.query(
+            HabitLog.user_id,
+            HabitLog.date,
+            func.sum(case((HabitLog.completed == True, 1), else_=0)),
+            func.count(HabitLog.id)
+        ).join(Habit, Habit.id == HabitLog.habit_id).filter(Habit.is_active == True)
+        archive_query = db.session.query(
+            HabitLogArchive.user_id, HabitLogArchive.habit_id, HabitLogArchive.month, HabitLogArchive.days
+        ).join(Habit, Habit.id == HabitLogArchive.habit_id).filter(Habit.is_active == True)
+        if user_id is not None:
+            delete_query = delete_query.filter(DailyUserStats.user_id == user_id)
+            habits_query = habits_query.filter(Habit.user_id == user_id)
+            logs_query = logs_query.filter(HabitLog.user_id == user_id)
+            archive_query = archive_query.filter(HabitLogArchive.user_id == user_id)
+        if user_ids is not None:
+            delete_query = delete_query.filter(DailyUserStats.user_id.in_(user_ids))
+            habits_query = habits_query.filter(Habit.user_id.in_(user_ids))
+            logs_query = logs_query.filter(HabitLog.user_id.in_(user_ids))
+            archive_query = archive_query.filter(HabitLogArchive.user_id.in_(user_ids))
+        
+        # Start dates of active habits, so each day gets the count active at the time.
+        # A habit starts at its creation or its first log, whichever is earlier.
+        started = {}
+        for habit_user_id, created_at, first_log, archive_month, archive_days in habits_query:
+            start = created_at.date() if created_at else date_type.min
+            if first_log and first_log < start:
+                start = first_log
+            if archive_month:
+                first_archived_day = next(iter_days({month_key(archive_month): archive_days}), (None,))[0]
+                if first_archived_day and first_archived_day < start:
+                    start = first_archived_day
+            started.setdefault(habit_user_id, []).append(start)
+        for dates in started.values():
+            dates.sort()
+        
+        # Users whose rollup rows change, so their ETags do too
+        touched = {row[0] for row in delete_query.with_entities(DailyUserStats.user_id).distinct()}
+        delete_query.delete(synchronize_session=False)
+        
+        written = 0
+        batch = []
+        grouped = logs_query.group_by(HabitLog.user_id, HabitLog.date).order_by(HabitLog.user_id, HabitLog.date)
+        archived = archive_query.order_by(HabitLogArchive.user_id).yield_per(batch_size)
+        for row_user_id, day, completed, possible in _merge_daily_counts(grouped.yield_per(batch_size), archived):
+            batch.append({
+                'user_id': row_user_id,
+                'date': day,
+                'completed': int(completed or 0),
+                'possible': possible,
+                'active_habits': bisect_right(started.get(row_user_id, []), day)
+            })
+            touched.add(row_user_id)
+            if len(batch) >= batch_size:
+                db.session.execute(DailyUserStats.__table__.insert(), batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            db.session.execute(DailyUserStats.__table__.insert(), batch)
+            written += len(batch)
+        
+        DatabaseService._bump_data_versions(touched, batch_size)
+        db.session.commit()
+        return written
+    
+    @staticmethod
+    def archive_old_logs(habit_batch_size=500, delete_batch_size=5000):
+        """Move habit_logs rows older than the archive horizon into habit_log_archive
+
+        Each habit's old logs become one row per month holding a completion
+        bitmap and the difficulty total, so habit_logs and its indexes only keep
+        the last ARCHIVE_AFTER_DAYS or so. Logs with notes stay in habit_logs,
+        as the archive has nowhere to keep them. Archived months newer than the
+        horizon (after ARCHIVE_AFTER_DAYS was raised) are moved back first.
+        Commits once per batch of habits and returns the counts moved.
+        """
+        cutoff = _archive_cutoff()
+        moved = {'logs_archived': 0, 'archive_rows': 0, 'logs_restored': DatabaseService._restore_archive(cutoff)}
+        without_notes = or_(HabitLog.notes.is_(None), HabitLog.notes == '')
+        
+        habit_ids = db.session.execute(
+            select(HabitLog.habit_id).where(HabitLog.date < cutoff, without_notes).distinct()
+        ).scalars().all()
+        for start in range(0, len(habit_ids), habit_batch_size):
+            chunk = habit_ids[start:start + habit_batch_size]
+            logs = db.session.execute(
+                select(
+                    HabitLog.id, HabitLog.user_id, HabitLog.habit_id, HabitLog.date,
+                    HabitLog.completed, HabitLog.difficulty_rating
+                ).where(
+                    HabitLog.habit_id.in_(chunk), HabitLog.date < cutoff, without_notes
+                )
+            ).all()
+            existing = {
+                (row.habit_id, row.month): row for row in db.session.execute(
+                    select(HabitLogArchive).where(HabitLogArchive.habit_id.in_(chunk), HabitLogArchive.month < cutoff)
+                ).scalars()
+            }
+            
+            now = datetime.now(timezone.utc)
+            months = {}
+            for log in logs:
+                key = (log.habit_id, log.date.replace(day=1))
+                row = months.get(key)
+                if row is None:
+                    previous = existing.get(key)
+                    row = months[key] = {
+                        'habit_id': log.habit_id, 'month': key[1], 'user_id': log.user_id,
+                        'days': previous.days if previous else 0,
+                        'difficulty_sum': previous.difficulty_sum if previous else 0,
+                        'difficulty_count': previous.difficulty_count if previous else 0,
+                        'archived_at': now
+                    }
+                row['days'] = set_day(row['days'], log.date, bool(log.completed))
+                if log.difficulty_rating is not None:
+                    row['difficulty_sum'] += log.difficulty_rating
+                    row['difficulty_count'] += 1
+            
+            updates = [row for key, row in months.items() if key in existing]
+            inserts = [row for key, row in months.items() if key not in existing]
+            if updates:
+                db.session.execute(update(HabitLogArchive), updates)
+            if inserts:
+                db.session.execute(HabitLogArchive.__table__.insert(), inserts)
+            log_ids = [log.id for log in logs]
+            for offset in range(0, len(log_ids), delete_batch_size):
+                db.session.execute(HabitLog.__table__.delete().where(
+                    HabitLog.id.in_(log_ids[offset:offset + delete_batch_size])
+                ))
+            for user_id in {log.user_id for log in logs}:
+                DatabaseService._bump_data_version(user_id)  # Archived days lose their log ids and ratings
+            db.session.commit()
+            moved['logs_archived'] += len(logs)
+            moved['archive_rows'] += len(months)
+        return moved
+    
+    @staticmethod
+    def _restore_archive(cutoff):
+        """Move archived months on or after cutoff back into habit_logs (without ratings)"""
+        rows = HabitLogArchive.query.filter(HabitLogArchive.month >= cutoff).all()
+        if not rows:
+            return 0
+        now = datetime.now(timezone.utc)
+        logs = [
+            {'user_id': row.user_id, 'habit_id': row.habit_id, 'date': day, 'completed': completed, 'logged_at': now}
+            for row in rows
+            for day, completed in iter_days({month_key(row.month): row.days})
+        ]
+        if logs:
+            db.session.execute(HabitLog.__table__.insert(), logs)
+        for row in rows:
+            db.session.delete(row)
+        for user_id in {row.user_id for row in rows}:
+            DatabaseService._bump_data_version(user_id)
+        db.session.commit()
+        return len(logs)
+    
+    @staticmethod
+    def _unarchive_day(user_id, habit_id, day):
+        """Clear a re-logged day from the archive, so it lives only in habit_logs
+
+        Returns its archived completion (None if it wasn't archived). The
+        month's difficulty total keeps the old rating.
+        """
+        row = db.session.get(HabitLogArchive, (habit_id, day.replace(day=1)))
+        if row is None or row.user_id != user_id:
+            return None
+        status = day_status({month_key(day): row.days}, day)
+        if status is not None:
+            row.days = clear_day(row.days, day)
+            if not row.days:
+                db.session.delete(row)
+        return status
+    
+    @staticmethod
+    def _archived_days(user_id, habit_id, start_date, end_date):
+        """{date: completed} for a habit's archived days between start_date and end_date"""
+        if start_date >= _archive_cutoff():
+            return {}  # Nothing this recent is archived
+        rows = db.session.execute(
+            select(HabitLogArchive.month, HabitLogArchive.days).where(
+                HabitLogArchive.habit_id == habit_id,
+                HabitLogArchive.user_id == user_id,
+                HabitLogArchive.month >= start_date.replace(day=1),
+                HabitLogArchive.month <= end_date
+            )
+        )
+        months = {month_key(month): days for month, days in rows}
+        return {day: completed for day, completed in iter_days(months) if start_date <= day <= end_date}
+    
+    @staticmethod
+    def _update_daily_stats(user_id, date, completed_delta=0, possible_delta=0):
+        """Apply a log change to the user's rollup row for that date"""
+        query = DailyUserStats.query.filter_by(user_id=user_id, date=date)
+        changes = {
+            DailyUserStats.completed: DailyUserStats.completed + completed_delta,
+            DailyUserStats.possible: DailyUserStats.possible + possible_delta
+        }
+        if query.update(changes, synchronize_session=False):
+            return
+        row = DailyUserStats(
+            user_id=user_id,
+            date=date,
+            completed=max(completed_delta, 0),
+            possible=max(possible_delta, 0),
+            active_habits=Habit.query.filter_by(user_id=user_id, is_active=True).count()
+        )
+        try:
+            with db.session.begin_nested():
+                db.session.add(row)
+        except IntegrityError:
+            # Another request created today's row first
+            query.update(changes, synchronize_session=False)
+    
+    @staticmethod
+    def _refresh_active_habits(user_id):
+        """Store the current active-habit count on today's rollup row, if it exists"""
+        active = Habit.query.filter_by(user_id=user_id, is_active=True).count()
+        DailyUserStats.query.filter_by(
+            user_id=user_id, date=datetime.now().date()
+        ).update({DailyUserStats.active_habits: active}, synchronize_session=False)
+    
+    @staticmethod
+    def _remove_habit_from_daily_stats(user_id, habit_id, started_on):
+        """Subtract a deactivated habit's logs and active days from the rollup"""
+        per_day = db.session.query(
+            HabitLog.date,
+            func.sum(case((HabitLog.completed == True, 1), else_=0)),
+            func.count(HabitLog.id)
+        ).filter(
+            HabitLog.user_id == user_id,
+            HabitLog.habit_id == habit_id
+        ).group_by(HabitLog.date)
+        first_log = None
+        for day, completed, possible in per_day.all():
+            first_log = day if first_log is None else min(first_log, day)
+            DailyUserStats.query.filter_by(user_id=user_id, date=day).update({
+                DailyUserStats.completed: DailyUserStats.completed - int(completed or 0),
+                DailyUserStats.possible: DailyUserStats.possible - possible
+            }, synchronize_session=False)
+        
+        if first_log and first_log < started_on:
+            started_on = first_log
+        DailyUserStats.query.filter(
+            DailyUserStats.user_id == user_id,
+            DailyUserStats.date >= started_on,
+            DailyUserStats.active_habits > 0
+        ).update({DailyUserStats.active_habits: DailyUserStats.active_habits - 1}, synchronize_session=False)
+    
+    @staticmethod
+    def get_live_delta(user_id, habit_id):
+        """What a live dashboard needs after a log: the habit's streak and today's counts"""
+        today = db.session.execute(
+            select(DailyUserStats.completed, DailyUserStats.possible).where(
+                DailyUserStats.user_id == user_id,
+                DailyUserStats.date == datetime.now().date()
+            )
+        ).first()
+        return {
+            'habit_id': habit_id,
+            'current_streak': DatabaseService.get_current_streak(user_id, habit_id),
+            'today_completed': today.completed if today else 0,
+            'today_possible': today.possible if today else 0,
+            'data_version': DatabaseService.get_data_version(user_id)
+        }
+    
+    @staticmethod
+    def get_data_version(user_id):
+        """Current data version for a user (0 if they have never been written to)"""
+        version = db.session.query(UserDataVersion.version).filter_by(user_id=user_id).scalar()
+        return version or 0
+    
+    @staticmethod
+    def _bump_data_version(user_id):
+        """Increment the user's data version inside the caller's transaction"""
+        replica_router.mark_write(_as_int(user_id))  # Read-your-writes: their next reads go to the primary
+        bump = {UserDataVersion.version: UserDataVersion.version + 1}
+        query = UserDataVersion.query.filter_by(user_id=user_id)
+        if query.update(bump, synchronize_session=False):
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.add(UserDataVersion(user_id=user_id, version=1))
+        except IntegrityError:
+            # Another request created the row first
+            query.update(bump, synchronize_session=False)
+    
+    @staticmethod
+    def _bump_data_versions(user_ids, batch_size=1000):
+        """_bump_data_version for many users at once (one UPDATE and INSERT per batch)"""
+        user_ids = sorted({_as_int(user_id) for user_id in user_ids})
+        for start in range(0, len(user_ids), batch_size):
+            chunk = user_ids[start:start + batch_size]
+            for user_id in chunk:
+                replica_router.mark_write(user_id)
+            existing = set(db.session.execute(
+                select(UserDataVersion.user_id).where(UserDataVersion.user_id.in_(chunk))
+            ).scalars())
+            if existing:
+                db.session.execute(
+                    update(UserDataVersion).where(UserDataVersion.user_id.in_(existing))
+                    .values(version=UserDataVersion.version + 1, updated_at=datetime.now(timezone.utc))
+                )
+            missing = [user_id for user_id in chunk if user_id not in existing]
+            if missing:
+                db.session.execute(insert(UserDataVersion), [{'user_id': user_id, 'version': 1} for user_id in missing])
+    
+    @staticmethod
+    def cache_stats():
+        """Hit-rate counters for the User/Habit lookup cache"""
+        return _lookup_cache.stats()
+    
+    @staticmethod
+    def iter_user_export(user_id, batch_size=500):
+        """Yield (record_type, dict) pairs for a user's profile, habits and logs
+
+        Habits and logs are read through a server-side cursor (yield_per), so
+        memory use stays flat no matter how long the user's history is.
+        """
+        user = DatabaseService.get_user(user_id)
+        if not user:
+            return
+        yield 'user', user.to_dict()
+        
+        habits = Habit.query.filter_by(user_id=user_id).order_by(Habit.id).yield_per(batch_size)
+        for habit in habits:
+            yield 'habit', habit.to_dict()
+        
+        # Archived days are older than every hot log except ones kept for their notes
+        archived = HabitLogArchive.query.filter_by(user_id=user_id).order_by(
+            HabitLogArchive.month
+        ).yield_per(batch_size)
+        for month, rows in groupby(archived, key=lambda row: row.month):
+            days = sorted(
+                (day, row.habit_id, completed)
+                for row in rows for day, completed in iter_days({month_key(month): row.days})
+            )
+            for day, habit_id, completed in days:
+                log = _archived_log_dict(user_id, habit_id, day, completed)
+                log['date'] = day.isoformat()
+                yield 'log', log
+        
+        logs = HabitLog.query.filter_by(user_id=user_id).order_by(
+            HabitLog.date, HabitLog.id
+        ).yield_per(batch_size)
+        for log in logs:
+            yield 'log', log.to_dict()
+    
     @staticmethod
     def get_habit_by_name(user_id, habit_name):
-        """Get a habit by name for a specific user"""
-        return Habit.query.filter_by(
+        """Get an active habit by name for a specific user"""
+        key = ('habit_name', _as_int(user_id), habit_name)
+        habit_id = _lookup_cache.get(key)
+        if habit_id is not None:
+            habit = DatabaseService.get_habit(user_id, habit_id)
+            if habit and habit.is_active:
+                return habit
+            _lookup_cache.pop(key)
+        
+        habit = Habit.query.filter_by(
             user_id=user_id,
             name=habit_name,
             is_active=True
         ).first()
+        if habit:
+            _lookup_cache.set(key, habit.id)
+            _lookup_cache.set(('habit', habit.id), _snapshot(habit))
+        return habit
+    
+    @staticmethod
+    def _check_struggle(user_id, habit_id, log_date):
+        """Queue the habit for an intervention if this miss took it over the threshold
+
+        Runs at log time, so the daily intervention job only sees habits that
+        changed instead of scanning every user. The miss count is a range read of
+        at most STRUGGLE_WINDOW_DAYS rows on the (user, habit, date) unique index,
+        and stays exact when old days are logged or corrected. A habit is queued
+        at most once per window.
+        """
+        today = datetime.now().date()
+        window_start = today - timedelta(days=STRUGGLE_WINDOW_DAYS - 1)
+        if not window_start <= log_date <= today:
+            return None  # Backfilled or future-dated logs don't describe current struggles
+        
+        misses = db.session.query(func.count(HabitLog.id)).filter(
+            HabitLog.user_id == user_id,
+            HabitLog.habit_id == habit_id,
+            HabitLog.date >= window_start,
+            HabitLog.date <= today,
+            HabitLog.completed == False
+        ).scalar()
+        if misses < STRUGGLE_MISS_THRESHOLD:
+            return None
+        
+        already_queued = db.session.query(HabitIntervention.id).filter(
+            HabitIntervention.user_id == user_id,
+            HabitIntervention.habit_id == habit_id,
+            HabitIntervention.window_end >= window_start
+        ).first()
+        if already_queued:
+            return None
+        
+        intervention = HabitIntervention(user_id=user_id, habit_id=habit_id, misses=misses, window_end=today)
+        db.session.add(intervention)
+        return intervention
+    
+    @staticmethod
+    def get_pending_interventions(limit=100):
+        """Oldest queued interventions across all users"""
+        return HabitIntervention.query.filter_by(status='pending').order_by(
+            HabitIntervention.id
+        ).limit(limit).all()
+    
+    @staticmethod
+    def complete_intervention(intervention_id, suggestions):
+        """Store the coach's suggestions for a queued intervention and mark it sent"""
+        intervention = db.session.get(HabitIntervention, intervention_id)
+        if not intervention:
+            return None
+        intervention.status = 'sent'
+        intervention.suggestions = json.dumps(suggestions)
+        intervention.processed_at = datetime.now(timezone.utc)
+        DatabaseService._bump_data_version(intervention.user_id)
+        db.session.commit()
+        return intervention
+    
+    @staticmethod
+    @replica_read
+    def list_user_interventions(user_id, limit=20):
+        """A user's most recent interventions, newest first"""
+        interventions = HabitIntervention.query.filter_by(user_id=user_id).order_by(
+            HabitIntervention.id.desc()
+        ).limit(limit)
+        return [intervention.to_dict() for intervention in interventions]
+    
+    @staticmethod
+    def get_recent_history(user_id, habit_id, days=STRUGGLE_WINDOW_DAYS):
+        """Per-day True / False / None (not logged) for the last N days, oldest first"""
+        today = datetime.now().date()
+        start_date = today - timedelta(days=days - 1)
+        logged = dict(db.session.execute(
+            select(HabitLog.date, HabitLog.completed).where(
+                HabitLog.user_id == user_id,
+                HabitLog.habit_id == habit_id,
+                HabitLog.date >= start_date,
+                HabitLog.date <= today
+            )
+        ).all())
+        logged = {**DatabaseService._archived_days(user_id, habit_id, start_date, today), **logged}
+        return [logged.get(start_date + timedelta(days=offset)) for offset in range(days)]
+    
+    @staticmethod
+    def find_at_risk_habits(min_misses=STRUGGLE_MISS_THRESHOLD, days=STRUGGLE_WINDOW_DAYS, limit=1000):
+        """Active habits with at least min_misses missed days in the last N days, most misses first
+
+        Returns (user_id, habit_id, habit name, misses) tuples. One grouped scan
+        of the window's logs, instead of a history read per habit.
+        """
+        today = datetime.now().date()
+        misses = func.count(HabitLog.id).label('misses')
+        return [tuple(row) for row in db.session.execute(
+            select(HabitLog.user_id, HabitLog.habit_id, Habit.name, misses)
+            .join(Habit, Habit.id == HabitLog.habit_id)
+            .where(
+                Habit.is_active == True,
+                HabitLog.completed == False,
+                HabitLog.date >= today - timedelta(days=days - 1),
+                HabitLog.date <= today
+            )
+            .group_by(HabitLog.user_id, HabitLog.habit_id, Habit.name)
+            .having(misses >= min_misses)
+            .order_by(misses.desc(), HabitLog.habit_id)
+            .limit(limit)
+        ).all()]
+    
+    @staticmethod
+    def get_adjustment_input(user_id, habit_id):
+        """(habit name, recent history) as sent to the adjustment prompt, or None if the habit isn't the user's"""
+        habit = DatabaseService.get_habit(user_id, habit_id)
+        if not habit:
+            return None
+        return habit.name, DatabaseService.get_recent_history(habit.user_id, habit.id)
+    
+    @staticmethod
+    def get_precomputed_adjustment(user_id, history_fingerprint):
+        """Stored suggestions for one of the user's habits whose history matches the fingerprint, or None"""
+        row = db.session.execute(
+            select(PrecomputedAdjustment.suggestions).where(
+                PrecomputedAdjustment.user_id == user_id,
+                PrecomputedAdjustment.history_fingerprint == history_fingerprint
+            ).limit(1)
+        ).scalar()
+        return json.loads(row) if row is not None else None
+    
+    @staticmethod
+    def get_precomputed_fingerprints(habit_ids):
+        """habit_id -> fingerprint of the stored suggestions, for the given habits"""
+        if not habit_ids:
+            return {}
+        return dict(db.session.execute(
+            select(PrecomputedAdjustment.habit_id, PrecomputedAdjustment.history_fingerprint).where(
+                PrecomputedAdjustment.habit_id.in_(habit_ids)
+            )
+        ).all())
+    
+    @staticmethod
+    def save_precomputed_adjustment(user_id, habit_id, history_fingerprint, history, misses, suggestions):
+        """Store (or replace) the habit's precomputed suggestions"""
+        values = {
+            PrecomputedAdjustment.history_fingerprint: history_fingerprint,
+            PrecomputedAdjustment.history: json.dumps(history),
+            PrecomputedAdjustment.misses: misses,
+            PrecomputedAdjustment.suggestions: json.dumps(suggestions),
+            PrecomputedAdjustment.created_at: datetime.now(timezone.utc)
+        }
+        query = PrecomputedAdjustment.query.filter_by(user_id=user_id, habit_id=habit_id)
+        if not query.update(values, synchronize_session=False):
+            row = PrecomputedAdjustment(user_id=user_id, habit_id=habit_id, **{column.key: value for column, value in values.items()})
+            try:
+                with db.session.begin_nested():
+                    db.session.add(row)
+            except IntegrityError:
+                query.update(values, synchronize_session=False)
+        db.session.commit()
+    
+    @staticmethod
+    def import_memory_chunk(records, insert_batch_size=5000):
+        """Bulk-insert users, habits and logs mapped from agent memory documents
+
+        records are dicts with 'user' (User columns), 'habits' (Habit columns)
+        and 'logs' ((habit name, date, completed) tuples). Rows that already
+        exist are left alone: users match on username, habits on (user, name)
+        and logs on (habit, date), so re-importing a chunk is a no-op. Commits
+        once and returns the number of rows inserted per table.
+        """
+        now = datetime.now(timezone.utc)
+        inserted = {'users': 0, 'habits': 0, 'logs': 0}
+        
+        usernames = {record['user']['username'] for record in records}
+        existing_users = set(db.session.execute(
+            select(User.username).where(User.username.in_(usernames))
+        ).scalars())
+        new_users = {}
+        for record in records:
+            username = record['user']['username']
+            if username not in existing_users:
+                new_users.setdefault(username, {**record['user'], 'created_at': now, 'updated_at': now})
+        if new_users:
+            db.session.execute(User.__table__.insert(), list(new_users.values()))
+            inserted['users'] = len(new_users)
+        user_ids = dict(db.session.execute(
+            select(User.username, User.id).where(User.username.in_(usernames))
+        ).all())
+        
+        def load_habit_ids():
+            return {
+                (user_id, name): habit_id for habit_id, user_id, name in db.session.execute(
+                    select(Habit.id, Habit.user_id, Habit.name).where(Habit.user_id.in_(user_ids.values()))
+                )
+            }
+        habit_ids = load_habit_ids()
+        new_habits = {}
+        for record in records:
+            user_id = user_ids[record['user']['username']]
+            for habit in record['habits']:
+                key = (user_id, habit['name'])
+                if key not in habit_ids and key not in new_habits:
+                    new_habits[key] = {
+                        **habit, 'user_id': user_id, 'is_active': True, 'created_at': now, 'updated_at': now
+                    }
+        if new_habits:
+            db.session.execute(Habit.__table__.insert(), list(new_habits.values()))
+            inserted['habits'] = len(new_habits)
+            habit_ids = load_habit_ids()
+            search_index.index_habits(db.session, [
+                {**values, 'id': habit_ids[key]} for key, values in new_habits.items()
+            ])
+        
+        existing_logs = set(db.session.execute(
+            select(HabitLog.habit_id, HabitLog.date).where(HabitLog.habit_id.in_(habit_ids.values()))
+        ).all()) if habit_ids else set()
+        if habit_ids:
+            archived = db.session.execute(
+                select(HabitLogArchive.habit_id, HabitLogArchive.month, HabitLogArchive.days).where(
+                    HabitLogArchive.habit_id.in_(habit_ids.values())
+                )
+            )
+            for habit_id, month, days in archived:
+                existing_logs.update((habit_id, day) for day, _ in iter_days({month_key(month): days}))
+        batch = []
+        touched = set()
+        for record in records:
+            user_id = user_ids[record['user']['username']]
+            for name, day, completed in record['logs']:
+                habit_id = habit_ids[(user_id, name)]
+                if (habit_id, day) in existing_logs:
+                    continue
+                existing_logs.add((habit_id, day))
+                touched.add(user_id)
+                batch.append({
+                    'user_id': user_id, 'habit_id': habit_id, 'date': day,
+                    'completed': completed, 'logged_at': now
+                })
+                if len(batch) >= insert_batch_size:
+                    db.session.execute(HabitLog.__table__.insert(), batch)
+                    inserted['logs'] += len(batch)
+                    batch = []
+        if batch:
+            db.session.execute(HabitLog.__table__.insert(), batch)
+            inserted['logs'] += len(batch)
+        
+        touched.update(user_id for user_id, _ in new_habits)
+        for user_id in touched:
+            DatabaseService._bump_data_version(user_id)
+        if touched:
+            # Commits along with the rollup, so rows and rollup land together
+            DatabaseService.rebuild_daily_stats(user_ids=touched)
+        else:
+            db.session.commit()
+        return inserted
@@ -0,0 +1,109 @@
+"""
+Group commit for habit log writes
+Concurrent /track_habit requests hand their write to a single background
+thread, which collects whatever arrives within a short window and applies it
+as one transaction. Each caller blocks until its own result is ready.
+"""
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import datetime
+import queue
+import threading
+import time
+
+from database_service import DatabaseService
+
+class CommitPending(Exception):
+    """The batch holding a write didn't commit within the caller's timeout
+
+    The write is still queued and may yet commit. Log writes are upserts on
+    (user, habit, date), so the client can safely retry.
+    """
+
+class GroupCommitter:
+    """Collects habit log writes for up to window_ms and commits them together"""
+
+    def __init__(self, app, window_ms=5, max_batch=256, timeout=30):
+        self.app = app
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+        self.largest_batch = 0
+        self.failed = 0
+        self.timed_out = 0
+        self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id, habit_id, date, completed, notes=None, difficulty_rating=None, timeout=None):
+        """Queue a log write and wait for the batch it lands in to commit
+
+        Returns the log as a dict, or None if the write conflicted; raises the
+        write's own error if it failed, or CommitPending after `timeout`
+        seconds (default: the committer's).
+        """
+        # Validate the date here so a bad request fails alone, not its whole batch
+        if isinstance(date, str):
+            date = datetime.strptime(date, '%Y-%m-%d').date()
+        future = Future()
+        self._queue.put(((user_id, habit_id, date, completed, notes, difficulty_rating), future))
+        try:
+            return future.result(self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            with self._lock:
+                self.timed_out += 1
+            raise CommitPending(f"Habit log write not committed after {self.timeout if timeout is None else timeout}s")
+
+    def stats(self):
+        """Batch counters for monitoring"""
+        with self._lock:
+            return {
+                'window_ms': self.window * 1000,
+                'max_batch': self.max_batch,
+                'batches': self.batches,
+                'writes': self.writes,
+                'largest_batch': self.largest_batch,
+                'failed': self.failed,
+                'timed_out': self.timed_out,
+                'avg_batch': round(self.writes / self.batches, 2) if self.batches else 0.0
+            }
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        entries = [entry for entry, _ in batch]
+        try:
+            with self.app.app_context():
+                results = DatabaseService.log_habit_completions(entries)
+        except Exception as e:
+            with self._lock:
+                self.failed += len(batch)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        failed = sum(isinstance(result, Exception) for result in results)
+        with self._lock:
+            self.batches += 1
+            self.writes += len(batch) - failed
+            self.failed += failed
+            self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -1,24 +1,9 @@
-from openai import OpenAI
-from dotenv import load_dotenv
-import os
-import json 
+from llm_client import create_completion, create_completion_async
+from llm_schema import parse_response
+from llm_usage import tracked
+import json
 
-load_dotenv()
-deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
-
-if not deepseek_api_key:
-    raise ValueError("DEEPSEEK_API_KEY not found in .env file or environment variables.")
-
-client = OpenAI(api_key=deepseek_api_key, base_url="https://api.deepseek.com")
-
-def goal_decomposition(goal: str) -> dict:
-    """
-    Takes a high-level goal and breaks it down into atomic habits using an AI model.
-    """
-    
-    user_prompt = f"My main goal is: '{goal}'. Please break this down for me into concrete, actionable atomic habits. Follow the instructions and formatting guidelines you have been provided."
-
-    system_prompt = """You are an expert AI habit formation coach inspired by James Clear's "Atomic Habits". Your primary role is to help users break down large goals into small, manageable, and identity-based habits.
+SYSTEM_PROMPT = """You are an expert AI habit formation coach inspired by James Clear's "Atomic Habits". Your primary role is to help users break down large goals into small, manageable, and identity-based habits.
 
 You must respond with only a valid JSON object, without any introductory text, explanations, or markdown formatting.
 
@@ -37,34 +22,44 @@ The JSON object must follow this exact structure:
 Please generate 2 to 4 relevant `atomic_habits` for the user's goal.
 """
 
-    response = client.chat.completions.create(
-        model="deepseek-chat", 
+def _completion_request(goal: str) -> dict:
+    """Builds the chat completion arguments shared by the sync and async calls."""
+    user_prompt = f"My main goal is: '{goal}'. Please break this down for me into concrete, actionable atomic habits. Follow the instructions and formatting guidelines you have been provided."
+
+    return dict(
         messages=[
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": user_prompt}
         ],
         temperature=0.7,
         max_tokens=1500,
         response_format={"type": "json_object"} # Use this if the API supports it for guaranteed JSON output
     )
-    
-    # The response content will be a JSON string, so it should be parsed.
-    try:
-        decomposed_goals = json.loads(response.choices[0].message.content)
-        return decomposed_goals
-    except json.JSONDecodeError:
-        print("Error: Failed to decode JSON from the model's response.")
-        print("Raw response:", response.choices[0].message.content)
-        return {}
+
+@tracked('goal_decomposition')
+def goal_decomposition(goal: str) -> dict:
+    """
+    Takes a high-level goal and breaks it down into atomic habits using an AI model.
+    """
+    response = create_completion(_completion_request(goal), task='decomposition')
+    return parse_response(response, 'decomposition')
+
+@tracked('goal_decomposition')
+async def goal_decomposition_async(goal: str) -> dict:
+    """
+    Async version of goal_decomposition for the async Flask views.
+    """
+    response = await create_completion_async(_completion_request(goal), task='decomposition')
+    return parse_response(response, 'decomposition')
 
 if __name__ == '__main__':
     # You can change the user_goal to test different scenarios
     user_goal = input("Enter your goal here:")
-    
+
     print(f"Breaking down the goal: '{user_goal}'\n")
-    
+
     decomposed_habits = goal_decomposition(user_goal)
-    
+
     # Pretty-print the dictionary to see the structured output
     if decomposed_habits:
         print(json.dumps(decomposed_habits, indent=2))
\ No newline at end of file
@@ -0,0 +1,94 @@
+"""
+Compact date-keyed completion history for the agent's Firestore memory
+A habit's history is a dict of month -> int, e.g. {"2026-10": 12884901891}.
+Bit (day - 1) is set when that day was logged and bit (32 + day - 1) when it
+was completed, so a whole month is one 64-bit integer field (Firestore stores
+signed 64-bit ints; the highest bit used is 62). Logging a day rewrites only
+that month's field, and window queries such as "misses in the last 7 days" are
+a mask and a popcount per month touched.
+"""
+import os
+from datetime import date, timedelta
+
+DONE_SHIFT = 32
+
+# A habit is "struggling" once it has this many misses in the trailing window.
+# Shared by HabitAgent and DatabaseService, which both check it at log time.
+STRUGGLE_MISS_THRESHOLD = int(os.getenv('STRUGGLE_MISS_THRESHOLD', 3))
+STRUGGLE_WINDOW_DAYS = int(os.getenv('STRUGGLE_WINDOW_DAYS', 7))
+
+def month_key(day: date) -> str:
+    return f"{day.year:04d}-{day.month:02d}"
+
+def _day_bit(day: date) -> int:
+    return 1 << (day.day - 1)
+
+def set_day(mask: int, day: date, completed: bool) -> int:
+    """Return the month mask with `day` logged as completed or missed"""
+    bit = _day_bit(day)
+    mask |= bit
+    if completed:
+        return mask | (bit << DONE_SHIFT)
+    return mask & ~(bit << DONE_SHIFT)
+
+def clear_day(mask: int, day: date) -> int:
+    """Return the month mask with `day` not logged"""
+    bit = _day_bit(day)
+    return mask & ~(bit | (bit << DONE_SHIFT))
+
+def day_status(months: dict, day: date):
+    """True if completed, False if logged as missed, None if not logged"""
+    mask = months.get(month_key(day), 0)
+    bit = _day_bit(day)
+    if not mask & bit:
+        return None
+    return bool(mask & (bit << DONE_SHIFT))
+
+def _days_mask(first: int, last: int) -> int:
+    """Bits for days first..last (1-based, inclusive) of a month"""
+    return ((1 << last) - 1) ^ ((1 << (first - 1)) - 1)
+
+def _month_spans(end: date, days: int):
+    """(month key, first day, last day) for each month the window touches, newest first"""
+    start = end - timedelta(days=days - 1)
+    current = end
+    while current >= start:
+        first = start.day if (current.year, current.month) == (start.year, start.month) else 1
+        yield month_key(current), first, current.day
+        current = current.replace(day=1) - timedelta(days=1)
+
+def window_counts(months: dict, end: date, days: int = 7) -> dict:
+    """Completed / missed / unlogged day counts for the `days` days ending on `end`"""
+    logged = completed = 0
+    for key, first, last in _month_spans(end, days):
+        mask = months.get(key, 0)
+        if not mask:
+            continue
+        window = _days_mask(first, last)
+        logged += bin(mask & window).count('1')
+        completed += bin((mask >> DONE_SHIFT) & window).count('1')
+    return {
+        'logged': logged,
+        'completed': completed,
+        'missed': logged - completed,
+        'unlogged': days - logged
+    }
+
+def recent_history(months: dict, end: date, days: int = 7) -> list:
+    """Per-day status (True / False / None), oldest first, for prompts and display"""
+    return [day_status(months, end - timedelta(days=offset)) for offset in range(days - 1, -1, -1)]
+
+def logged_days(months: dict) -> int:
+    return sum(bin(mask & 0xFFFFFFFF).count('1') for mask in months.values())
+
+def iter_days(months: dict):
+    """Yield (date, completed) for every logged day, in date order"""
+    for key in sorted(months):
+        mask = months[key]
+        year, month = (int(part) for part in key.split('-'))
+        logged = mask & 0xFFFFFFFF
+        while logged:
+            bit = logged & -logged
+            day = bit.bit_length()
+            yield date(year, month, day), bool(mask & (bit << DONE_SHIFT))
+            logged ^= bit
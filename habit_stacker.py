@@ -1,17 +1,10 @@
 import os
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
 
-# --- Configuration and API Client Setup ---
-load_dotenv()
-deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
-
-if not deepseek_api_key:
-    raise ValueError("DEEPSEEK_API_KEY not found in .env file or environment variables.")
-
-# Initialize the client to connect to the DeepSeek API
-client = OpenAI(api_key=deepseek_api_key, base_url="https://api.deepseek.com")
+# --- API Client Setup (shared DeepSeek client) ---
+from llm_client import create_completion, create_completion_async, DeadlineExceeded
+from llm_schema import parse_response
+from llm_usage import tracked
 
 # --- File Handling Functions ---
 
@@ -54,20 +47,8 @@ def read_habits_from_file(filepath: str = "habits.json") -> dict:
 
 # --- Core AI Habit Stacking Function ---
 
-def generate_habit_stacks(current_habits: list, desired_habits: list) -> dict:
-    """
-    Uses an LLM to stack desired habits onto current habits to maximize motivation.
-    
-    Args:
-        current_habits: A list of habits the user already performs regularly.
-        desired_habits: A list of new habits the user wants to build.
-        
-    Returns:
-        A dictionary containing the logically stacked habits.
-    """
-    
-    # The system prompt sets the persona, context, and rules for the AI.
-    system_prompt = """
+# The system prompt sets the persona, context, and rules for the AI.
+SYSTEM_PROMPT = """
 You are an expert AI habit formation coach specializing in the "Habit Stacking" technique from James Clear's "Atomic Habits." Your task is to create logical and motivating habit stacks by pairing new, desired habits with existing, current habits.
 
 The key to maximizing motivation is to link habits that are similar in context, time, and location. For example, stack a morning habit with another morning habit. Stack a habit you do in the kitchen with another kitchen-based one.
@@ -85,6 +66,8 @@ Each stack object in the list must follow this exact structure:
 Pair as many of the desired habits as you can with a suitable anchor habit.
 """
 
+def _completion_request(current_habits: list, desired_habits: list) -> dict:
+    """Builds the chat completion arguments shared by the sync and async calls."""
     # The user prompt clearly presents the data for the AI to process.
     user_prompt = f"""
 Here are my habits. Please create the habit stacks.
@@ -95,29 +78,51 @@ Current Habits (my anchors):
 Desired Habits (the new ones I want to build):
 {json.dumps(desired_habits, indent=2)}
 """
+    return dict(
+        # Using a coder model is often best for strict JSON compliance
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.7,
+        max_tokens=2000,
+        # This ensures the model output is a clean JSON object
+        response_format={"type": "json_object"}
+    )
 
+@tracked('generate_habit_stacks')
+def generate_habit_stacks(current_habits: list, desired_habits: list) -> dict:
+    """
+    Uses an LLM to stack desired habits onto current habits to maximize motivation.
+    
+    Args:
+        current_habits: A list of habits the user already performs regularly.
+        desired_habits: A list of new habits the user wants to build.
+        
+    Returns:
+        A dictionary containing the logically stacked habits.
+    """
     try:
-        response = client.chat.completions.create(
-            # Using a coder model is often best for strict JSON compliance
-            model="deepseek-coder", 
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000,
-            # This ensures the model output is a clean JSON object
-            response_format={"type": "json_object"} 
-        )
+        response = create_completion(_completion_request(current_habits, desired_habits), task='stacking')
         
-        # The response content will be a JSON string, so it should be parsed.
-        stacked_habits = json.loads(response.choices[0].message.content)
-        return stacked_habits
+        # Repaired and validated against the stacking schema ({} if unusable)
+        return parse_response(response, 'stacking')
 
-    except json.JSONDecodeError as e:
-        print(f"Error: Failed to decode JSON from the model's response. {e}")
-        print("Raw response:", response.choices[0].message.content)
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
         return {}
+
+@tracked('generate_habit_stacks')
+async def generate_habit_stacks_async(current_habits: list, desired_habits: list) -> dict:
+    """
+    Async version of generate_habit_stacks for the async Flask views.
+    """
+    try:
+        response = await create_completion_async(_completion_request(current_habits, desired_habits), task='stacking')
+        return parse_response(response, 'stacking')
+
+    except DeadlineExceeded:
+        raise  # The view answers 504 rather than an empty result
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
         return {}
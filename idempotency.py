@@ -0,0 +1,156 @@
+"""
+Idempotency-Key support for the LLM-backed POST endpoints
+A client that may retry a request sends a unique `Idempotency-Key` header. The
+first request with a key claims it in idempotency_keys and runs; its response
+is stored with the key, and any retry with the same key and body gets that
+response replayed without calling the model again. A retry that arrives while
+the first request is still running gets 409, and reusing a key with a
+different body gets 422. Failed requests (5xx, including a 504 deadline) give
+the key back, so the retry runs for real.
+
+Keys are scoped to the user and endpoint and kept for IDEMPOTENCY_TTL_SECONDS.
+"""
+import functools
+import hashlib
+import inspect
+import json
+import threading
+import time
+
+from flask import Response, current_app, jsonify, request
+
+from database_service import DatabaseService
+from session_auth import current_user_id
+
+MAX_KEY_LENGTH = 255
+
+def request_hash():
+    """sha256 of the request's JSON body, insensitive to key order and whitespace"""
+    data = request.get_json(silent=True)
+    if data is None:
+        body = request.get_data()
+    else:
+        body = json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(body).hexdigest()
+
+class Idempotency:
+    """Claims, stores and replays responses for Idempotency-Key requests"""
+
+    def __init__(self):
+        self.app = None
+        self.run_db = None
+        self._lock = threading.Lock()
+        self._counters = {'stored': 0, 'released': 0, 'replay': 0, 'in_progress': 0, 'mismatch': 0}
+
+    def init_app(self, app, run_db):
+        """run_db runs blocking database calls for async views (app.run_db)"""
+        self.app = app
+        self.run_db = run_db
+        sweep_seconds = app.config.get('IDEMPOTENCY_SWEEP_SECONDS', 3600)
+        if sweep_seconds > 0:
+            threading.Thread(target=self._sweep_loop, args=(sweep_seconds,), name='idempotency-sweeper', daemon=True).start()
+
+    def idempotent(self, view):
+        """Decorate a sync or async view so Idempotency-Key requests run at most once"""
+        endpoint = view.__name__
+
+        if inspect.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                claim = self._claim_args(endpoint)
+                if claim is None:
+                    return await view(*args, **kwargs)
+                if isinstance(claim, Response):
+                    return claim
+                outcome, record = await self.run_db(DatabaseService.claim_idempotency_key, *claim)
+                if outcome != 'claimed':
+                    return self._answer(outcome, record)
+                try:
+                    response = current_app.make_response(await view(*args, **kwargs))
+                except Exception:
+                    await self.run_db(DatabaseService.release_idempotency_key, record['id'])
+                    raise
+                finish, finish_args = self._finish_call(record, response)
+                await self.run_db(finish, *finish_args)
+                return response
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            claim = self._claim_args(endpoint)
+            if claim is None:
+                return view(*args, **kwargs)
+            if isinstance(claim, Response):
+                return claim
+            outcome, record = DatabaseService.claim_idempotency_key(*claim)
+            if outcome != 'claimed':
+                return self._answer(outcome, record)
+            try:
+                response = current_app.make_response(view(*args, **kwargs))
+            except Exception:
+                DatabaseService.release_idempotency_key(record['id'])
+                raise
+            finish, finish_args = self._finish_call(record, response)
+            finish(*finish_args)
+            return response
+        return wrapper
+
+    def _claim_args(self, endpoint):
+        """Arguments for claim_idempotency_key, None without a key, or an error response"""
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return None
+        if len(key) > MAX_KEY_LENGTH:
+            response = jsonify({"error": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters"})
+            response.status_code = 400
+            return response
+        data = request.get_json(silent=True) or {}
+        config = current_app.config
+        return (
+            current_user_id(data.get('user_id')), endpoint, key, request_hash(),
+            config['IDEMPOTENCY_TTL_SECONDS'], config['REQUEST_DEADLINE_MS'] / 1000 * 2
+        )
+
+    def _finish_call(self, record, response):
+        """(function, args) that stores a final response with its key, or releases the key after a server error"""
+        if response.status_code >= 500:
+            self._count('released')
+            return DatabaseService.release_idempotency_key, (record['id'],)
+        self._count('stored')
+        return DatabaseService.complete_idempotency_key, (
+            record['id'], response.status_code, response.get_data(as_text=True), response.mimetype
+        )
+
+    def _answer(self, outcome, record):
+        self._count(outcome)
+        if outcome == 'replay':
+            response = Response(record['response_body'], status=record['response_status'], mimetype=record['mimetype'])
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        if outcome == 'mismatch':
+            response = jsonify({"error": "This Idempotency-Key was already used with a different request body"})
+            response.status_code = 422
+            return response
+        response = jsonify({"error": "A request with this Idempotency-Key is still in progress"})
+        response.status_code = 409
+        response.headers['Retry-After'] = '1'
+        return response
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _sweep_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                with self.app.app_context():
+                    DatabaseService.purge_idempotency_keys()
+            except Exception as e:
+                print(f"⚠️  Idempotency key purge failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+idempotency = Idempotency()
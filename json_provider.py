@@ -0,0 +1,90 @@
+"""
+Fast JSON serialization and gzip compression for API responses
+OrjsonProvider replaces Flask's json.dumps-based provider when orjson is
+installed. Both providers encode dates and datetimes as ISO 8601 (the format
+the models' to_dict() methods already produce), so views can hand raw values
+to jsonify without pre-formatting them.
+"""
+from datetime import date, datetime
+import gzip
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+# Only API payloads are compressed here; static assets are precompressed
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/csv'}
+
+class ISODateJSONProvider(DefaultJSONProvider):
+    """Default provider, but dates and datetimes are encoded as ISO 8601"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (date, datetime)):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+class OrjsonProvider(ISODateJSONProvider):
+    """JSON provider backed by orjson (native datetime, dataclass and UUID support)"""
+
+    def _options(self):
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj, **kwargs):
+        return self._encode(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Skip the bytes -> str -> bytes round trip of the base implementation
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._encode(obj), mimetype=self.mimetype)
+
+    def _encode(self, obj):
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._options())
+        except TypeError:
+            # e.g. integers beyond 64 bits, which orjson refuses
+            return super().dumps(obj).encode('utf-8')
+
+def init_json(app, min_compress_size=1024, compress_level=6):
+    """Install the fastest available JSON provider and gzip for large responses
+
+    min_compress_size=0 disables compression.
+    """
+    app.json = OrjsonProvider(app) if orjson is not None else ISODateJSONProvider(app)
+
+    if min_compress_size > 0:
+        @app.after_request
+        def compress_response(response):
+            return gzip_response(response, min_compress_size, compress_level)
+
+def gzip_response(response, min_size, level):
+    """Gzip a buffered API response if the client accepts it and it is large enough"""
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        or not request.accept_encodings['gzip']
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=level))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
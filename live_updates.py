@@ -0,0 +1,310 @@
+"""
+Live dashboard updates over server-sent events
+Clients keep GET /api/users/<user_id>/events open. When DatabaseService
+commits a habit log it publishes a small event (user, habit, date); the
+worker holding that user's connections looks up the habit's new streak and
+today's counts once and pushes them to every open tab, so tabs no longer
+re-fetch the whole dashboard.
+
+Events reach the other workers through a broker:
+
+- LocalBroker (default): one process, nothing to set up.
+- SocketBroker (LIVE_UPDATES_SOCKET_DIR): each worker on the host binds a unix
+  datagram socket in the directory and publishes to all of them. Sends never
+  block; a worker that has gone away is dropped from the directory.
+
+Anything with publish(message) and start(deliver) can replace them (e.g. Redis
+pub/sub for several hosts). The broker also carries session ends, so every
+worker drops a logged-out token from its session cache.
+
+Under asgi.py a connection is an asyncio queue on the event loop, so idle
+connections cost no thread. Under plain WSGI each one holds a worker thread.
+"""
+import asyncio
+import atexit
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import defaultdict
+
+# Raw events drained by the dispatcher at once; repeats for the same habit are sent once
+DISPATCH_BATCH = 256
+
+EVENT_STREAM_HEADERS = {
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+}
+RETRY_MESSAGE = "retry: 3000\n\n"  # Reconnect after 3s if the connection drops
+KEEPALIVE_MESSAGE = ": keepalive\n\n"
+
+def format_event(name, data):
+    """One SSE message"""
+    return f"event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+class LocalBroker:
+    """Delivers events within this process only"""
+
+    def start(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, message):
+        self.deliver(message)
+
+    def stats(self):
+        return {'broker': 'local'}
+
+class SocketBroker:
+    """Fans events out to every worker on the host through unix datagram sockets in one directory"""
+
+    PEER_REFRESH_SECONDS = 1.0
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = None
+        self._peers = []
+        self._peers_at = 0.0
+        self._sender = None
+        self.send_failures = 0
+
+    def start(self, deliver):
+        self.deliver = deliver
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Left behind by an earlier process with the same pid
+        receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        receiver.bind(self.path)
+        atexit.register(self._forget, self.path)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        threading.Thread(target=self._receive_loop, args=(receiver,), name='live-updates-socket', daemon=True).start()
+
+    def _receive_loop(self, receiver):
+        while True:
+            data = receiver.recv(65536)
+            try:
+                self.deliver(json.loads(data))
+            except ValueError:
+                continue
+
+    def publish(self, message):
+        self.deliver(message)
+        data = json.dumps(message, separators=(',', ':')).encode('utf-8')
+        for peer in self._current_peers():
+            try:
+                self._sender.sendto(data, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                self._forget(peer)  # That worker exited
+            except OSError:
+                self.send_failures += 1  # Its buffer is full; never block the request
+
+    def _current_peers(self):
+        now = time.monotonic()
+        if now - self._peers_at >= self.PEER_REFRESH_SECONDS:
+            self._peers = [
+                os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                if name.endswith('.sock') and os.path.join(self.directory, name) != self.path
+            ]
+            self._peers_at = now
+        return self._peers
+
+    def _forget(self, peer):
+        try:
+            os.unlink(peer)
+        except OSError:
+            pass
+        self._peers = [path for path in self._peers if path != peer]
+
+    def stats(self):
+        return {'broker': 'socket', 'peers': len(self._peers), 'send_failures': self.send_failures}
+
+class Subscription:
+    """One open event stream: a bounded queue fed by the dispatcher thread"""
+
+    def __init__(self, user_id, max_queue, loop=None):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(max_queue) if loop is not None else queue.Queue(max_queue)
+        self.overflowed = False
+
+    def put(self, message):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._put_nowait, message)
+        else:
+            self._put_nowait(message)
+
+    def _put_nowait(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except (queue.Full, asyncio.QueueFull):
+            self.overflowed = True  # The client missed updates: tell it to re-fetch
+
+    def _next(self, message):
+        if self.overflowed:
+            self.overflowed = False
+            return format_event('resync', {})
+        return message
+
+    def get(self, timeout):
+        """Next SSE message for a WSGI stream, or None after timeout"""
+        try:
+            return self._next(self.queue.get(timeout=timeout))
+        except queue.Empty:
+            return self._next(None) if self.overflowed else None
+
+    async def get_async(self, timeout):
+        """Next SSE message for an ASGI stream, or None after timeout"""
+        try:
+            return self._next(await asyncio.wait_for(self.queue.get(), timeout))
+        except asyncio.TimeoutError:
+            return self._next(None) if self.overflowed else None
+
+class LiveUpdates:
+    """Per-user SSE subscriptions, fed by habit-log events from any worker"""
+
+    def __init__(self):
+        self.app = None
+        self.broker = LocalBroker()
+        self.heartbeat = 15.0
+        self.max_queue = 100
+        self._subscribers = defaultdict(set)
+        self._events = queue.Queue(maxsize=10000)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session_end_listeners = []
+        self._counters = {'published': 0, 'dispatched': 0, 'delivered': 0, 'dropped': 0}
+
+    def init_app(self, app):
+        self.app = app
+        self.heartbeat = app.config.get('LIVE_UPDATES_HEARTBEAT_SECONDS', 15.0)
+        self.max_queue = app.config.get('LIVE_UPDATES_QUEUE_SIZE', 100)
+        socket_dir = app.config.get('LIVE_UPDATES_SOCKET_DIR')
+        self.broker = SocketBroker(socket_dir) if socket_dir else LocalBroker()
+
+    def ensure_started(self):
+        """Start listening to the broker in this process, if not yet
+
+        Started lazily, once per process, so workers forked from a preloaded
+        app get their own.
+        """
+        if self._pid == os.getpid() or self.app is None:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self.broker.start(self._receive)
+                threading.Thread(target=self._dispatch_loop, name='live-updates', daemon=True).start()
+                self._pid = os.getpid()
+
+    def publish_log(self, user_id, habit_id, day):
+        """Called by DatabaseService after a habit log commits"""
+        if self.app is None:
+            return
+        self.ensure_started()
+        self._count('published')
+        # Request JSON may carry ids as strings; subscriptions are keyed by the int route argument
+        self.broker.publish({'user_id': int(user_id), 'habit_id': int(habit_id), 'date': str(day)})
+
+    def on_session_end(self, callback):
+        """Call callback(token) in every worker when a session ends"""
+        self._session_end_listeners.append(callback)
+
+    def publish_session_end(self, token):
+        """Called by DatabaseService after a logout commits"""
+        if self.app is None:
+            return
+        self.ensure_started()
+        self.broker.publish({'session_ended': token})
+
+    def _receive(self, message):
+        token = message.get('session_ended')
+        if token is None:
+            self._enqueue(message)
+            return
+        for callback in self._session_end_listeners:
+            callback(token)
+
+    def _enqueue(self, message):
+        try:
+            self._events.put_nowait(message)
+        except queue.Full:
+            self._count('dropped')
+
+    def subscribe(self, user_id, loop=None):
+        """Open a subscription; pass the running loop for an asyncio (ASGI) stream"""
+        self.ensure_started()
+        subscription = Subscription(user_id, self.max_queue, loop)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def stream(self, user_id):
+        """SSE body for a WSGI response; unsubscribes when the client goes away"""
+        subscription = self.subscribe(user_id)
+        try:
+            yield RETRY_MESSAGE
+            while True:
+                message = subscription.get(self.heartbeat)
+                yield message if message is not None else KEEPALIVE_MESSAGE
+        finally:
+            self.unsubscribe(subscription)
+
+    def _dispatch_loop(self):
+        while True:
+            batch = [self._events.get()]
+            while len(batch) < DISPATCH_BATCH:
+                try:
+                    batch.append(self._events.get_nowait())
+                except queue.Empty:
+                    break
+            # Only users with a connection here, and each habit once however often it was logged
+            with self._lock:
+                wanted = {(event['user_id'], event['habit_id']): event for event in batch if event['user_id'] in self._subscribers}
+            if not wanted:
+                continue
+            try:
+                with self.app.app_context():
+                    for (user_id, habit_id), event in wanted.items():
+                        self._deliver(user_id, self._delta(user_id, habit_id, event['date']))
+            except Exception as e:
+                print(f"⚠️  Live update dispatch failed: {e}")
+
+    def _delta(self, user_id, habit_id, day):
+        from database_service import DatabaseService
+        from replica import replica_router
+
+        replica_router.mark_write(user_id)  # The write may have been on another worker: read the primary
+        return format_event('habit_logged', {'date': day, **DatabaseService.get_live_delta(user_id, habit_id)})
+
+    def _deliver(self, user_id, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+        with self._lock:
+            self._counters['dispatched'] += 1
+            self._counters['delivered'] += len(subscribers)
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            counters['connections'] = sum(len(subscribers) for subscribers in self._subscribers.values())
+            counters['users'] = len(self._subscribers)
+        return {**counters, 'queued': self._events.qsize(), **self.broker.stats()}
+
+live_updates = LiveUpdates()
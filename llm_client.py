@@ -0,0 +1,459 @@
+"""
+Shared DeepSeek (OpenAI-compatible) clients for the habit coaching features
+The sync client serves scripts and the agent; async views get an AsyncOpenAI
+client bound to their running event loop.
+
+Every call goes through create_completion / create_completion_async, which
+bound it by the current deadline (set per HTTP request by the app, otherwise
+LLM_TIMEOUT seconds) and, when LLM_HEDGE_MAX_RATE > 0, hedge slow calls: if no
+answer has arrived by the model's recent p95 latency, a duplicate request is
+sent and the first valid answer wins. Hedges are paid for from a budget that
+grows by LLM_HEDGE_MAX_RATE per request, which caps the hedge rate. The losing
+attempt is left to finish so its tokens and latency reach the usage ledger.
+Transient errors are retried here rather than by the openai client, so the
+retries and their backoff fit inside the deadline too.
+
+Callers name a task rather than a model; model_router picks the model for each
+call and fails over to the task's next candidate when one errors.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+import weakref
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+from contextlib import contextmanager
+
+from openai import OpenAI, AsyncOpenAI, APITimeoutError, APIConnectionError, RateLimitError, InternalServerError
+from dotenv import load_dotenv
+
+from llm_usage import note_call, percentile
+from model_router import model_router
+
+# --- Configuration and API Client Setup ---
+load_dotenv()
+deepseek_api_key = os.getenv("DEEPSEEK_API_KEY") or os.getenv("OPENAI_API_KEY")  # agent.py accepts either
+deepseek_base_url = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+
+if not deepseek_api_key:
+    raise ValueError("DEEPSEEK_API_KEY not found in .env file or environment variables.")
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))  # seconds, for calls made outside a request
+LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", 0))  # 0 disables hedging
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))
+LLM_HEDGE_MIN_DELAY_MS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", 250))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))  # per model, for connection errors, 429s and 5xx
+LLM_RETRY_BACKOFF_MS = float(os.getenv("LLM_RETRY_BACKOFF_MS", 500))  # doubled after each retry
+
+# The openai client's own retries would each get a fresh timeout and so run
+# past the deadline; create_completion retries instead, within the deadline.
+CLIENT_OPTIONS = {'api_key': deepseek_api_key, 'base_url': deepseek_base_url, 'max_retries': 0}
+
+# Initialize the client to connect to the DeepSeek API
+client = OpenAI(**CLIENT_OPTIONS)
+
+# httpx connection pools can't be shared across event loops, so async clients
+# are cached per loop. Under the ASGI server there is a single loop (and so a
+# single pooled client); under plain WSGI Flask runs each async view in its own loop.
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_async_client() -> AsyncOpenAI:
+    """Return the AsyncOpenAI client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        async_client = AsyncOpenAI(**CLIENT_OPTIONS)
+        _async_clients[loop] = async_client
+    return async_client
+
+# --- Deadlines ---
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out before the model answered"""
+
+# Absolute time.monotonic() deadline of the current request, if any. A context
+# variable, so it follows the request into asyncio tasks spawned by the view.
+_deadline = contextvars.ContextVar('llm_deadline', default=None)
+
+def set_deadline(seconds):
+    """Give the current context `seconds` to finish its LLM calls (None clears it)"""
+    _deadline.set(None if seconds is None else time.monotonic() + seconds)
+
+@contextmanager
+def deadline(seconds):
+    """Scope a deadline to a block, e.g. for scripts and background jobs"""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining_time() -> float:
+    """Seconds left before the current deadline (LLM_TIMEOUT when none is set)"""
+    current = _deadline.get()
+    if current is None:
+        return LLM_TIMEOUT
+    return current - time.monotonic()
+
+# Worth another attempt at the same model; a timeout has used up the deadline instead
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
+def _retry_delay(retry, error):
+    """Seconds to wait before retrying after `error`, or None if it shouldn't be retried
+
+    Transient errors are retried up to LLM_MAX_RETRIES times, with doubling
+    backoff, and only while the wait leaves time for another attempt.
+    """
+    if retry >= LLM_MAX_RETRIES or not isinstance(error, RETRYABLE_ERRORS):
+        return None
+    delay = LLM_RETRY_BACKOFF_MS / 1000 * 2 ** retry
+    if remaining_time() <= delay:
+        return None
+    metrics.count('retries')
+    return delay
+
+def _time_left():
+    remaining = remaining_time()
+    if remaining <= 0:
+        raise DeadlineExceeded("Deadline exceeded before the LLM call was made")
+    return remaining
+
+# --- Hedging policy and metrics ---
+
+class LLMMetrics:
+    """Per-model latency window plus call/hedge counters, shared by all threads"""
+
+    def __init__(self, window=200, min_samples=20, max_hedge_burst=10):
+        self.window = window
+        self.min_samples = min_samples
+        self.max_hedge_burst = max_hedge_burst
+        self._latencies = defaultdict(lambda: deque(maxlen=self.window))
+        self._counters = defaultdict(int)
+        self._hedge_budget = 0.0
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def record_latency(self, model, seconds):
+        with self._lock:
+            self._latencies[model].append(seconds)
+
+    def start_call(self):
+        """Count a call and add its share to the hedge budget"""
+        with self._lock:
+            self._counters['calls'] += 1
+            self._hedge_budget = min(self._hedge_budget + LLM_HEDGE_MAX_RATE, self.max_hedge_burst)
+
+    def hedge_delay(self, model):
+        """Seconds to wait before hedging a call to `model`, or None to never hedge it"""
+        if LLM_HEDGE_MAX_RATE <= 0:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies[model])
+        if len(samples) < self.min_samples:
+            return None  # Not enough history to know what "slow" means yet
+        return max(percentile(samples, LLM_HEDGE_PERCENTILE), LLM_HEDGE_MIN_DELAY_MS / 1000)
+
+    def acquire_hedge(self):
+        """Spend one hedge from the budget; False once the rate cap is reached"""
+        with self._lock:
+            if self._hedge_budget >= 1:
+                self._hedge_budget -= 1
+                self._counters['hedges'] += 1
+                return True
+            self._counters['hedges_denied'] += 1
+            return False
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = {model: sorted(samples) for model, samples in self._latencies.items()}
+        calls = counters.get('calls', 0)
+        return {
+            'hedging_enabled': LLM_HEDGE_MAX_RATE > 0,
+            'hedge_max_rate': LLM_HEDGE_MAX_RATE,
+            'calls': calls,
+            'hedges': counters.get('hedges', 0),
+            'hedge_wins': counters.get('hedge_wins', 0),
+            'hedges_denied': counters.get('hedges_denied', 0),
+            'hedge_rate': round(counters.get('hedges', 0) / calls, 4) if calls else 0.0,
+            'errors': counters.get('errors', 0),
+            'deadline_exceeded': counters.get('deadline_exceeded', 0),
+            'failovers': counters.get('failovers', 0),
+            'retries': counters.get('retries', 0),
+            'latency_ms': {
+                model: {
+                    'samples': len(samples),
+                    'p50': round(percentile(samples, 50) * 1000, 1),
+                    'p95': round(percentile(samples, 95) * 1000, 1),
+                    'p99': round(percentile(samples, 99) * 1000, 1)
+                }
+                for model, samples in latencies.items() if samples
+            }
+        }
+
+metrics = LLMMetrics()
+
+def llm_stats() -> dict:
+    return {**metrics.stats(), 'routing': model_router.stats()}
+
+def is_valid_response(response) -> bool:
+    """A response wins a hedge only if its content is the JSON object we asked for"""
+    try:
+        return isinstance(json.loads(response.choices[0].message.content), dict)
+    except (AttributeError, IndexError, TypeError, ValueError):
+        return False
+
+# --- Calls ---
+
+# Sync calls run on these threads so a hedge can be raced against the original
+_hedge_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_HEDGE_THREADS", 16)), thread_name_prefix='llm')
+
+def _timed_call(create, request, timeout, timing=None):
+    started = time.monotonic()
+    try:
+        response = create(timeout=timeout, **request)
+    except APITimeoutError as e:
+        raise DeadlineExceeded("LLM call did not finish before the deadline") from e
+    finally:
+        if timing is not None:
+            timing['elapsed'] = time.monotonic() - started
+    metrics.record_latency(request.get('model'), time.monotonic() - started)
+    return response
+
+def create_completion(request: dict, llm_client: OpenAI = None, task: str = None):
+    """Sync chat completion bounded by the current deadline, hedged when enabled
+
+    `request` holds the keyword arguments for chat.completions.create (as built
+    by each module's _*_request helper). Connection errors, 429s and 5xx are
+    retried while the deadline allows. With a `task` and no `model` in the
+    request, model_router picks the model and a call that still fails is
+    retried on the task's next candidate. Each completion is noted in the usage ledger,
+    and so is each hedged attempt whose answer wasn't used.
+    """
+    models = _route(request, task)
+    for attempt, model in enumerate(models, 1):
+        routed = {**request, 'model': model}
+        started = time.monotonic()
+        try:
+            response = _retrying_completion(routed, llm_client)
+        except Exception as e:
+            if not _note_failure(task, routed, started, e, attempt < len(models)):
+                raise
+            continue
+        _note_success(task, routed, started, response)
+        return response
+
+def _route(request, task):
+    """Models to try in order: the request's own model, or the task's routed candidates"""
+    if task is None or request.get('model'):
+        return [request.get('model')]
+    return model_router.candidates(task)
+
+def _note_failure(task, request, started, error, can_retry):
+    """Record a failed call; True if the next candidate should be tried"""
+    note_call(request['model'], time.monotonic() - started, error=error)
+    if task is None:
+        return False
+    model_router.record_failure(task, request['model'])
+    if not can_retry or isinstance(error, DeadlineExceeded) or remaining_time() <= 0:
+        return False
+    metrics.count('failovers')
+    print(f"⚠️  {request['model']} failed for {task} ({type(error).__name__}), trying the next model")
+    return True
+
+def _note_success(task, request, started, response):
+    elapsed = time.monotonic() - started
+    note_call(request['model'], elapsed, response)
+    if task is None:
+        return
+    try:
+        content = response.choices[0].message.content
+    except (AttributeError, IndexError, TypeError):
+        model_router.record_failure(task, request['model'])  # Nothing that could be parsed
+        return
+    model_router.record_response(task, request['model'], elapsed, content)
+
+def _retrying_completion(request, llm_client):
+    retry = 0
+    while True:
+        try:
+            return _hedged_completion(request, llm_client)
+        except Exception as e:
+            delay = _retry_delay(retry, e)
+            if delay is None:
+                raise
+        time.sleep(delay)
+        retry += 1
+
+def _hedged_completion(request, llm_client):
+    create = (llm_client or client).chat.completions.create
+    metrics.start_call()
+    try:
+        timeout = _time_left()
+        deadline_at = time.monotonic() + timeout
+        hedge_delay = metrics.hedge_delay(request.get('model'))
+        if hedge_delay is None or hedge_delay >= timeout:
+            return _timed_call(create, request, timeout)
+
+        timings = [{}, {}]
+        attempts = [_hedge_executor.submit(_timed_call, create, request, timeout, timings[0])]
+        done, _ = wait_futures(attempts, timeout=hedge_delay)
+        if not done and metrics.acquire_hedge():
+            attempts.append(_hedge_executor.submit(
+                _timed_call, create, request, deadline_at - time.monotonic(), timings[1]
+            ))
+        try:
+            chosen = _first_valid_sync(attempts, deadline_at)
+        except Exception:
+            # The caller notes the failure for the original request
+            _note_abandoned_attempts(request, attempts[1:], timings[1:])
+            raise
+        _note_abandoned_attempts(request, *_others(attempts, timings, chosen))
+        return chosen.result()
+    except DeadlineExceeded:
+        metrics.count('deadline_exceeded')
+        raise
+    except Exception:
+        metrics.count('errors')
+        raise
+
+def _others(attempts, timings, chosen):
+    """(attempts, timings) for every attempt except the chosen one"""
+    others = [(attempt, timing) for attempt, timing in zip(attempts, timings) if attempt is not chosen]
+    return [attempt for attempt, _ in others], [timing for _, timing in others]
+
+# Abandoned async attempts, referenced until they finish and are noted
+_abandoned = set()
+
+def _note_abandoned_attempts(request, attempts, timings):
+    """Note each hedged attempt whose answer wasn't used in the usage ledger once it finishes
+
+    It was sent (and billed) all the same, so its tokens and latency get a row
+    of their own next to the completion's.
+    """
+    context = contextvars.copy_context()  # Done callbacks run on other threads
+    for attempt, timing in zip(attempts, timings):
+        def note(finished, timing=timing):
+            _abandoned.discard(finished)
+            error = asyncio.CancelledError() if finished.cancelled() else finished.exception()
+            response = finished.result() if error is None else None
+            context.run(note_call, request.get('model'), timing.get('elapsed', 0.0), response, error=error, abandoned=True)
+        _abandoned.add(attempt)
+        attempt.add_done_callback(note)
+
+def _first_valid_sync(attempts, deadline_at):
+    """The first attempt with a valid answer, else the first that answered at all"""
+    pending = set(attempts)
+    fallback, error = None, None
+    while pending:
+        done, pending = wait_futures(pending, timeout=max(deadline_at - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded("LLM call did not finish before the deadline")
+        for future in done:
+            if future.exception() is not None:
+                error = error or future.exception()
+                continue
+            if is_valid_response(future.result()):
+                if future is not attempts[0]:
+                    metrics.count('hedge_wins')
+                return future
+            fallback = fallback or future
+    # Abandoned threads finish on their own; their timeout is bounded by the deadline
+    if fallback is not None:
+        return fallback  # Let the caller report the malformed output as before
+    raise error
+
+async def _timed_call_async(request, timeout, timing=None):
+    started = time.monotonic()
+    try:
+        response = await get_async_client().chat.completions.create(timeout=timeout, **request)
+    except APITimeoutError as e:
+        raise DeadlineExceeded("LLM call did not finish before the deadline") from e
+    finally:
+        if timing is not None:
+            timing['elapsed'] = time.monotonic() - started
+    metrics.record_latency(request.get('model'), time.monotonic() - started)
+    return response
+
+async def create_completion_async(request: dict, task: str = None):
+    """Async version of create_completion for the async Flask views"""
+    models = _route(request, task)
+    for attempt, model in enumerate(models, 1):
+        routed = {**request, 'model': model}
+        started = time.monotonic()
+        try:
+            response = await _retrying_completion_async(routed)
+        except Exception as e:
+            if not _note_failure(task, routed, started, e, attempt < len(models)):
+                raise
+            continue
+        _note_success(task, routed, started, response)
+        return response
+
+async def _retrying_completion_async(request):
+    retry = 0
+    while True:
+        try:
+            return await _hedged_completion_async(request)
+        except Exception as e:
+            delay = _retry_delay(retry, e)
+            if delay is None:
+                raise
+        await asyncio.sleep(delay)
+        retry += 1
+
+async def _hedged_completion_async(request):
+    metrics.start_call()
+    try:
+        timeout = _time_left()
+        deadline_at = time.monotonic() + timeout
+        hedge_delay = metrics.hedge_delay(request.get('model'))
+        timings = [{}, {}]
+        attempts = [asyncio.ensure_future(_timed_call_async(request, timeout, timings[0]))]
+        if hedge_delay is not None and hedge_delay < timeout:
+            done, _ = await asyncio.wait(attempts, timeout=hedge_delay)
+            if not done and metrics.acquire_hedge():
+                attempts.append(asyncio.ensure_future(
+                    _timed_call_async(request, deadline_at - time.monotonic(), timings[1])
+                ))
+        try:
+            chosen = await _first_valid_async(attempts, deadline_at)
+        except BaseException:
+            attempts[0].cancel()  # The caller notes the failure for the original request
+            _note_abandoned_attempts(request, attempts[1:], timings[1:])
+            raise
+        # The losing request is left to finish (within the deadline) so it can be noted
+        _note_abandoned_attempts(request, *_others(attempts, timings, chosen))
+        return chosen.result()
+    except DeadlineExceeded:
+        metrics.count('deadline_exceeded')
+        raise
+    except Exception:
+        metrics.count('errors')
+        raise
+
+async def _first_valid_async(attempts, deadline_at):
+    pending = set(attempts)
+    fallback, error = None, None
+    while pending:
+        done, pending = await asyncio.wait(pending, timeout=max(deadline_at - time.monotonic(), 0), return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded("LLM call did not finish before the deadline")
+        for task in done:
+            if task.exception() is not None:
+                error = error or task.exception()
+                continue
+            if is_valid_response(task.result()):
+                if task is not attempts[0]:
+                    metrics.count('hedge_wins')
+                return task
+            fallback = fallback or task
+    if fallback is not None:
+        return fallback
+    raise error
@@ -0,0 +1,322 @@
+"""
+Schemas and local repair for the model's structured (JSON) output
+Each coaching prompt has a schema below. parse_structured() first repairs the
+common defects of LLM JSON (markdown fences, text around the object, trailing
+commas, output truncated by max_tokens), then validates the result against the
+schema: missing optional keys get defaults, list items missing required keys
+are dropped, scalar types are coerced. A response is only rejected when the
+required data can't be salvaged, so most bad answers don't cost a re-call.
+"""
+import json
+import re
+import threading
+from collections import defaultdict
+
+from llm_usage import note_parse
+from model_router import model_router
+
+REQUIRED = 'required'
+OPTIONAL = 'optional'
+
+# A schema maps key -> (type, REQUIRED/OPTIONAL). A one-element list means "list
+# of this", and a nested dict is an object schema. Required lists must end up
+# with at least one valid item.
+ATOMIC_HABIT = {
+    'habit_name': (str, REQUIRED),
+    'two_minute_version': (str, OPTIONAL),
+    'rationale': (str, OPTIONAL)
+}
+
+HABIT_STACK = {
+    'anchor_habit': (str, REQUIRED),
+    'new_habit': (str, REQUIRED),
+    'stack_formula': (str, OPTIONAL),
+    'reasoning': (str, OPTIONAL)
+}
+
+PLAN_WEEK = {
+    'week': (int, OPTIONAL),
+    'focus': (str, OPTIONAL),
+    'action': (str, REQUIRED)
+}
+
+SCHEMAS = {
+    'decomposition': {
+        'identity_shift': (str, OPTIONAL),
+        'atomic_habits': ([ATOMIC_HABIT], REQUIRED)
+    },
+    'stacking': {
+        'habit_stacks': ([HABIT_STACK], REQUIRED)
+    },
+    'progression_plan': {
+        'progression_plan': ([PLAN_WEEK], REQUIRED)
+    },
+    # HabitAgent's variant of the plan also carries the identity statement
+    'agent_progression_plan': {
+        'identity_shift': (str, OPTIONAL),
+        'progression_plan': ([PLAN_WEEK], REQUIRED)
+    },
+    'adjustment': {
+        'observation': (str, OPTIONAL),
+        'suggestions': ([str], REQUIRED)
+    }
+}
+
+DEFAULTS = {str: '', int: 0}
+
+# Bound the number of truncation cut points tried before giving up
+MAX_REPAIR_ATTEMPTS = 200
+
+class StructuredOutputError(ValueError):
+    """The model's output couldn't be repaired into something matching the schema"""
+
+# --- Counters ---
+
+_stats = defaultdict(lambda: defaultdict(int))
+_stats_lock = threading.Lock()
+
+def _count(schema_name, outcome, defects=()):
+    with _stats_lock:
+        counters = _stats[schema_name]
+        counters[outcome] += 1
+        for defect in defects:
+            counters[f'defect_{defect}'] += 1
+
+def structured_output_stats() -> dict:
+    """Valid / repaired / failed counts (and defects seen) per schema"""
+    with _stats_lock:
+        stats = {name: dict(counters) for name, counters in _stats.items()}
+    for counters in stats.values():
+        total = counters.get('valid', 0) + counters.get('repaired', 0) + counters.get('failed', 0)
+        counters['total'] = total
+        counters['repair_rate'] = round(counters.get('repaired', 0) / total, 4) if total else 0.0
+        counters['failure_rate'] = round(counters.get('failed', 0) / total, 4) if total else 0.0
+    return stats
+
+# --- JSON repair ---
+
+FENCE_RE = re.compile(r'^\s*```[a-zA-Z]*\s*\n?|\n?\s*```\s*$')
+CLOSERS = {'{': '}', '[': ']'}
+
+def repair_json(text: str):
+    """Parse text as JSON, repairing what it can; returns (value, defects)
+
+    Raises StructuredOutputError when nothing parseable can be recovered.
+    """
+    defects = []
+    if text is None:
+        raise StructuredOutputError("Empty response")
+    if '```' in text:
+        stripped = FENCE_RE.sub('', text)
+        if stripped != text:
+            defects.append('code_fence')
+            text = stripped
+
+    start = min((i for i in (text.find('{'), text.find('[')) if i != -1), default=-1)
+    if start == -1:
+        raise StructuredOutputError("No JSON object in response")
+    if text[:start].strip():
+        defects.append('leading_text')
+    text = text[start:]
+
+    decoder = json.JSONDecoder()
+    try:
+        value, end = decoder.raw_decode(text)
+        if text[end:].strip():
+            defects.append('trailing_text')
+        return value, defects
+    except json.JSONDecodeError:
+        pass
+
+    cleaned, cut_points, open_stack, in_string = _scan(text)
+    if cleaned != text:
+        try:
+            value, end = decoder.raw_decode(cleaned)
+            defects.append('trailing_comma')
+            if cleaned[end:].strip():
+                defects.append('trailing_text')
+            return value, defects
+        except json.JSONDecodeError:
+            pass
+
+    # Truncated output: close the open containers, backing off to earlier element
+    # boundaries until the remainder parses. A cut-off string is dropped rather
+    # than closed, so half-written habit names never make it through.
+    candidates = [] if in_string else [(cleaned, open_stack)]
+    candidates += [(cleaned[:pos], stack) for pos, stack in reversed(cut_points[-MAX_REPAIR_ATTEMPTS:])]
+    for prefix, stack in candidates:
+        candidate = _strip_dangling(prefix) + ''.join(CLOSERS[c] for c in reversed(stack))
+        try:
+            value = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        defects.append('truncated')
+        return value, defects
+    raise StructuredOutputError("Response JSON could not be repaired")
+
+def _scan(text):
+    """One pass over text: drop trailing commas and note where elements end
+
+    Returns the cleaned text, a list of (position, open containers) cut points
+    just before each top-level-or-nested comma and just after each opening
+    bracket, the containers still open at the end, and whether the text ends
+    inside a string.
+    """
+    out = []
+    stack = []
+    cut_points = []
+    in_string = escaped = False
+    for ch in text:
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append(ch)
+            out.append(ch)
+            cut_points.append((len(out), list(stack)))
+            continue
+        elif ch in '}]':
+            # Drop a trailing comma before the closer
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(ch)
+            if not stack:
+                break  # End of the top-level value; anything after is trailing text
+            continue
+        elif ch == ',':
+            cut_points.append((len(out), list(stack)))
+        out.append(ch)
+    return ''.join(out), cut_points, stack, in_string
+
+DANGLING_RE = re.compile(r'(,\s*|\s*)("(?:[^"\\]|\\.)*"\s*:\s*)?(-|\d+\.|[a-z]+)?\s*$')
+
+def _strip_dangling(prefix):
+    """Remove a trailing comma, a key without a value or a half-written literal"""
+    prefix = prefix.rstrip()
+    match = DANGLING_RE.search(prefix)
+    if match and (match.group(2) or match.group(3) or match.group(1).strip()):
+        if match.group(3) in ('true', 'false', 'null'):
+            return prefix  # A complete literal, keep it
+        prefix = prefix[:match.start()]
+    return prefix.rstrip().rstrip(',')
+
+# --- Validation ---
+
+def _normalize_key(key):
+    return re.sub(r'[\s\-]+', '_', re.sub(r'(?<=[a-z0-9])([A-Z])', r'_\1', str(key).strip())).lower()
+
+def _coerce(value, expected, defects):
+    if isinstance(value, expected) and not (expected is int and isinstance(value, bool)):
+        return value
+    if expected is str and isinstance(value, (int, float)) and not isinstance(value, bool):
+        defects.append('coerced_type')
+        return str(value)
+    if expected is int and isinstance(value, str) and re.fullmatch(r'\s*\d+\s*', value):
+        defects.append('coerced_type')
+        return int(value)
+    if expected is int and isinstance(value, float) and value.is_integer():
+        defects.append('coerced_type')
+        return int(value)
+    raise StructuredOutputError(f"Expected {expected.__name__}, got {type(value).__name__}")
+
+def _validate_list(value, item_schema, defects):
+    if isinstance(value, (dict, str)):
+        defects.append('wrapped')
+        value = [value]  # A single item where a list was asked for
+    if not isinstance(value, list):
+        raise StructuredOutputError("Expected a list")
+    items = []
+    for item in value:
+        try:
+            if isinstance(item_schema, dict):
+                items.append(_validate_object(item, item_schema, defects))
+            else:
+                items.append(_coerce(item, item_schema, defects))
+        except StructuredOutputError:
+            defects.append('dropped_item')
+    return items
+
+def _validate_object(value, schema, defects):
+    if not isinstance(value, dict):
+        raise StructuredOutputError("Expected an object")
+    result = dict(value)
+    for key in list(result):
+        normalized = _normalize_key(key)
+        if normalized != key and normalized in schema and normalized not in result:
+            defects.append('renamed_key')
+            result[normalized] = result.pop(key)
+
+    for key, (expected, presence) in schema.items():
+        present = result.get(key) not in (None, '')
+        if isinstance(expected, list):
+            items = _validate_list(result[key], expected[0], defects) if present else []
+            if presence == REQUIRED and not items:
+                raise StructuredOutputError(f"'{key}' has no valid items")
+            result[key] = items
+        elif present:
+            try:
+                result[key] = _coerce(result[key], expected, defects)
+            except StructuredOutputError:
+                if presence == REQUIRED:
+                    raise
+                defects.append('missing_key')
+                result[key] = DEFAULTS[expected]
+        elif presence == REQUIRED:
+            raise StructuredOutputError(f"Missing required key '{key}'")
+        else:
+            defects.append('missing_key')
+            result[key] = DEFAULTS[expected]
+    return result
+
+def validate(data, schema_name: str):
+    """Validate parsed JSON against a named schema; returns (value, defects)"""
+    schema = SCHEMAS[schema_name]
+    defects = []
+    if isinstance(data, list):
+        # A bare list where the schema has exactly one list: wrap it
+        list_keys = [key for key, (expected, _) in schema.items() if isinstance(expected, list)]
+        if len(list_keys) == 1:
+            defects.append('wrapped')
+            data = {list_keys[0]: data}
+    return _validate_object(data, schema, defects), defects
+
+def parse_structured(content: str, schema_name: str) -> dict:
+    """Repair and validate the model's output for one of SCHEMAS
+
+    Raises StructuredOutputError if the required fields can't be recovered.
+    """
+    try:
+        data, repair_defects = repair_json(content)
+        value, schema_defects = validate(data, schema_name)
+    except StructuredOutputError:
+        _count(schema_name, 'failed')
+        note_parse(False)
+        model_router.note_parse(content, False)
+        raise
+    defects = sorted(set(repair_defects + schema_defects))
+    _count(schema_name, 'repaired' if defects else 'valid', defects)
+    note_parse(True)
+    model_router.note_parse(content, True)
+    return value
+
+def parse_response(response, schema_name: str) -> dict:
+    """parse_structured for a chat completion; {} (after logging) if it can't be salvaged"""
+    content = response.choices[0].message.content
+    try:
+        return parse_structured(content, schema_name)
+    except StructuredOutputError as e:
+        print(f"Error: Unusable {schema_name} response from the model: {e}")
+        print("Raw response:", content)
+        return {}
@@ -0,0 +1,186 @@
+"""
+Per-call LLM usage and latency ledger
+Each coaching function is wrapped with @tracked(feature). While it runs, every
+completion it makes is noted (model, prompt / completion / cache-hit tokens,
+latency, error) by llm_client, and whether its output parsed is noted by
+llm_schema. When the function returns, its calls are queued as llm_usage rows
+and a background thread writes them in batches of up to LLM_USAGE_BATCH_SIZE,
+at least every LLM_USAGE_FLUSH_SECONDS.
+
+Until UsageLedger.init_app is called (e.g. in scripts and the agent run on its
+own) nothing is queued.
+"""
+import contextvars
+import functools
+import inspect
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+# The tracked call in progress: {'feature', 'user_id', 'calls': [row, ...]}
+_current = contextvars.ContextVar('llm_usage_call', default=None)
+# Who the current request's LLM calls are for, set per request by the app
+_user = contextvars.ContextVar('llm_usage_user', default=None)
+
+UNTRACKED = 'other'
+
+def percentile(sorted_samples, pct):
+    index = min(len(sorted_samples) - 1, max(0, round(pct / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+def set_usage_user(user_id):
+    """Attribute the current context's LLM calls to a user (None clears it)"""
+    _user.set(None if user_id is None else str(user_id))
+
+def tracked(feature, user_attr=None):
+    """Record each LLM call made by the decorated (sync or async) function under `feature`
+
+    user_attr names an attribute of the first argument holding the user id,
+    for methods like HabitAgent's whose user isn't the request's.
+    """
+    def start(args):
+        user_id = getattr(args[0], user_attr, None) if user_attr and args else None
+        return _current.set({
+            'feature': feature,
+            'user_id': str(user_id) if user_id is not None else _user.get(),
+            'calls': []
+        })
+
+    def finish(token):
+        call = _current.get()
+        _current.reset(token)
+        for row in call['calls']:
+            ledger.record(row)
+
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                token = start(args)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    finish(token)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = start(args)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                finish(token)
+        return wrapper
+    return decorate
+
+def note_call(model, latency_seconds, response=None, error=None, abandoned=False):
+    """Called by llm_client once per completion, and once per hedged attempt whose answer wasn't used
+
+    An abandoned attempt can finish after its tracked function has returned,
+    so its row is queued at once rather than kept with the call's.
+    """
+    usage = getattr(response, 'usage', None)
+    cache_hit_tokens = getattr(usage, 'prompt_cache_hit_tokens', None) or 0
+    row = {
+        'model': model,
+        'prompt_tokens': getattr(usage, 'prompt_tokens', None),
+        'completion_tokens': getattr(usage, 'completion_tokens', None),
+        'cache_hit_tokens': cache_hit_tokens,
+        'cache_hit': cache_hit_tokens > 0,
+        'latency_ms': round(latency_seconds * 1000, 1),
+        'parse_ok': None,
+        'error': type(error).__name__ if error is not None else None,
+        'created_at': datetime.now(timezone.utc)
+    }
+    call = _current.get()
+    if call is None:
+        ledger.record({**row, 'feature': UNTRACKED, 'user_id': _user.get()})
+    elif abandoned:
+        ledger.record({**row, 'feature': call['feature'], 'user_id': call['user_id']})
+    else:
+        call['calls'].append({**row, 'feature': call['feature'], 'user_id': call['user_id']})
+
+def note_parse(ok):
+    """Called by llm_schema with the outcome of parsing the latest call's output"""
+    call = _current.get()
+    if call is not None and call['calls']:
+        call['calls'][-1]['parse_ok'] = ok
+
+class UsageLedger:
+    """Queues usage rows and writes them to llm_usage in batches on a daemon thread"""
+
+    def __init__(self):
+        self.app = None
+        self.batch_size = 200
+        self.flush_interval = 2.0
+        self._queue = queue.Queue(maxsize=100000)
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get('LLM_USAGE_BATCH_SIZE', 200)
+        self.flush_interval = app.config.get('LLM_USAGE_FLUSH_SECONDS', 2.0)
+        threading.Thread(target=self._run, name='llm-usage', daemon=True).start()
+
+    def record(self, row):
+        if self.app is None:
+            return
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1  # Never block an LLM call on the ledger
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            with self.app.app_context():
+                self._write(batch)
+
+    def flush(self):
+        """Write everything queued now, in the caller's app context (e.g. before a CLI command exits)"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for start in range(0, len(batch), self.batch_size):
+            self._write(batch[start:start + self.batch_size])
+
+    def _write(self, batch):
+        from database_service import DatabaseService
+        try:
+            DatabaseService.record_llm_usage(batch)
+        except Exception as e:
+            with self._lock:
+                self.dropped += len(batch)
+            print(f"⚠️  Failed to write {len(batch)} LLM usage rows: {e}")
+            return
+        with self._lock:
+            self.written += len(batch)
+            self.batches += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'written': self.written,
+                'batches': self.batches,
+                'dropped': self.dropped
+            }
+
+ledger = UsageLedger()
@@ -0,0 +1,163 @@
+"""
+Streaming importer from HabitAgent memory documents into the SQL schema
+Documents are read one at a time from a directory of JSON files (like
+user_user123_memory.json), a JSON-lines dump with one document per line, or
+straight from the agent's Firestore collection, mapped to User / Habit /
+HabitLog rows and written by DatabaseService.import_memory_chunk in chunks of
+documents. After each committed chunk the source position is written to a
+checkpoint file, so an interrupted import resumes where it stopped; chunks
+are idempotent, so replaying one after a crash is harmless.
+
+    FLASK_APP=app flask import-agent-memory memories/ --chunk-size 500 --checkpoint import.ckpt
+"""
+import json
+import os
+import time
+
+from habit_history import iter_days
+
+FIRESTORE_PREFIX = 'firestore:'
+
+def iter_json_dir(path, resume_after=None):
+    """Yield (filename, document) for *.json files in name order"""
+    names = sorted(name for name in os.listdir(path) if name.endswith('.json'))
+    for name in names:
+        if resume_after is not None and name <= resume_after:
+            continue
+        with open(os.path.join(path, name), 'r') as f:
+            yield name, json.load(f)
+
+def iter_json_lines(path, resume_after=None):
+    """Yield (byte offset after the line, document) for a JSON-lines file"""
+    with open(path, 'rb') as f:
+        if resume_after is not None:
+            f.seek(int(resume_after))
+        for line in iter(f.readline, b''):
+            if line.strip():
+                yield str(f.tell()), json.loads(line)
+
+def iter_firestore(collection, resume_after=None, page_size=500):
+    """Yield (document id, document) from a Firestore collection, paging by document id"""
+    from agent import initialize_firestore
+    from firebase_admin import firestore
+
+    client = initialize_firestore()
+    if client is None:
+        raise RuntimeError("Firestore is not configured")
+    last_id = resume_after
+    while True:
+        query = client.collection(collection).order_by(firestore.FieldPath.document_id()).limit(page_size)
+        if last_id is not None:
+            query = query.start_after({firestore.FieldPath.document_id(): last_id})
+        page = list(query.stream())
+        for snapshot in page:
+            yield snapshot.id, snapshot.to_dict()
+        if len(page) < page_size:
+            return
+        last_id = page[-1].id
+
+def iter_documents(source, resume_after=None):
+    """Pick the reader for a source: directory, .jsonl/.ndjson file or firestore:<collection>"""
+    if source.startswith(FIRESTORE_PREFIX):
+        return iter_firestore(source[len(FIRESTORE_PREFIX):] or 'users', resume_after)
+    if os.path.isdir(source):
+        return iter_json_dir(source, resume_after)
+    return iter_json_lines(source, resume_after)
+
+def memory_to_record(document):
+    """Map one agent memory document to rows for import_memory_chunk
+
+    Returns (record, undated) where undated counts entries of the old
+    ArrayUnion history, which carries no dates and can't become HabitLog rows.
+    """
+    username = str(document['user_id'])[:80]
+    habits = []
+    logs = []
+    undated = 0
+    for name, details in (document.get('habits') or {}).items():
+        details = details or {}
+        name = name[:200]
+        habits.append({
+            'name': name,
+            'anchor_habit': (details.get('stacked_on') or None) and str(details['stacked_on'])[:200]
+        })
+        for day, completed in iter_days(details.get('history_months') or {}):
+            logs.append((name, day, completed))
+        if isinstance(details.get('history'), list):
+            undated += len(details['history'])
+    record = {
+        'user': {
+            'username': username,
+            'main_goal': document.get('main_goal'),
+            'identity_shift': document.get('identity_shift')
+        },
+        'habits': habits,
+        'logs': logs
+    }
+    return record, undated
+
+def read_checkpoint(path, source):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('source') != source:
+        raise ValueError(f"Checkpoint {path} belongs to {checkpoint.get('source')!r}, not {source!r}")
+    return checkpoint.get('position')
+
+def write_checkpoint(path, source, position):
+    if not path:
+        return
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump({'source': source, 'position': position}, f)
+    os.replace(temp_path, path)  # Atomic, so a crash never leaves a torn checkpoint
+
+def import_memory(source, chunk_size=500, checkpoint=None, report=print):
+    """Stream documents from source into the database; returns the totals
+
+    Must run inside an app context. Only chunk_size documents are held in
+    memory at a time.
+    """
+    from database_service import DatabaseService
+
+    totals = {'documents': 0, 'users': 0, 'habits': 0, 'logs': 0, 'undated_skipped': 0, 'invalid': 0}
+    resume_after = read_checkpoint(checkpoint, source)
+    if resume_after is not None:
+        report(f"↪️  Resuming {source} after {resume_after}")
+    started = time.perf_counter()
+
+    def flush(records, position):
+        inserted = DatabaseService.import_memory_chunk(records)
+        write_checkpoint(checkpoint, source, position)
+        for table, count in inserted.items():
+            totals[table] += count
+        elapsed = time.perf_counter() - started
+        rows = totals['users'] + totals['habits'] + totals['logs']
+        report(f"📥 {totals['documents']} documents, {rows} rows inserted "
+               f"({rows / elapsed:,.0f} rows/sec)")
+
+    records = []
+    position = None
+    for position, document in iter_documents(source, resume_after):
+        totals['documents'] += 1
+        try:
+            record, undated = memory_to_record(document)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            totals['invalid'] += 1
+            report(f"⚠️  Skipping document {position}: {e!r}")
+            continue
+        totals['undated_skipped'] += undated
+        records.append(record)
+        if len(records) >= chunk_size:
+            flush(records, position)
+            records = []
+    if records:
+        flush(records, position)
+    elif position is not None:
+        write_checkpoint(checkpoint, source, position)  # Trailing invalid documents
+
+    totals['elapsed_s'] = round(time.perf_counter() - started, 3)
+    rows = totals['users'] + totals['habits'] + totals['logs']
+    totals['rows_per_sec'] = round(rows / totals['elapsed_s']) if totals['elapsed_s'] else 0
+    return totals
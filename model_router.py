@@ -0,0 +1,171 @@
+"""
+Per-task model routing for the LLM calls
+Each task (named after the llm_schema schema its output is parsed with) has an
+ordered list of candidate models, LLM_ROUTES, e.g.
+'{"stacking": ["deepseek-coder", "deepseek-chat"]}'. For every (task, model)
+the router keeps the latency and outcome of the last LLM_ROUTE_WINDOW calls,
+where a call succeeds if it returned and its output passed the schema. A call
+goes to the model with the lowest median latency among those whose success
+rate is at least LLM_ROUTE_MIN_SUCCESS; models without LLM_ROUTE_MIN_SAMPLES
+calls yet count as unmeasured and keep their place in the list, and
+LLM_ROUTE_EXPLORE_RATE of calls try another candidate so every model stays
+measured.
+
+A model that fails LLM_ROUTE_FAILURES_TO_BENCH calls in a row is benched for
+LLM_ROUTE_COOLDOWN_SECONDS, and a call whose model raises is retried on the
+next candidate while its deadline allows.
+"""
+import contextvars
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from llm_usage import percentile
+
+DEFAULT_ROUTES = {
+    'decomposition': ['deepseek-chat', 'deepseek-coder'],
+    'stacking': ['deepseek-coder', 'deepseek-chat'],
+    'progression_plan': ['deepseek-coder', 'deepseek-chat'],
+    'agent_progression_plan': ['deepseek-chat', 'deepseek-coder'],
+    'adjustment': ['deepseek-chat', 'deepseek-coder']  # A chat model is better for empathetic responses
+}
+DEFAULT_MODEL = 'deepseek-chat'
+
+# (task, model, content) of the call whose output is about to be parsed. A parse
+# only settles it for that same content object, so output that never got parsed
+# (an exception in between) can't take the next parse's outcome.
+_pending = contextvars.ContextVar('routed_call', default=None)
+
+class ModelStats:
+    """Rolling latency and outcome window for one model on one task"""
+
+    def __init__(self, window):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.failures_in_a_row = 0
+        self.benched_until = 0.0
+        self.routed = 0
+
+    def success_rate(self):
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else None
+
+    def median_latency(self):
+        return percentile(sorted(self.latencies), 50) if self.latencies else None
+
+class ModelRouter:
+    """Chooses a model per call from each task's candidates, by measured latency and output quality"""
+
+    def __init__(self, routes=None):
+        self.routes = routes or dict(DEFAULT_ROUTES)
+        self.window = int(os.getenv('LLM_ROUTE_WINDOW', 100))
+        self.min_samples = int(os.getenv('LLM_ROUTE_MIN_SAMPLES', 10))
+        self.min_success = float(os.getenv('LLM_ROUTE_MIN_SUCCESS', 0.9))
+        self.explore_rate = float(os.getenv('LLM_ROUTE_EXPLORE_RATE', 0.05))
+        self.failures_to_bench = int(os.getenv('LLM_ROUTE_FAILURES_TO_BENCH', 3))
+        self.cooldown = float(os.getenv('LLM_ROUTE_COOLDOWN_SECONDS', 60))
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _get(self, task, model):
+        stats = self._stats.get((task, model))
+        if stats is None:
+            stats = self._stats[(task, model)] = ModelStats(self.window)
+        return stats
+
+    def candidates(self, task):
+        """The task's models in the order to try them: the chosen one first, then failovers"""
+        models = self.routes.get(task) or [DEFAULT_MODEL]
+        now = time.monotonic()
+        with self._lock:
+            stats = {model: self._get(task, model) for model in models}
+            healthy = [model for model in models if stats[model].benched_until <= now]
+            qualified = [model for model in healthy if self._qualifies(stats[model])]
+            # Nothing meets the bar: fall back to the best success rates rather than fail
+            pool = qualified or sorted(healthy or models, key=lambda model: -(stats[model].success_rate() or 0))
+            if len(pool) > 1 and random.random() < self.explore_rate:
+                chosen = random.choice(pool[1:])
+            else:
+                chosen = min(pool, key=lambda model: (self._speed(stats[model]), pool.index(model)))
+            stats[chosen].routed += 1
+        return [chosen] + [model for model in pool if model != chosen]
+
+    def _qualifies(self, stats):
+        return len(stats.outcomes) < self.min_samples or stats.success_rate() >= self.min_success
+
+    def _speed(self, stats):
+        if len(stats.latencies) < self.min_samples:
+            return math.inf  # Unmeasured: ranked after measured models, in list order
+        return stats.median_latency()
+
+    def record_response(self, task, model, seconds, content):
+        """A completion arrived; its outcome is settled when `content` is parsed"""
+        with self._lock:
+            self._get(task, model).latencies.append(seconds)
+        _pending.set((task, model, content))
+
+    def record_failure(self, task, model):
+        """The call raised (connection error, 5xx, deadline...)"""
+        self._record_outcome(task, model, False)
+
+    def note_parse(self, content, ok):
+        """Called by llm_schema with the outcome of parsing `content`
+
+        Counts only if it is the output of the latest routed call in this context.
+        """
+        pending = _pending.get()
+        if pending is not None and pending[2] is content:
+            _pending.set(None)
+            self._record_outcome(pending[0], pending[1], ok)
+
+    def _record_outcome(self, task, model, ok):
+        with self._lock:
+            stats = self._get(task, model)
+            stats.outcomes.append(ok)
+            if ok:
+                stats.failures_in_a_row = 0
+                return
+            stats.failures_in_a_row += 1
+            failures = stats.failures_in_a_row
+            now = time.monotonic()
+            newly_benched = failures >= self.failures_to_bench and stats.benched_until <= now
+            if failures >= self.failures_to_bench:
+                stats.benched_until = now + self.cooldown
+        if newly_benched:
+            print(f"⚠️  Benched {model} for {task} for {self.cooldown:g}s after {failures} failures in a row")
+
+    def stats(self):
+        now = time.monotonic()
+        report = {}
+        with self._lock:
+            for task, models in self.routes.items():
+                report[task] = []
+                for model in models:
+                    stats = self._get(task, model)
+                    success_rate = stats.success_rate()
+                    median = stats.median_latency()
+                    report[task].append({
+                        'model': model,
+                        'routed': stats.routed,
+                        'samples': len(stats.outcomes),
+                        'success_rate': None if success_rate is None else round(success_rate, 4),
+                        'p50_ms': None if median is None else round(median * 1000, 1),
+                        'benched_seconds': round(max(stats.benched_until - now, 0), 1)
+                    })
+        return report
+
+def load_routes():
+    """DEFAULT_ROUTES updated with the LLM_ROUTES environment variable (JSON)"""
+    routes = dict(DEFAULT_ROUTES)
+    configured = os.getenv('LLM_ROUTES')
+    if configured:
+        try:
+            routes.update({task: list(models) for task, models in json.loads(configured).items() if models})
+        except (ValueError, AttributeError, TypeError) as e:
+            print(f"⚠️  Ignoring invalid LLM_ROUTES: {e}")
+    return routes
+
+model_router = ModelRouter(load_routes())
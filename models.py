@@ -5,7 +5,11 @@ from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timezone
 import json
 
-db = SQLAlchemy()
+from habit_history import DONE_SHIFT
+from replica import RoutingSession
+
+# RoutingSession sends DatabaseService's read-only queries to the replica bind, if configured
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     """User model to store user information"""
@@ -108,6 +112,34 @@ class HabitLog(db.Model):
             'logged_at': self.logged_at.isoformat() if self.logged_at else None
         }
 
+class HabitLogArchive(db.Model):
+    """Habit logs older than the archive horizon, packed one row per habit per month"""
+    __tablename__ = 'habit_log_archive'
+    
+    habit_id = db.Column(db.Integer, db.ForeignKey('habits.id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)  # First day of the month
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    
+    # habit_history month mask: bit (day - 1) logged, bit (DONE_SHIFT + day - 1) completed
+    days = db.Column(db.BigInteger, nullable=False, default=0)
+    difficulty_sum = db.Column(db.Integer, nullable=False, default=0)
+    difficulty_count = db.Column(db.Integer, nullable=False, default=0)  # Days that had a rating
+    
+    archived_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    __table_args__ = (db.Index('ix_habit_log_archive_user', 'user_id', 'month'),)
+    
+    def to_dict(self):
+        logged = self.days & 0xFFFFFFFF
+        return {
+            'user_id': self.user_id,
+            'habit_id': self.habit_id,
+            'month': self.month.isoformat() if self.month else None,
+            'days_logged': bin(logged).count('1'),
+            'days_completed': bin((self.days >> DONE_SHIFT) & logged).count('1'),
+            'average_difficulty': round(self.difficulty_sum / self.difficulty_count, 2) if self.difficulty_count else None
+        }
+
 class UserSession(db.Model):
     """Simple session management for users"""
     __tablename__ = 'user_sessions'
@@ -121,6 +153,9 @@ class UserSession(db.Model):
     
     user = db.relationship('User', backref='sessions')
     
+    # For the sweeper's bulk expiry
+    __table_args__ = (db.Index('ix_user_sessions_expiry', 'is_active', 'expires_at'),)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -131,6 +166,193 @@ class UserSession(db.Model):
             'is_active': self.is_active
         }
 
+class IdempotencyKey(db.Model):
+    """Stored response for a client-supplied Idempotency-Key, replayed on retries"""
+    __tablename__ = 'idempotency_keys'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    endpoint = db.Column(db.String(100), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)  # sha256 of the request body
+    
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, done
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    mimetype = db.Column(db.String(100), nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'endpoint', 'key', name='unique_idempotency_key'),
+        db.Index('ix_idempotency_keys_expires', 'expires_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'endpoint': self.endpoint,
+            'key': self.key,
+            'request_hash': self.request_hash,
+            'status': self.status,
+            'response_status': self.response_status,
+            'response_body': self.response_body,
+            'mimetype': self.mimetype,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+
+class UserDataVersion(db.Model):
+    """Per-user counter bumped by every DatabaseService write, used for ETags"""
+    __tablename__ = 'user_data_versions'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'version': self.version,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class ReplicationHeartbeat(db.Model):
+    """Single row touched on the primary every few seconds; its age on the replica is the replication lag"""
+    __tablename__ = 'replication_heartbeat'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    beat_at = db.Column(db.DateTime, nullable=False)
+
+class LLMUsage(db.Model):
+    """One LLM call made by a coaching feature, written in batches by llm_usage"""
+    __tablename__ = 'llm_usage'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    feature = db.Column(db.String(100), nullable=False)  # e.g. goal_decomposition, agent.analyze_and_adjust_habit
+    model = db.Column(db.String(100), nullable=True)
+    user_id = db.Column(db.String(80), nullable=True)  # App user ids and agent (Firestore) ids alike
+    
+    prompt_tokens = db.Column(db.Integer, nullable=True)
+    completion_tokens = db.Column(db.Integer, nullable=True)
+    cache_hit_tokens = db.Column(db.Integer, nullable=False, default=0)
+    cache_hit = db.Column(db.Boolean, nullable=False, default=False)
+    latency_ms = db.Column(db.Float, nullable=False)
+    parse_ok = db.Column(db.Boolean, nullable=True)  # None when the output wasn't parsed
+    error = db.Column(db.String(100), nullable=True)  # Exception class name if the call failed
+    
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    __table_args__ = (db.Index('ix_llm_usage_feature_created', 'feature', 'created_at'),)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'feature': self.feature,
+            'model': self.model,
+            'user_id': self.user_id,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'cache_hit_tokens': self.cache_hit_tokens,
+            'cache_hit': self.cache_hit,
+            'latency_ms': self.latency_ms,
+            'parse_ok': self.parse_ok,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class DailyUserStats(db.Model):
+    """Per-user, per-day rollup of habit logs, maintained incrementally by DatabaseService"""
+    __tablename__ = 'daily_user_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    
+    # Counts cover active habits only, matching the live dashboard
+    completed = db.Column(db.Integer, nullable=False, default=0)  # Habits completed that day
+    possible = db.Column(db.Integer, nullable=False, default=0)  # Habits checked in that day, done or missed
+    active_habits = db.Column(db.Integer, nullable=False, default=0)  # Active habits as of the day's last update
+    
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'date': self.date.isoformat() if self.date else None,
+            'completed': self.completed,
+            'possible': self.possible,
+            'active_habits': self.active_habits,
+            'completion_rate': round(self.completed / self.active_habits * 100, 1) if self.active_habits else 0.0
+        }
+
+class HabitIntervention(db.Model):
+    """A struggling habit queued for a proactive check-in, enqueued at log time by DatabaseService"""
+    __tablename__ = 'habit_interventions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    habit_id = db.Column(db.Integer, db.ForeignKey('habits.id'), nullable=False)
+    
+    misses = db.Column(db.Integer, nullable=False)  # Misses in the window when it was enqueued
+    window_end = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent
+    suggestions = db.Column(db.Text, nullable=True)  # JSON from the adjustment prompt
+    
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    processed_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_habit_interventions_status', 'status', 'id'),
+        db.Index('ix_habit_interventions_habit', 'user_id', 'habit_id', 'window_end'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'habit_id': self.habit_id,
+            'misses': self.misses,
+            'window_end': self.window_end.isoformat() if self.window_end else None,
+            'status': self.status,
+            'suggestions': json.loads(self.suggestions) if self.suggestions else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None
+        }
+
+class PrecomputedAdjustment(db.Model):
+    """Adjustment suggestions generated ahead of time for an at-risk habit, valid while its history is unchanged"""
+    __tablename__ = 'precomputed_adjustments'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    habit_id = db.Column(db.Integer, db.ForeignKey('habits.id'), nullable=False)
+    
+    history_fingerprint = db.Column(db.String(64), nullable=False)  # sha256 of the prompt inputs
+    history = db.Column(db.Text, nullable=False)  # JSON list: True / False / None per day, oldest first
+    misses = db.Column(db.Integer, nullable=False)
+    suggestions = db.Column(db.Text, nullable=False)  # JSON from the adjustment prompt
+    
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'habit_id', name='unique_precomputed_adjustment'),
+        db.Index('ix_precomputed_adjustments_fingerprint', 'user_id', 'history_fingerprint'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'habit_id': self.habit_id,
+            'history_fingerprint': self.history_fingerprint,
+            'history': json.loads(self.history),
+            'misses': self.misses,
+            'suggestions': json.loads(self.suggestions),
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
 def init_db_tables(app):
     """Initialize the database tables (called from app.py)"""
     with app.app_context():
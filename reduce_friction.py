@@ -1,27 +1,16 @@
-import os
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
+import hashlib
 from datetime import datetime, timedelta
 import uuid
 
-# --- Configuration and API Client Setup ---
-load_dotenv()
-deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
-
-if not deepseek_api_key:
-    raise ValueError("DEEPSEEK_API_KEY not found in .env file or environment variables.")
-
-# Initialize the client to connect to the DeepSeek API
-client = OpenAI(api_key=deepseek_api_key, base_url="https://api.deepseek.com")
+# --- API Client Setup (shared DeepSeek client) ---
+from llm_client import create_completion, create_completion_async, DeadlineExceeded
+from llm_schema import parse_response
+from llm_usage import tracked
 
 # --- Feature 1: Habit Deconstruction & Gradual Progression ---
 
-def deconstruct_complex_habit(complex_habit: str) -> dict:
-    """
-    Breaks down a complex habit into a simple, step-by-step progression plan.
-    """
-    system_prompt = """
+DECONSTRUCT_SYSTEM_PROMPT = """
 You are an expert AI habit formation coach. Your task is to deconstruct a user's complex goal into a simple, 4-week progression plan. Each week should build on the last, starting with an extremely easy "two-minute" version.
 
 You must respond with only a valid JSON object. The root object should contain a key "progression_plan" which is a list of four week objects.
@@ -33,53 +22,102 @@ Each week object must have this exact structure:
   "action": "The specific, concrete action the user should take this week."
 }
 """
+
+def _deconstruct_request(complex_habit: str) -> dict:
+    """Builds the chat completion arguments shared by the sync and async calls."""
     user_prompt = f"Please deconstruct this complex goal into a 4-week plan: '{complex_habit}'"
+    return dict(
+        messages=[
+            {"role": "system", "content": DECONSTRUCT_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.7,
+        response_format={"type": "json_object"}
+    )
+
+@tracked('deconstruct_complex_habit')
+def deconstruct_complex_habit(complex_habit: str) -> dict:
+    """
+    Breaks down a complex habit into a simple, step-by-step progression plan.
+    """
+    try:
+        response = create_completion(_deconstruct_request(complex_habit), task='progression_plan')
+        return parse_response(response, 'progression_plan')
+    except Exception as e:
+        print(f"An error occurred in deconstruct_complex_habit: {e}")
+        return {}
 
+@tracked('deconstruct_complex_habit')
+async def deconstruct_complex_habit_async(complex_habit: str) -> dict:
+    """
+    Async version of deconstruct_complex_habit for the async Flask views.
+    """
     try:
-        response = client.chat.completions.create(
-            model="deepseek-coder",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.7,
-            response_format={"type": "json_object"}
-        )
-        return json.loads(response.choices[0].message.content)
+        response = await create_completion_async(_deconstruct_request(complex_habit), task='progression_plan')
+        return parse_response(response, 'progression_plan')
+    except DeadlineExceeded:
+        raise  # The view answers 504 rather than an empty result
     except Exception as e:
         print(f"An error occurred in deconstruct_complex_habit: {e}")
         return {}
 
 # --- Feature 2: Proactive Problem-Solving for Missed Habits ---
 
-def analyze_and_adjust_habit(habit: str, history: list[bool]) -> dict:
-    """
-    Analyzes a user's habit history and suggests adjustments for missed habits.
-    """
-    system_prompt = """
+ADJUST_SYSTEM_PROMPT = """
 You are an empathetic and supportive AI habit coach. You have noticed the user is struggling with a habit. Your task is to offer gentle, non-judgmental suggestions for making the habit easier, based on the principles of "Atomic Habits".
 
 You must respond with only a valid JSON object with two keys: "observation" and "suggestions".
 - "observation": A kind, non-judgmental sentence acknowledging the user's effort and the difficulty.
 - "suggestions": A list of 2-3 concrete, actionable ideas to make the habit easier (e.g., reduce the time, change the environment, or simplify the action).
 """
+
+def _adjust_request(habit: str, history: list[bool]) -> dict:
+    """Builds the chat completion arguments shared by the sync and async calls."""
     user_prompt = f"""
 I'm trying to build the habit: '{habit}'.
-Here is my completion history for the last 7 days (True=completed, False=missed): {history}.
+Here is my completion history for the last 7 days, oldest first (True=completed, False=missed, None=not logged): {history}.
 Please give me some suggestions.
 """
+    return dict(
+        messages=[
+            {"role": "system", "content": ADJUST_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.8,
+        response_format={"type": "json_object"}
+    )
+
+def adjustment_fingerprint(habit: str, history: list) -> str:
+    """sha256 of everything the adjustment prompt depends on (the prompt text, habit and history)
+
+    Precomputed suggestions stored under this fingerprint are only reused while
+    the history they were generated from is unchanged.
+    """
+    payload = json.dumps([ADJUST_SYSTEM_PROMPT, habit, list(history)], separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
+@tracked('analyze_and_adjust_habit')
+def analyze_and_adjust_habit(habit: str, history: list[bool]) -> dict:
+    """
+    Analyzes a user's habit history and suggests adjustments for missed habits.
+    """
+    try:
+        response = create_completion(_adjust_request(habit, history), task='adjustment')
+        return parse_response(response, 'adjustment')
+    except Exception as e:
+        print(f"An error occurred in analyze_and_adjust_habit: {e}")
+        return {}
+
+@tracked('analyze_and_adjust_habit')
+async def analyze_and_adjust_habit_async(habit: str, history: list[bool]) -> dict:
+    """
+    Async version of analyze_and_adjust_habit for the async Flask views.
+    """
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat", # A chat model is better for empathetic responses
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.8,
-            response_format={"type": "json_object"}
-        )
-        return json.loads(response.choices[0].message.content)
+        response = await create_completion_async(_adjust_request(habit, history), task='adjustment')
+        return parse_response(response, 'adjustment')
+    except DeadlineExceeded:
+        raise  # The view answers 504 rather than an empty result
     except Exception as e:
         print(f"An error occurred in analyze_and_adjust_habit: {e}")
         return {}
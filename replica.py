@@ -0,0 +1,195 @@
+"""
+Read-replica routing for the SQLAlchemy session
+When a 'replica' bind is configured (REPLICA_DATABASE_URL), DatabaseService
+methods decorated with @replica_read send their SELECTs to it; everything else,
+and any statement in a session that has already written, goes to the primary.
+A read falls back to the primary when:
+
+- the user wrote within the last REPLICA_STICKY_SECONDS (read-your-writes), or
+- the replica's copy of the heartbeat row, which the primary touches every
+  REPLICA_HEARTBEAT_SECONDS, is more than REPLICA_MAX_LAG_SECONDS old.
+
+Stickiness is tracked per process; a write served by another worker is covered
+by the lag check once the heartbeat interval has passed.
+"""
+import contextvars
+import functools
+import math
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, select, update, insert
+
+from lookup_cache import LRUCache
+
+REPLICA_BIND = 'replica'
+
+# The routing decision (True: replica, False: primary) while a @replica_read
+# method runs; nested calls inherit it instead of deciding again
+_use_replica = contextvars.ContextVar('use_replica', default=None)
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends eligible SELECTs to the replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _use_replica.get() and not self._flushing and not self.info.get('wrote'):
+            if clause is None or getattr(clause, 'is_select', False):
+                engine = self._db.engines.get(REPLICA_BIND)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_session_wrote(session, flush_context):
+    # Reads after a write in the same transaction must see it: pin to the primary
+    session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'after_bulk_update')
+@event.listens_for(RoutingSession, 'after_bulk_delete')
+def _mark_session_bulk_wrote(update_context):
+    update_context.session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _clear_session_wrote(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('wrote', None)
+
+class ReplicaRouter:
+    """Decides per read whether the replica may serve it, and keeps the heartbeat"""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.max_lag = 5.0
+        self.heartbeat_interval = 1.0
+        self._recent_writers = LRUCache(maxsize=65536, ttl=5.0)
+        self._lag = math.inf
+        self._lag_checked_at = 0.0
+        self._lock = threading.Lock()
+        self._counters = {'replica_reads': 0, 'primary_sticky': 0, 'primary_lagging': 0}
+
+    def init_app(self, app, db):
+        """Start routing if the app has a replica bind (call after create_all)"""
+        self.app = app
+        self.db = db
+        self.enabled = REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {})
+        self.max_lag = app.config.get('REPLICA_MAX_LAG_SECONDS', 5.0)
+        self.heartbeat_interval = app.config.get('REPLICA_HEARTBEAT_SECONDS', 1.0)
+        self._recent_writers = LRUCache(maxsize=65536, ttl=app.config.get('REPLICA_STICKY_SECONDS', 5.0))
+        if self.enabled:
+            self.beat()
+            threading.Thread(target=self._heartbeat_loop, name='replica-heartbeat', daemon=True).start()
+
+    def mark_write(self, user_id):
+        """Pin the user's reads to the primary for the sticky window"""
+        if self.enabled:
+            self._recent_writers.set(user_id, True)
+
+    def can_read(self, user_id):
+        if not self.enabled:
+            return False
+        if self._recent_writers.get(user_id):
+            self._count('primary_sticky')
+            return False
+        if self.lag() > self.max_lag:
+            self._count('primary_lagging')
+            return False
+        self._count('replica_reads')
+        return True
+
+    def lag(self):
+        """Seconds the replica is behind, re-measured at most once per heartbeat interval"""
+        now = time.monotonic()
+        if now - self._lag_checked_at < self.heartbeat_interval:
+            return self._lag
+        with self._lock:
+            if now - self._lag_checked_at >= self.heartbeat_interval:
+                self._lag = self._measure_lag()
+                self._lag_checked_at = now
+        return self._lag
+
+    def _measure_lag(self):
+        from models import ReplicationHeartbeat
+        try:
+            with self.db.engines[REPLICA_BIND].connect() as connection:
+                beat_at = connection.execute(
+                    select(ReplicationHeartbeat.beat_at).where(ReplicationHeartbeat.id == 1)
+                ).scalar()
+        except Exception:
+            return math.inf  # Unreachable or not yet seeded: treat as lagging
+        if beat_at is None:
+            return math.inf
+        if beat_at.tzinfo is None:
+            beat_at = beat_at.replace(tzinfo=timezone.utc)
+        return max((datetime.now(timezone.utc) - beat_at).total_seconds(), 0.0)
+
+    def beat(self):
+        """Touch the heartbeat row on the primary"""
+        from models import ReplicationHeartbeat
+        table = ReplicationHeartbeat.__table__
+        now = datetime.now(timezone.utc)
+        with self.db.engine.begin() as connection:
+            if not connection.execute(update(table).where(table.c.id == 1).values(beat_at=now)).rowcount:
+                connection.execute(insert(table).values(id=1, beat_at=now))
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                with self.app.app_context():
+                    self.beat()
+            except Exception as e:
+                print(f"⚠️  Replica heartbeat failed: {e}")
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        lag = self.lag() if self.enabled else None
+        return {
+            'enabled': self.enabled,
+            'lag_seconds': None if lag is None or math.isinf(lag) else round(lag, 3),
+            'max_lag_seconds': self.max_lag,
+            **counters
+        }
+
+replica_router = ReplicaRouter()
+
+def replica_read(func):
+    """Run a read-only DatabaseService method against the replica when it's safe
+
+    The wrapped function's first argument must be the user_id. The decision is
+    made once, by the outermost decorated call, so everything it reads comes
+    from the same database.
+    """
+    @functools.wraps(func)
+    def wrapper(user_id, *args, **kwargs):
+        if _use_replica.get() is not None:
+            return func(user_id, *args, **kwargs)
+        token = _use_replica.set(replica_router.can_read(user_id))
+        try:
+            return func(user_id, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
+
+def primary_read(func):
+    """Run a read against the primary, even inside a @replica_read call
+
+    For reads of data only the primary is guaranteed to have, such as the
+    full-text index. Put it on the outermost call so everything the request
+    reads, its ETag version included, comes from the same database.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _use_replica.set(False)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
@@ -0,0 +1,224 @@
+"""
+Full-text search over habits and habit log notes
+A habit's name, its details (description, two-minute version, rationale) and
+the notes on each of its logs are indexed as separate documents:
+
+- SQLite: an FTS5 table (porter stemming), ranked with bm25. The user is an
+  indexed `owner` token, so a search only reads that user's postings.
+- PostgreSQL: a search_documents table with a weighted tsvector and a GIN
+  index, ranked with ts_rank.
+
+Other databases have no index and search is unavailable. DatabaseService
+updates the index inside the same transaction as the write it reflects, so the
+two can't drift; `flask rebuild-search-index` rebuilds it from scratch.
+Document ids are derived from the row: habit id * 2, or log id * 2 + 1.
+"""
+import re
+
+from sqlalchemy import select, text
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERMS = 16
+SNIPPET_MARKERS = ('[', ']')
+
+# Column weights: a match in the name counts most, then details, then log notes
+NAME_WEIGHT, DETAILS_WEIGHT, NOTES_WEIGHT = 10.0, 4.0, 1.0
+
+def habit_doc_id(habit_id):
+    return habit_id * 2
+
+def log_doc_id(log_id):
+    return log_id * 2 + 1
+
+def habit_details(habit):
+    """The indexed detail text of a Habit (or a dict of its columns)"""
+    get = habit.get if isinstance(habit, dict) else lambda key: getattr(habit, key, None)
+    return ' '.join(filter(None, (get('description'), get('two_minute_version'), get('rationale'))))
+
+def query_terms(query):
+    """Words of a user's search, with FTS operators and punctuation dropped"""
+    return TERM_RE.findall(query or '')[:MAX_TERMS]
+
+class SQLiteBackend:
+    """FTS5 virtual table; documents are addressed by rowid"""
+
+    name = 'sqlite-fts5'
+
+    def create(self, session):
+        session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+            "name, details, notes, owner, habit_id UNINDEXED, tokenize = 'porter unicode61')"
+        ))
+
+    def is_empty(self, session):
+        return session.execute(text("SELECT rowid FROM search_index LIMIT 1")).first() is None
+
+    def clear(self, session):
+        session.execute(text("DELETE FROM search_index"))
+
+    def upsert(self, session, documents):
+        # FTS5 has no upsert: replace by rowid
+        session.execute(text("DELETE FROM search_index WHERE rowid = :doc_id"), [{'doc_id': doc['doc_id']} for doc in documents])
+        session.execute(text(
+            "INSERT INTO search_index (rowid, name, details, notes, owner, habit_id) "
+            "VALUES (:doc_id, :name, :details, :notes, :owner, :habit_id)"
+        ), [{**doc, 'owner': f"u{doc['user_id']}"} for doc in documents])
+
+    def delete(self, session, doc_id):
+        session.execute(text("DELETE FROM search_index WHERE rowid = :doc_id"), {'doc_id': doc_id})
+
+    def search(self, session, user_id, terms, limit, offset):
+        # Every term must match, the last one as a prefix (search as you type)
+        phrases = ' '.join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+        match = f'owner:"u{int(user_id)}" AND {{name details notes}}:({phrases.strip()})'
+        start, end = SNIPPET_MARKERS
+        # Ties go to the first column, so the snippet comes from the text rather than the owner token
+        rank = f"bm25(search_index, {NAME_WEIGHT}, {DETAILS_WEIGHT}, {NOTES_WEIGHT}, 0.0)"
+        return session.execute(text(
+            "SELECT rowid AS doc_id, habit_id, "
+            f"snippet(search_index, -1, '{start}', '{end}', '…', 12) AS snippet, -{rank} AS score "
+            f"FROM search_index WHERE search_index MATCH :match ORDER BY {rank} "
+            "LIMIT :limit OFFSET :offset"
+        ), {'match': match, 'limit': limit, 'offset': offset}).all()
+
+class PostgresBackend:
+    """Table with a weighted tsvector column and a GIN index"""
+
+    name = 'postgresql-tsvector'
+    DOCUMENT = (
+        "setweight(to_tsvector('english', coalesce(:name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(:details, '')), 'B') || "
+        "setweight(to_tsvector('english', coalesce(:notes, '')), 'C')"
+    )
+
+    def create(self, session):
+        session.execute(text(
+            "CREATE TABLE IF NOT EXISTS search_documents ("
+            "doc_id BIGINT PRIMARY KEY, user_id INTEGER NOT NULL, habit_id INTEGER NOT NULL, "
+            "name TEXT, details TEXT, notes TEXT, document TSVECTOR NOT NULL)"
+        ))
+        session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_search_documents_document ON search_documents USING GIN (document)"
+        ))
+        session.execute(text("CREATE INDEX IF NOT EXISTS ix_search_documents_user ON search_documents (user_id)"))
+
+    def is_empty(self, session):
+        return session.execute(text("SELECT doc_id FROM search_documents LIMIT 1")).first() is None
+
+    def clear(self, session):
+        session.execute(text("TRUNCATE search_documents"))
+
+    def upsert(self, session, documents):
+        session.execute(text(
+            "INSERT INTO search_documents (doc_id, user_id, habit_id, name, details, notes, document) "
+            f"VALUES (:doc_id, :user_id, :habit_id, :name, :details, :notes, {self.DOCUMENT}) "
+            "ON CONFLICT (doc_id) DO UPDATE SET name = EXCLUDED.name, details = EXCLUDED.details, "
+            "notes = EXCLUDED.notes, document = EXCLUDED.document"
+        ), documents)
+
+    def delete(self, session, doc_id):
+        session.execute(text("DELETE FROM search_documents WHERE doc_id = :doc_id"), {'doc_id': doc_id})
+
+    def search(self, session, user_id, terms, limit, offset):
+        query = ' & '.join(terms[:-1] + [f"{terms[-1]}:*"])
+        start, end = SNIPPET_MARKERS
+        return session.execute(text(
+            "SELECT doc_id, habit_id, "
+            "ts_headline('english', concat_ws(' ', name, details, notes), q, "
+            f"'StartSel={start}, StopSel={end}, MaxWords=20, MinWords=5') AS snippet, "
+            "ts_rank(document, q) AS score "
+            "FROM search_documents, to_tsquery('english', :query) AS q "
+            "WHERE user_id = :user_id AND document @@ q "
+            "ORDER BY score DESC, doc_id LIMIT :limit OFFSET :offset"
+        ), {'query': query, 'user_id': user_id, 'limit': limit, 'offset': offset}).all()
+
+class SearchIndex:
+    """Keeps the full-text index in step with habits and log notes, and queries it"""
+
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app, db):
+        """Create the index for the primary's dialect and backfill it if empty (call inside an app context)"""
+        dialect = db.engine.dialect.name
+        backend = {'sqlite': SQLiteBackend, 'postgresql': PostgresBackend}.get(dialect)
+        if backend is None:
+            print(f"⚠️  Full-text search is not available on {dialect}")
+            return
+        try:
+            backend().create(db.session)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️  Full-text search disabled, the index could not be created: {e}")
+            return
+        self.backend = backend()
+        if self.backend.is_empty(db.session):
+            documents = self.rebuild(db.session)
+            if documents:
+                print(f"✅ Indexed {documents} habits and notes for search")
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def index_habits(self, session, habits):
+        """Add or refresh Habit rows (or dicts with their columns, including id and user_id)"""
+        if not self.enabled or not habits:
+            return
+        get = lambda habit, key: habit[key] if isinstance(habit, dict) else getattr(habit, key)
+        self.backend.upsert(session, [{
+            'doc_id': habit_doc_id(get(habit, 'id')),
+            'user_id': get(habit, 'user_id'),
+            'habit_id': get(habit, 'id'),
+            'name': get(habit, 'name'),
+            'details': habit_details(habit),
+            'notes': None
+        } for habit in habits])
+
+    def index_log(self, session, log):
+        """Index a log's notes, or drop it from the index once it has none"""
+        if not self.enabled:
+            return
+        if not log.notes:
+            self.backend.delete(session, log_doc_id(log.id))
+            return
+        # Ids from request JSON may still be strings on a log that hasn't been reloaded
+        self.backend.upsert(session, [{
+            'doc_id': log_doc_id(log.id), 'user_id': int(log.user_id), 'habit_id': int(log.habit_id),
+            'name': None, 'details': None, 'notes': log.notes
+        }])
+
+    def rebuild(self, session, batch_size=5000):
+        """Re-index every habit and every log with notes; returns the number of documents"""
+        from models import Habit, HabitLog
+
+        if not self.enabled:
+            return 0
+        self.backend.clear(session)
+        count = 0
+        columns = (Habit.id, Habit.user_id, Habit.name, Habit.description, Habit.two_minute_version, Habit.rationale)
+        rows = session.execute(select(*columns).order_by(Habit.id).execution_options(yield_per=batch_size))
+        for batch in rows.partitions():
+            self.index_habits(session, [row._asdict() for row in batch])
+            count += len(batch)
+        rows = session.execute(select(HabitLog.id, HabitLog.user_id, HabitLog.habit_id, HabitLog.notes).where(
+            HabitLog.notes.isnot(None), HabitLog.notes != ''
+        ).order_by(HabitLog.id).execution_options(yield_per=batch_size))
+        for batch in rows.partitions():
+            self.backend.upsert(session, [{
+                'doc_id': log_doc_id(row.id), 'user_id': row.user_id, 'habit_id': row.habit_id,
+                'name': None, 'details': None, 'notes': row.notes
+            } for row in batch])
+            count += len(batch)
+        session.commit()
+        return count
+
+    def search(self, session, user_id, query, limit, offset):
+        """(doc_id, habit_id, snippet, score) rows for the user's best matches, or [] for an empty query"""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        return self.backend.search(session, user_id, terms, limit, offset)
+
+search_index = SearchIndex()
@@ -0,0 +1,145 @@
+"""
+Session-token authentication backed by user_sessions
+Clients send `Authorization: Bearer <token>` (or `X-Session-Token`). Tokens are
+validated through an in-process TTL cache in front of user_sessions, so a
+request only reaches the database when its token isn't cached: once per
+SESSION_CACHE_TTL seconds per token and worker. Unknown tokens are cached too,
+so a client retrying a bad token doesn't cost a query each time.
+
+Ending a session publishes it through the live_updates broker, and every
+worker listening there drops the token from its cache, so a logout takes
+effect everywhere at once without a query per request. If that message is
+lost, other workers stop accepting the token within SESSION_CACHE_TTL. A
+background sweeper deactivates expired sessions in bulk every
+SESSION_SWEEP_SECONDS.
+"""
+import hmac
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import current_app, g, request, jsonify
+
+from database_service import DatabaseService
+from live_updates import live_updates
+from lookup_cache import LRUCache
+
+INVALID = (None, None)  # Cached result for a token that isn't a live session
+
+def request_token():
+    """The session token sent with the current request, if any"""
+    header = request.headers.get('Authorization', '')
+    if header[:7].lower() == 'bearer ':
+        return header[7:].strip() or None
+    return request.headers.get('X-Session-Token') or None
+
+def admin_authorized():
+    """Whether the request sends the configured ADMIN_TOKEN as X-Admin-Token (never, when none is set)"""
+    expected = current_app.config.get('ADMIN_TOKEN')
+    sent = request.headers.get('X-Admin-Token')
+    return bool(expected and sent) and hmac.compare_digest(sent.encode('utf-8'), expected.encode('utf-8'))
+
+class SessionAuth:
+    """Validates request tokens through a TTL cache and sweeps expired sessions"""
+
+    def __init__(self):
+        self.app = None
+        self._cache = LRUCache(maxsize=65536, ttl=60)
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.rejected = 0
+        self.swept = 0
+
+    def init_app(self, app):
+        self.app = app
+        self._cache = LRUCache(
+            maxsize=app.config.get('SESSION_CACHE_SIZE', 65536),
+            ttl=app.config.get('SESSION_CACHE_TTL', 60)
+        )
+        app.before_request(self.authenticate)
+        live_updates.on_session_end(self.invalidate)  # Logouts on any worker
+        sweep_seconds = app.config.get('SESSION_SWEEP_SECONDS', 300)
+        if sweep_seconds > 0:
+            threading.Thread(target=self._sweep_loop, args=(sweep_seconds,), name='session-sweeper', daemon=True).start()
+
+    def cached(self, token):
+        """The cached (user_id, expires_at) for a token, or None if it isn't cached"""
+        return self._cache.get(token)
+
+    def lookup(self, token):
+        """(user_id, expires_at) for a token, INVALID if it isn't a live session
+
+        Served from the cache when possible; otherwise it queries user_sessions
+        and needs an app context.
+        """
+        cached = self._cache.get(token)
+        if cached is None:
+            live_updates.ensure_started()  # Listen for logouts before caching a session
+            with self._lock:
+                self.lookups += 1
+            cached = DatabaseService.get_session_user(token) or INVALID
+            self._cache.set(token, cached)
+        return cached
+
+    def validate(self, token):
+        """user_id for a live session token, or None"""
+        return self._live_user(self.lookup(token))
+
+    @staticmethod
+    def _live_user(cached):
+        user_id, expires_at = cached
+        if user_id is None or expires_at <= datetime.now(timezone.utc):
+            return None
+        return user_id
+
+    def invalidate(self, token):
+        self._cache.pop(token)
+
+    def authenticate(self):
+        """before_request hook: resolve the token to g.user_id
+
+        Requests without a token stay anonymous (g.user_id is None). A bad
+        token gets 401, and a token for another user gets 403 on
+        /api/users/<user_id>/... routes.
+        """
+        g.user_id = None
+        token = request_token()
+        if token is None:
+            return None
+        cached = g.pop('session_lookup', None)  # Already resolved off the event loop by asgi.py
+        if cached is None:
+            cached = self.lookup(token)
+        user_id = self._live_user(cached)
+        if user_id is None:
+            with self._lock:
+                self.rejected += 1
+            return jsonify({"error": "Invalid or expired session"}), 401
+        g.user_id = user_id
+        path_user_id = (request.view_args or {}).get('user_id')
+        if path_user_id is not None and path_user_id != user_id:
+            return jsonify({"error": "This session belongs to another user"}), 403
+        return None
+
+    def _sweep_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                with self.app.app_context():
+                    expired, _ = DatabaseService.expire_sessions()
+                with self._lock:
+                    self.swept += expired
+            except Exception as e:
+                print(f"⚠️  Session sweep failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            counters = {'db_lookups': self.lookups, 'rejected': self.rejected, 'expired_by_sweeper': self.swept}
+        return {'cache': self._cache.stats(), **counters}
+
+session_auth = SessionAuth()
+
+def current_user_id(requested=None):
+    """The authenticated user, else the user_id the client asked for (user 1 by default)"""
+    if g.get('user_id') is not None:
+        return g.user_id
+    return requested if requested is not None else 1
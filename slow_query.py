@@ -0,0 +1,211 @@
+"""
+Slow-query log with EXPLAIN capture
+Engine events time every statement. Each one is folded into per-fingerprint
+totals (the statement with literals and IN lists collapsed), so a query that is
+fast but runs far too often, like a per-habit loop, shows up through its count
+and total time. Statements slower than SLOW_QUERY_MS are also kept in a ring
+buffer of the last SLOW_QUERY_LOG_SIZE, with the DatabaseService methods that
+issued them and the database's plan. A plan is captured once per fingerprint,
+on the same connection, without running the statement again. It runs inside a
+savepoint, so a failing EXPLAIN can't abort the caller's transaction.
+
+Only normalized statements are kept: parameters (session tokens, emails, notes,
+idempotency keys) never reach the log, and quoted values are masked in plans.
+"""
+import hashlib
+import re
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+from lookup_cache import LRUCache
+
+# Fingerprints kept in the totals; the least recently seen are dropped beyond this
+MAX_FINGERPRINTS = 2000
+
+# Fast statements record their callers on the 1st, 101st, ... execution (slow ones always)
+CALLER_SAMPLE_EVERY = 100
+
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+    'mariadb': 'EXPLAIN '
+}
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+EXPLAIN_SAVEPOINT = 'slow_query_explain'
+
+WHITESPACE_RE = re.compile(r'\s+')
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s|:\w+|\$\d+")
+IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+QUOTED_RE = re.compile(r"'(?:[^']|'')*'")
+SERVICE_FILE = 'database_service.py'
+
+def normalize(statement):
+    """The statement with whitespace, literals, placeholders and IN lists collapsed"""
+    text = WHITESPACE_RE.sub(' ', statement).strip()
+    text = LITERAL_RE.sub('?', text)
+    return IN_LIST_RE.sub('(?...)', text)
+
+def service_callers():
+    """The DatabaseService methods on the current stack, outermost first"""
+    names = []
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_code.co_filename.endswith(SERVICE_FILE):
+            names.append(frame.f_code.co_name)
+        frame = frame.f_back
+    return ' > '.join(reversed(names)) or None
+
+class SlowQueryLog:
+    """Per-fingerprint statement totals plus a ring buffer of slow statements"""
+
+    def __init__(self):
+        self.threshold = 0.1
+        self._recent = deque(maxlen=200)
+        self._totals = {}
+        self._fingerprints = LRUCache(maxsize=4096)  # statement text -> (fingerprint, normalized)
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db):
+        """Time every statement on the app's engines (call inside an app context)"""
+        self.threshold = app.config.get('SLOW_QUERY_MS', 100) / 1000
+        self._recent = deque(maxlen=app.config.get('SLOW_QUERY_LOG_SIZE', 200))
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', self._before_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('query_started')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        fingerprint, normalized = self._fingerprint(statement)
+        slow = elapsed >= self.threshold
+        with self._lock:
+            totals = self._totals.get(fingerprint)
+            if totals is None:
+                if len(self._totals) >= MAX_FINGERPRINTS:
+                    oldest = min(self._totals, key=lambda key: self._totals[key]['last_seen'])
+                    del self._totals[oldest]
+                    self._plans.pop(oldest, None)
+                totals = self._totals[fingerprint] = {
+                    'fingerprint': fingerprint, 'statement': normalized, 'count': 0, 'total_ms': 0.0,
+                    'max_ms': 0.0, 'slow_count': 0, 'callers': set(), 'last_seen': 0.0
+                }
+            totals['count'] += 1
+            totals['total_ms'] += elapsed * 1000
+            totals['max_ms'] = max(totals['max_ms'], elapsed * 1000)
+            totals['last_seen'] = time.monotonic()
+            sample_callers = totals['count'] % CALLER_SAMPLE_EVERY == 1
+        if not slow:
+            if sample_callers:
+                callers = service_callers()
+                if callers:
+                    with self._lock:
+                        totals['callers'].add(callers)
+            return
+
+        callers = service_callers()
+        plan = self._plan(conn, statement, parameters, fingerprint, executemany)
+        entry = {
+            'at': datetime.now(timezone.utc).isoformat(),
+            'duration_ms': round(elapsed * 1000, 2),
+            'fingerprint': fingerprint,
+            'statement': normalized,
+            'callers': callers,
+            'endpoint': request.endpoint if has_request_context() else None,
+            'plan': plan
+        }
+        with self._lock:
+            self._recent.append(entry)
+            totals['slow_count'] += 1
+            if callers:
+                totals['callers'].add(callers)
+
+    def _fingerprint(self, statement):
+        cached = self._fingerprints.get(statement)
+        if cached is None:
+            normalized = normalize(statement)
+            cached = (hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12], normalized)
+            self._fingerprints.set(statement, cached)
+        return cached
+
+    def _plan(self, conn, statement, parameters, fingerprint, executemany):
+        """EXPLAIN output for a slow statement, captured once per fingerprint"""
+        plan = self._plans.get(fingerprint)
+        if plan is not None:
+            return plan
+        prefix = EXPLAIN_PREFIXES.get(conn.dialect.name)
+        if prefix is None or executemany or not statement.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        try:
+            # A separate DBAPI cursor, so the statement's own results are untouched
+            cursor = conn.connection.cursor()
+            try:
+                rows = self._explain(cursor, prefix + statement, parameters)
+            finally:
+                cursor.close()
+            plan = '\n'.join(str(row[-1]) if conn.dialect.name == 'sqlite' else ' '.join(map(str, row)) for row in rows)
+        except Exception as e:
+            plan = f"EXPLAIN failed: {e}"
+        plan = QUOTED_RE.sub("'?'", plan)  # PostgreSQL plans (and errors) quote the bound values
+        with self._lock:
+            if fingerprint in self._totals:  # Not evicted meanwhile, so _plans stays within MAX_FINGERPRINTS
+                self._plans[fingerprint] = plan
+        return plan
+
+    @staticmethod
+    def _explain(cursor, explain, parameters):
+        """Run EXPLAIN in a savepoint of the caller's transaction
+
+        On PostgreSQL a failed statement aborts the whole transaction; rolling
+        back to the savepoint undoes that, so the caller's next statement runs.
+        """
+        cursor.execute(f"SAVEPOINT {EXPLAIN_SAVEPOINT}")
+        try:
+            cursor.execute(explain, parameters)
+            return cursor.fetchall()
+        except Exception:
+            cursor.execute(f"ROLLBACK TO SAVEPOINT {EXPLAIN_SAVEPOINT}")
+            raise
+        finally:
+            cursor.execute(f"RELEASE SAVEPOINT {EXPLAIN_SAVEPOINT}")
+
+    def report(self, limit=50):
+        """Slow statements (newest first) and the busiest fingerprints by total time"""
+        with self._lock:
+            recent = list(reversed(self._recent))
+            busiest = [
+                {**totals, 'callers': sorted(totals['callers'])}
+                for totals in sorted(self._totals.values(), key=lambda t: t['total_ms'], reverse=True)[:limit]
+            ]
+            plans = dict(self._plans)
+        for totals in busiest:
+            del totals['last_seen']
+            totals['mean_ms'] = round(totals['total_ms'] / totals['count'], 3)
+            totals['total_ms'] = round(totals['total_ms'], 2)
+            totals['max_ms'] = round(totals['max_ms'], 2)
+            totals['plan'] = plans.get(totals['fingerprint'])
+        return {
+            'threshold_ms': self.threshold * 1000,
+            'recent': recent[:limit],
+            'by_fingerprint': busiest
+        }
+
+    def reset(self):
+        with self._lock:
+            self._recent.clear()
+            self._totals.clear()
+            self._plans.clear()
+
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,165 @@
+"""
+Precompressed static asset serving for the React build
+The build directory is scanned once: every file is read into memory along with
+gzip (and, if the brotli package is installed, brotli) variants, so a request
+is a dict lookup plus content negotiation. Fingerprinted bundles get a
+one-year immutable Cache-Control; everything else is revalidated via ETag.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import Response
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# CRA emits names like main.3f2a1b4c.js, 453.a1b2c3d4.chunk.css, logo.6ce24c58023cc2f8.svg
+FINGERPRINT_RE = re.compile(r'\.[0-9a-f]{8,}\.')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+COMPRESSIBLE_TYPES = {
+    'application/javascript', 'application/json', 'application/manifest+json',
+    'application/xml', 'image/svg+xml', 'application/wasm', 'font/ttf', 'font/otf'
+}
+
+# Server preference when the client accepts several encodings equally
+ENCODING_PREFERENCE = ('br', 'gzip', 'identity')
+
+# Skip compressing tiny files: the framing overhead outweighs the saving
+MIN_COMPRESS_SIZE = 1024
+
+class StaticAsset:
+    """One file from the build directory with its precomputed encodings"""
+    __slots__ = ('path', 'mimetype', 'etag', 'immutable', 'variants')
+
+    def __init__(self, path, mimetype, etag, immutable, variants):
+        self.path = path
+        self.mimetype = mimetype
+        self.etag = etag
+        self.immutable = immutable
+        self.variants = variants
+
+class StaticAssetManifest:
+    """In-memory manifest of the build directory keyed by URL path"""
+
+    def __init__(self, root):
+        self.root = root
+        self.assets = {}
+        self.directories = set()
+        self._index_mtime = None
+
+    def build(self):
+        """(Re)scan the build directory and precompute every encoding"""
+        assets = {}
+        if os.path.isdir(self.root):
+            for dirpath, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    if filename.endswith(('.gz', '.br')):
+                        continue  # Precompressed siblings are picked up below
+                    full_path = os.path.join(dirpath, filename)
+                    url_path = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                    assets[url_path] = self._load(full_path, url_path)
+        self.assets = assets
+        # Directories the build puts assets in (static/js, static/css...), not the root
+        self.directories = {path.rsplit('/', 1)[0] for path in assets if '/' in path}
+        self._index_mtime = self._mtime('index.html')
+        return self
+
+    def is_missing_asset(self, path):
+        """Whether path names a build file that isn't there (e.g. a stale bundle)
+
+        Such paths deserve a 404. Anything else is a client-side route, however
+        dotted (/habits/v1.2, /users/jane.doe), and gets index.html.
+        """
+        directory, _, filename = path.rpartition('/')
+        if directory in self.directories or FINGERPRINT_RE.search(filename):
+            return True
+        full_path = safe_join(self.root, path)
+        return full_path is not None and os.path.isfile(full_path)  # Added since the manifest was built
+
+    def refresh_if_changed(self):
+        """Rebuild when index.html changed on disk (i.e. after `npm run build`)"""
+        if self._mtime('index.html') != self._index_mtime:
+            self.build()
+
+    def stats(self):
+        encoded = lambda name: sum(len(a.variants[name]) for a in self.assets.values() if name in a.variants)
+        return {
+            'files': len(self.assets),
+            'immutable': sum(1 for a in self.assets.values() if a.immutable),
+            'identity_bytes': encoded('identity'),
+            'gzip_bytes': encoded('gzip'),
+            'br_bytes': encoded('br'),
+            'brotli_available': brotli is not None
+        }
+
+    def serve(self, path, request):
+        """Return a Response for path, or None if it isn't a known asset"""
+        asset = self.assets.get(path)
+        if asset is None:
+            return None
+
+        encoding = negotiate_encoding(request.accept_encodings, asset.variants)
+        response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if asset.immutable else REVALIDATE_CACHE_CONTROL
+        response.set_etag(asset.etag if encoding == 'identity' else f"{asset.etag}-{encoding}")
+        return response.make_conditional(request)
+
+    def _mtime(self, path):
+        try:
+            return os.path.getmtime(os.path.join(self.root, path))
+        except OSError:
+            return None
+
+    def _load(self, full_path, url_path):
+        with open(full_path, 'rb') as f:
+            data = f.read()
+
+        mimetype = mimetypes.guess_type(url_path)[0] or 'application/octet-stream'
+        variants = {'identity': data}
+        if is_compressible(mimetype) and len(data) >= MIN_COMPRESS_SIZE:
+            variants['gzip'] = read_sibling(full_path + '.gz') or gzip.compress(data, compresslevel=9, mtime=0)
+            if brotli is not None:
+                variants['br'] = read_sibling(full_path + '.br') or brotli.compress(data, quality=11)
+            # Drop encodings that don't actually save anything
+            for name in ('gzip', 'br'):
+                if name in variants and len(variants[name]) >= len(data):
+                    del variants[name]
+
+        etag = hashlib.sha1(data).hexdigest()[:20]
+        immutable = bool(FINGERPRINT_RE.search(os.path.basename(url_path)))
+        return StaticAsset(url_path, mimetype, etag, immutable, variants)
+
+def is_compressible(mimetype):
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+def read_sibling(path):
+    """Read a precompressed file produced by the frontend build, if there is one"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def negotiate_encoding(accept_encodings, variants):
+    """Pick the best available encoding allowed by the Accept-Encoding header"""
+    best = 'identity'
+    best_quality = 0
+    for name in ENCODING_PREFERENCE:
+        if name not in variants:
+            continue
+        quality = accept_encodings[name] if name != 'identity' else max(accept_encodings['identity'], 0.001)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
@@ -0,0 +1,36 @@
+"""
+Storage profiles for the SQL engine
+A profile is a set of connection-level settings applied through the engine's
+connect event, so every pooled connection is configured the same way.
+"""
+from sqlalchemy import event
+
+STORAGE_PROFILES = {
+    # Driver defaults: rollback journal, fsync on every commit
+    'default': {},
+    # SQLite tuned for concurrent readers and a steady stream of small writes
+    'wal': {
+        'journal_mode': 'WAL',          # Readers no longer block the writer
+        'synchronous': 'NORMAL',        # fsync at checkpoints instead of every commit
+        'busy_timeout': 5000,           # Wait up to 5s for the write lock instead of failing
+        'cache_size': -20000,           # ~20MB page cache per connection
+        'temp_store': 'MEMORY',
+        'wal_autocheckpoint': 1000
+    }
+}
+
+def apply_storage_profile(engine, profile='default'):
+    """Register a connect listener that applies the profile's PRAGMAs (SQLite only)"""
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile '{profile}', use one of: {', '.join(STORAGE_PROFILES)}")
+
+    pragmas = STORAGE_PROFILES[profile]
+    if not pragmas or engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
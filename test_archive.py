@@ -0,0 +1,89 @@
+"""
+Behaviour tests for archiving old habit logs into monthly bitmap rows and
+reading them back through the progress, rollup and export paths
+"""
+import json
+from datetime import date, timedelta
+
+import pytest
+
+import database_service
+from database_service import DatabaseService
+from models import HabitLog, HabitLogArchive, DailyUserStats
+
+@pytest.fixture
+def archive(app, monkeypatch):
+    """Run `flask archive-logs` with everything before this month past the horizon"""
+    monkeypatch.setattr(database_service, 'ARCHIVE_AFTER_DAYS', 0)
+
+    def run():
+        result = app.test_cli_runner().invoke(args=['archive-logs'])
+        assert result.exit_code == 0, result.output
+        return result.output
+    yield run
+    # Raise the horizon past every archived month, which moves them all back
+    monkeypatch.setattr(database_service, 'ARCHIVE_AFTER_DAYS', 36500)
+    with app.app_context():
+        DatabaseService.archive_old_logs()
+
+def log_days(app, user, habit, days, completed=True, notes=None):
+    today = date.today()
+    with app.app_context():
+        for days_ago in days:
+            DatabaseService.log_habit_completion(user['id'], habit['id'], today - timedelta(days=days_ago), completed, notes)
+
+def rollup(user_id):
+    return {row.date: (row.completed, row.possible) for row in DailyUserStats.query.filter_by(user_id=user_id)}
+
+def test_archived_days_still_count_in_progress(app, client, user, habit, archive):
+    log_days(app, user, habit, range(45))
+    log_days(app, user, habit, [50], completed=False)
+    path = f"/get_habit_progress/{user['id']}/{habit['id']}?days=60"
+    before = client.get(path).get_json()
+
+    assert 'Archived' in archive()
+    with app.app_context():
+        cutoff = date.today().replace(day=1)
+        assert HabitLog.query.filter(HabitLog.habit_id == habit['id'], HabitLog.date < cutoff).count() == 0
+        assert HabitLogArchive.query.filter_by(habit_id=habit['id']).count() >= 1
+
+    after = client.get(path).get_json()
+    assert before['current_streak'] == after['current_streak'] == 45
+    assert before['success_rate'] == after['success_rate']
+    assert before['total_logs'] == after['total_logs'] == 46
+
+def test_relogging_an_archived_day_moves_it_back_to_the_hot_table(app, user, habit, archive):
+    log_days(app, user, habit, [40, 41, 42])
+    archive()
+    day = date.today() - timedelta(days=41)
+    log_days(app, user, habit, [41], completed=False)
+
+    with app.app_context():
+        logs = [log for log in DatabaseService.list_habit_progress(user['id'], habit['id'], days=60) if log['date'] == day]
+        assert [(log['completed'], log['id'] is not None) for log in logs] == [(False, True)]
+        incremental = rollup(user['id'])
+        DatabaseService.rebuild_daily_stats(user_id=user['id'])
+        assert rollup(user['id']) == incremental
+        assert incremental[day] == (0, 1)
+
+def test_logs_with_notes_stay_hot_and_export_covers_both_tiers(app, client, user, habit, archive):
+    log_days(app, user, habit, [40], notes='Finished the chapter')
+    log_days(app, user, habit, [41, 42, 0])
+    archive()
+
+    with app.app_context():
+        hot = HabitLog.query.filter_by(habit_id=habit['id']).all()
+        assert sorted(log.notes or '' for log in hot) == ['', 'Finished the chapter']
+
+    records = [json.loads(line) for line in client.get(f"/api/users/{user['id']}/export").get_data(as_text=True).splitlines()]
+    logged = sorted(record['date'] for record in records if record['type'] == 'log')
+    assert logged == sorted((date.today() - timedelta(days=n)).isoformat() for n in (0, 40, 41, 42))
+
+def test_raising_the_horizon_restores_archived_months(app, user, habit, archive, monkeypatch):
+    log_days(app, user, habit, [40, 41])
+    archive()
+    monkeypatch.setattr(database_service, 'ARCHIVE_AFTER_DAYS', 36500)
+    with app.app_context():
+        assert DatabaseService.archive_old_logs()['logs_restored'] >= 2
+        assert HabitLogArchive.query.filter_by(habit_id=habit['id']).count() == 0
+        assert HabitLog.query.filter_by(habit_id=habit['id']).count() == 2
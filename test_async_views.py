@@ -0,0 +1,37 @@
+"""
+Behaviour tests for the LLM-backed async views (LLM calls replaced by coroutines)
+"""
+import asyncio
+
+import app as app_module
+
+def test_async_views_await_the_llm_call(client, monkeypatch):
+    async def deconstruct(habit):
+        await asyncio.sleep(0)
+        return {'progression_plan': [{'week': 1, 'goal': f'Two minutes of: {habit}'}]}
+    monkeypatch.setattr(app_module, 'deconstruct_complex_habit_async', deconstruct)
+
+    response = client.post('/reduce_friction', json={'habit': 'Run 10k'})
+    assert response.status_code == 200
+    assert response.get_json()['progression_plan'][0]['goal'] == 'Two minutes of: Run 10k'
+
+def test_async_views_validate_before_calling_the_llm(client, monkeypatch):
+    async def unexpected(*args):
+        raise AssertionError('The LLM must not be called for an invalid request')
+    monkeypatch.setattr(app_module, 'deconstruct_complex_habit_async', unexpected)
+    monkeypatch.setattr(app_module, 'goal_decomposition_async', unexpected)
+
+    assert client.post('/reduce_friction', json={}).status_code == 400
+    assert client.post('/decompose_goal', json={'user_id': 1}).status_code == 400
+
+def test_unusable_llm_output_is_a_502(client, monkeypatch):
+    async def unusable(goal):
+        return None
+    monkeypatch.setattr(app_module, 'goal_decomposition_async', unusable)
+    assert client.post('/decompose_goal', json={'goal': 'Write a book'}).status_code == 502
+
+    async def no_stacks(current_habits, desired_habits):
+        return {}  # What parse_response gives back for output it can't salvage
+    monkeypatch.setattr(app_module, 'generate_habit_stacks_async', no_stacks)
+    response = client.post('/stack_habits', json={'current_habits': ['Make coffee'], 'desired_habits': ['Stretch']})
+    assert response.status_code == 502
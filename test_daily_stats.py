@@ -0,0 +1,69 @@
+"""
+Behaviour tests for the daily_user_stats rollup behind the dashboard and trend
+"""
+from datetime import date, timedelta
+
+from database_service import DatabaseService
+from models import db, DailyUserStats
+
+def rollup(user_id):
+    return {
+        row.date: (row.completed, row.possible, row.active_habits)
+        for row in DailyUserStats.query.filter_by(user_id=user_id)
+    }
+
+def test_logs_update_the_rollup_incrementally(app, user, habit):
+    today = date.today()
+    with app.app_context():
+        second = DatabaseService.create_habit_stack(user['id'], {'new_habit': 'Walk'})
+        DatabaseService.log_habit_completion(user['id'], habit['id'], today, True)
+        DatabaseService.log_habit_completion(user['id'], second.id, today, False)
+        DatabaseService.log_habit_completion(user['id'], second.id, today, True)  # Changed its mind
+        assert rollup(user['id'])[today] == (2, 2, 2)
+
+        DatabaseService.deactivate_habit(user['id'], second.id)
+        assert rollup(user['id'])[today] == (1, 1, 1)
+
+def test_rebuild_reproduces_the_incremental_rollup(app, user, habit):
+    today = date.today()
+    with app.app_context():
+        for days_ago, completed in [(0, True), (1, False), (2, True), (5, True)]:
+            DatabaseService.log_habit_completion(user['id'], habit['id'], today - timedelta(days=days_ago), completed)
+        incremental = rollup(user['id'])
+
+        assert DatabaseService.rebuild_daily_stats(user_id=user['id']) == 4
+        assert rollup(user['id']) == incremental
+
+def test_trend_fills_days_without_logs(client, app, user, habit):
+    today = date.today()
+    with app.app_context():
+        DatabaseService.log_habit_completion(user['id'], habit['id'], today - timedelta(days=2), True)
+    trend = client.get(f"/api/users/{user['id']}/trend?days=4").get_json()
+    assert [day['date'] for day in trend] == [(today - timedelta(days=n)).isoformat() for n in (3, 2, 1, 0)]
+    assert [day['completed'] for day in trend] == [0, 1, 0, 0]
+    assert trend[2]['active_habits'] == 1  # Carried forward from the last logged day
+
+def test_rebuild_changes_the_etag_of_every_user_it_touches(client, app, user, habit):
+    today = date.today()
+    with app.app_context():
+        DatabaseService.log_habit_completion(user['id'], habit['id'], today, True)
+    path = f"/api/users/{user['id']}/dashboard"
+    before = client.get(path)
+    assert before.get_json()['completed_today'] == 1
+
+    with app.app_context():
+        # Drift the rollup by hand, as a bug or a manual fix-up would, then repair it
+        DailyUserStats.query.filter_by(user_id=user['id'], date=today).update({'completed': 0})
+        db.session.commit()
+        DatabaseService.rebuild_daily_stats(user_ids=[user['id']])
+
+    after = client.get(path, headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200
+    assert after.headers['ETag'] != before.headers['ETag']
+
+def test_weekly_progress_covers_the_last_seven_days(client, app, user, habit):
+    today = date.today()
+    with app.app_context():
+        for days_ago in range(8):  # The eighth day is outside the week
+            DatabaseService.log_habit_completion(user['id'], habit['id'], today - timedelta(days=days_ago), True)
+    assert client.get(f"/api/users/{user['id']}/dashboard").get_json()['weekly_progress'] == 100
@@ -97,8 +97,19 @@ def test_database_integration():
     else:
         print(f"❌ Dashboard stats failed: {dashboard_response.status_code}")
     
-    # Test 7: Habit Stacking with Database
-    print("\n7. Testing Habit Stacking with Database...")
+    # Test 7: Data Export
+    print("\n7. Testing Data Export...")
+    export_response = requests.get(f"{BASE_URL}/api/users/{user_id}/export", stream=True)
+    if export_response.status_code == 200:
+        records = [json.loads(line) for line in export_response.iter_lines() if line]
+        record_types = [record['type'] for record in records]
+        print(f"✅ Export streamed {len(records)} records!")
+        print(f"   Habits: {record_types.count('habit')}, Logs: {record_types.count('log')}")
+    else:
+        print(f"❌ Data export failed: {export_response.status_code}")
+    
+    # Test 8: Habit Stacking with Database
+    print("\n8. Testing Habit Stacking with Database...")
     stack_response = requests.post(f"{BASE_URL}/stack_habits", 
                                   json={
                                       "current_habits": ["Make morning coffee", "Brush teeth"],
@@ -0,0 +1,136 @@
+"""
+Behaviour tests for request deadlines reaching the LLM calls, and the hedging policy
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+from openai import OpenAI, APITimeoutError, InternalServerError
+
+import llm_client
+from llm_client import LLMMetrics, DeadlineExceeded, create_completion, deadline
+
+class HangingCompletions:
+    """Never answers: waits out the timeout it was given, as the OpenAI client would"""
+
+    def __init__(self):
+        self.timeouts = []
+
+    async def create(self, timeout=None, **request):
+        self.timeouts.append(timeout)
+        await asyncio.sleep(timeout)
+        raise APITimeoutError(request=None)
+
+class Backend(BaseHTTPRequestHandler):
+    """A chat completions endpoint that hangs, or fails with 503 for its first `failures` requests"""
+
+    hang = False
+    failures = 0
+    requests = 0
+
+    def do_POST(self):
+        type(self).requests += 1
+        self.rfile.read(int(self.headers['Content-Length']))
+        if self.hang:
+            time.sleep(2)
+            return
+        if self.requests <= self.failures:
+            self.send_response(503)
+            body = b'{"error": {"message": "overloaded"}}'
+        else:
+            self.send_response(200)
+            body = json.dumps({
+                'id': 'c', 'object': 'chat.completion', 'created': 0, 'model': 'm',
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': '{"ok": true}'}}]
+            }).encode()
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def backend(monkeypatch):
+    """An OpenAI client built like llm_client's, pointed at a local Backend; retries on"""
+    monkeypatch.setattr(llm_client, 'LLM_MAX_RETRIES', 2)
+    monkeypatch.setattr(llm_client, 'LLM_RETRY_BACKOFF_MS', 10)
+    handler = type('TestBackend', (Backend,), {})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield handler, OpenAI(**{**llm_client.CLIENT_OPTIONS, 'base_url': f"http://127.0.0.1:{server.server_address[1]}"})
+    server.shutdown()
+    server.server_close()
+
+def test_a_hanging_backend_fails_within_the_deadline_despite_retries(backend):
+    handler, client = backend
+    handler.hang = True
+    started = time.monotonic()
+    with deadline(0.3):
+        with pytest.raises(DeadlineExceeded):
+            create_completion({'model': 'm', 'messages': []}, client)
+    assert time.monotonic() - started < 0.6
+    assert handler.requests == 1  # The timeout used the whole deadline: nothing left to retry with
+
+def test_transient_errors_are_retried_within_the_deadline(backend, monkeypatch):
+    handler, client = backend
+    handler.failures = 2
+    with deadline(5):
+        response = create_completion({'model': 'm', 'messages': []}, client)
+    assert response.choices[0].message.content == '{"ok": true}'
+    assert handler.requests == 3
+
+    handler.requests, handler.failures = 0, 10
+    monkeypatch.setattr(llm_client, 'LLM_RETRY_BACKOFF_MS', 1000)
+    with deadline(0.5):
+        with pytest.raises(InternalServerError):
+            create_completion({'model': 'm', 'messages': []}, client)
+    assert handler.requests == 1  # The backoff wouldn't leave time for another attempt
+
+@pytest.fixture
+def hanging(monkeypatch):
+    completions = HangingCompletions()
+    monkeypatch.setattr(llm_client, 'get_async_client', lambda: SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    return completions
+
+def test_client_deadline_header_bounds_the_llm_call(client, user, hanging):
+    started = time.monotonic()
+    response = client.post('/decompose_goal', json={'goal': 'Run', 'user_id': user['id']},
+                           headers={'X-Request-Deadline-Ms': '100'})
+    assert response.status_code == 504
+    assert time.monotonic() - started < 2
+    assert hanging.timeouts and max(hanging.timeouts) <= 0.1
+
+def test_server_deadline_caps_a_longer_client_deadline(app, client, user, hanging, monkeypatch):
+    monkeypatch.setitem(app.config, 'REQUEST_DEADLINE_MS', 150)
+    response = client.post('/decompose_goal', json={'goal': 'Run', 'user_id': user['id']},
+                           headers={'X-Request-Deadline-Ms': '60000'})
+    assert response.status_code == 504
+    assert max(hanging.timeouts) <= 0.15
+
+def test_no_time_left_fails_before_calling_the_model():
+    calls = []
+    fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: calls.append(kwargs))))
+    with deadline(0):
+        with pytest.raises(DeadlineExceeded):
+            create_completion({'model': 'test-model', 'messages': []}, fake)
+    assert calls == []
+
+def test_hedges_wait_for_history_and_respect_the_rate_cap(monkeypatch):
+    monkeypatch.setattr(llm_client, 'LLM_HEDGE_MAX_RATE', 0.5)
+    metrics = LLMMetrics(min_samples=5)
+    assert metrics.hedge_delay('m') is None  # Too little history to know what slow is
+    for seconds in (0.5, 0.6, 0.7, 0.8, 2.0):
+        metrics.record_latency('m', seconds)
+    assert metrics.hedge_delay('m') == 2.0
+
+    metrics.start_call()
+    assert not metrics.acquire_hedge()  # Half a hedge earned so far
+    metrics.start_call()
+    assert metrics.acquire_hedge()
+    assert metrics.stats()['hedges'] == 1 and metrics.stats()['hedges_denied'] == 1
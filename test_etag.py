@@ -0,0 +1,56 @@
+"""
+Behaviour tests for conditional GETs (weak ETags keyed on the user's data version)
+"""
+from datetime import date
+
+import pytest
+
+from database_service import DatabaseService
+
+def paths(user, habit):
+    return [
+        f"/api/users/{user['id']}/dashboard",
+        f"/api/users/{user['id']}/habits",
+        f"/get_habit_progress/{user['id']}/{habit['id']}",
+        f"/api/users/{user['id']}/trend?days=7"
+    ]
+
+def test_matching_etag_gets_a_bare_304(client, user, habit):
+    for path in paths(user, habit):
+        first = client.get(path)
+        assert first.status_code == 200, path
+        assert first.headers['ETag'].startswith('W/')
+        assert first.headers['Cache-Control'] == 'no-cache'
+
+        again = client.get(path, headers={'If-None-Match': first.headers['ETag']})
+        assert again.status_code == 304, path
+        assert again.get_data() == b''
+        assert again.headers['ETag'] == first.headers['ETag']
+
+@pytest.mark.parametrize('user_id_type', [int, str])
+def test_a_write_changes_the_etag(app, client, user, habit, user_id_type):
+    path = f"/api/users/{user['id']}/dashboard"
+    before = client.get(path)
+    assert before.get_json()['completed_today'] == 0
+
+    with app.app_context():
+        DatabaseService.log_habit_completion(user_id_type(user['id']), habit['id'], date.today(), True)
+
+    after = client.get(path, headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200
+    assert after.headers['ETag'] != before.headers['ETag']
+    assert after.get_json()['completed_today'] == 1
+
+def test_etag_varies_with_query_parameters(client, user, habit):
+    week = client.get(f"/api/users/{user['id']}/trend?days=7")
+    month = client.get(f"/api/users/{user['id']}/trend?days=30", headers={'If-None-Match': week.headers['ETag']})
+    assert month.status_code == 200
+    assert len(month.get_json()) != len(week.get_json())
+
+def test_another_users_write_keeps_the_etag(app, client, user, habit):
+    path = f"/api/users/{user['id']}/habits"
+    before = client.get(path)
+    with app.app_context():
+        other = DatabaseService.get_or_create_user(f"{user['username']}_neighbour")
+        DatabaseService.create_habit_stack(other.id, {'new_habit': 'Floss'})
+    assert client.get(path, headers={'If-None-Match': before.headers['ETag']}).status_code == 304
@@ -0,0 +1,45 @@
+"""
+Behaviour tests for the streaming user data export
+"""
+import csv
+import gzip
+import io
+import json
+
+from database_service import DatabaseService
+
+def log_day(app, user, habit, day, notes=None):
+    with app.app_context():
+        DatabaseService.log_habit_completion(user['id'], habit['id'], day, True, notes)
+
+def test_ndjson_export_streams_user_habits_and_logs(app, client, user, habit):
+    log_day(app, user, habit, '2025-06-01', 'First page')
+    log_day(app, user, habit, '2025-06-02')
+
+    response = client.get(f"/api/users/{user['id']}/export")
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [record['type'] for record in records] == ['user', 'habit', 'log', 'log']
+    assert records[2]['notes'] == 'First page'
+
+def test_csv_export_uses_the_same_type_column_as_ndjson(app, client, user, habit):
+    log_day(app, user, habit, '2025-06-01')
+
+    response = client.get(f"/api/users/{user['id']}/export?format=csv")
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['type'] for row in rows] == ['user', 'habit', 'log']
+    assert 'record_type' not in rows[0]
+    assert rows[1]['name'] == habit['name']
+
+def test_gzip_export_decompresses_to_the_plain_body(app, client, user, habit):
+    log_day(app, user, habit, '2025-06-01')
+
+    plain = client.get(f"/api/users/{user['id']}/export").get_data()
+    compressed = client.get(f"/api/users/{user['id']}/export?gzip=1")
+    assert compressed.mimetype == 'application/gzip'
+    assert gzip.decompress(compressed.get_data()) == plain
+
+def test_export_rejects_unknown_formats_and_users(client, user):
+    assert client.get(f"/api/users/{user['id']}/export?format=xml").status_code == 400
+    assert client.get("/api/users/999999/export").status_code == 404
@@ -0,0 +1,75 @@
+"""
+Behaviour tests for the group-commit write path
+"""
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+
+import app as app_module
+from database_service import DatabaseService
+from group_commit import GroupCommitter, CommitPending
+
+def submit_together(committer, entries):
+    """Submit entries from concurrent threads so they share a batch; returns results or exceptions"""
+    results = [None] * len(entries)
+    def run(index, entry):
+        try:
+            results[index] = committer.submit(*entry)
+        except Exception as e:
+            results[index] = e
+    threads = [threading.Thread(target=run, args=(index, entry)) for index, entry in enumerate(entries)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_writes_commit_as_one_batch(app, user, habit):
+    committer = GroupCommitter(app, window_ms=200)
+    days = [date.today() - timedelta(days=n) for n in range(3)]
+    results = submit_together(committer, [(user['id'], habit['id'], day, True) for day in days])
+
+    assert sorted(result['date'] for result in results) == sorted(day.isoformat() for day in days)
+    assert committer.stats()['batches'] == 1
+    assert committer.stats()['largest_batch'] == 3
+
+def test_a_bad_entry_fails_alone(app, user, habit):
+    committer = GroupCommitter(app, window_ms=200)
+    good = [(user['id'], habit['id'], date.today() - timedelta(days=n), True) for n in range(2)]
+    bad = (user['id'], habit['id'], 20250101, True)  # Not a date: fails inside the transaction
+    results = submit_together(committer, good + [bad])
+
+    assert all(isinstance(result, dict) for result in results[:2])
+    assert isinstance(results[2], TypeError)
+    assert committer.stats()['failed'] == 1
+    with app.app_context():
+        assert len(DatabaseService.list_habit_progress(user['id'], habit['id'], days=5)) == 2
+
+def test_invalid_date_string_is_rejected_before_queueing(app, user, habit):
+    committer = GroupCommitter(app, window_ms=10)
+    with pytest.raises(ValueError):
+        committer.submit(user['id'], habit['id'], '2025-13-45', True)
+    assert committer.stats()['batches'] == 0
+
+def test_slow_commit_is_a_retryable_503(app, client, user, habit, monkeypatch):
+    real = DatabaseService.log_habit_completions
+    def slow(entries):
+        time.sleep(0.3)
+        return real(entries)
+    monkeypatch.setattr(DatabaseService, 'log_habit_completions', staticmethod(slow))
+    monkeypatch.setattr(app_module, 'group_committer', GroupCommitter(app, window_ms=5, timeout=0.05))
+
+    response = client.post('/track_habit', json={'user_id': user['id'], 'habit_id': habit['id'], 'completed': True})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    with pytest.raises(CommitPending):
+        app_module.group_committer.submit(user['id'], habit['id'], date.today(), True)
+    assert app_module.group_committer.stats()['timed_out'] == 2
+
+    time.sleep(0.8)  # The queued writes still land; a retry is an upsert of the same day
+    monkeypatch.setattr(DatabaseService, 'log_habit_completions', staticmethod(real))
+    retry = client.post('/track_habit', json={'user_id': user['id'], 'habit_id': habit['id'], 'completed': True})
+    assert retry.status_code == 200
+    assert retry.get_json()['log']['completed'] is True
@@ -0,0 +1,81 @@
+"""
+Behaviour tests for Idempotency-Key replay on the LLM-backed POST endpoints
+"""
+import hashlib
+import json
+import uuid
+
+import pytest
+
+import app as app_module
+from database_service import DatabaseService
+
+PLAN = {'identity_shift': 'You read', 'atomic_habits': [{'habit_name': 'Read a page', 'two_minute_version': 'Open it'}]}
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Replace the decomposition call; returns the list of goals it was called with"""
+    calls = []
+    async def decompose(goal):
+        calls.append(goal)
+        return json.loads(json.dumps(PLAN))
+    monkeypatch.setattr(app_module, 'goal_decomposition_async', decompose)
+    return calls
+
+def decompose(client, user, key, goal='Read more'):
+    return client.post('/decompose_goal', json={'goal': goal, 'user_id': user['id']}, headers={'Idempotency-Key': key})
+
+def test_a_retry_replays_the_stored_response(client, user, llm):
+    key = str(uuid.uuid4())
+    first = decompose(client, user, key)
+    retry = decompose(client, user, key)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    assert llm == ['Read more']
+
+def test_reusing_a_key_with_another_body_is_refused(client, user, llm):
+    key = str(uuid.uuid4())
+    decompose(client, user, key)
+    assert decompose(client, user, key, goal='Run more').status_code == 422
+    assert llm == ['Read more']
+
+def test_a_retry_while_the_first_request_runs_gets_409(app, client, user, llm):
+    key = str(uuid.uuid4())
+    body = json.dumps({'goal': 'Read more', 'user_id': user['id']}, sort_keys=True, separators=(',', ':'))
+    with app.app_context():
+        outcome, _ = DatabaseService.claim_idempotency_key(
+            user['id'], 'decompose_goal', key, hashlib.sha256(body.encode()).hexdigest(), 3600, 60
+        )
+    assert outcome == 'claimed'
+
+    response = decompose(client, user, key)
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    assert llm == []
+
+def test_server_errors_give_the_key_back(client, user, monkeypatch):
+    answers = [None, PLAN]
+    async def flaky(goal):
+        return answers.pop(0)
+    monkeypatch.setattr(app_module, 'goal_decomposition_async', flaky)
+
+    key = str(uuid.uuid4())
+    assert decompose(client, user, key).status_code == 502
+    retry = decompose(client, user, key)
+    assert retry.status_code == 200
+    assert 'Idempotent-Replayed' not in retry.headers
+
+def test_keys_are_scoped_to_the_user(app, client, user, llm):
+    with app.app_context():
+        other = DatabaseService.get_or_create_user(f"{user['username']}_other").to_dict()
+    key = str(uuid.uuid4())
+    decompose(client, user, key)
+    assert 'Idempotent-Replayed' not in decompose(client, other, key).headers
+    assert len(llm) == 2
+
+def test_requests_without_a_key_always_run(client, user, llm):
+    for _ in range(2):
+        client.post('/decompose_goal', json={'goal': 'Read more', 'user_id': user['id']})
+    assert len(llm) == 2
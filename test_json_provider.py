@@ -0,0 +1,47 @@
+"""
+Behaviour tests for the JSON provider and gzip of large API responses
+"""
+import gzip
+import json
+from datetime import date, datetime, timezone
+
+import pytest
+
+from database_service import DatabaseService
+from json_provider import ISODateJSONProvider, OrjsonProvider, orjson
+
+PROVIDERS = [ISODateJSONProvider, pytest.param(OrjsonProvider, marks=pytest.mark.skipif(orjson is None, reason='orjson not installed'))]
+
+@pytest.mark.parametrize('provider_class', PROVIDERS)
+def test_providers_encode_dates_like_to_dict(app, provider_class):
+    provider = provider_class(app)
+    value = {'day': date(2025, 6, 1), 'at': datetime(2025, 6, 1, 7, 30, tzinfo=timezone.utc), 'big': 2 ** 70}
+    assert json.loads(provider.dumps(value)) == {
+        'day': '2025-06-01', 'at': '2025-06-01T07:30:00+00:00', 'big': 2 ** 70
+    }
+
+@pytest.fixture
+def many_habits(app, user):
+    with app.app_context():
+        for n in range(40):
+            DatabaseService.create_habit_stack(user['id'], {'new_habit': f'Habit number {n}', 'reasoning': 'x' * 40})
+    return f"/api/users/{user['id']}/habits"
+
+def test_large_responses_are_gzipped_for_clients_that_accept_it(client, many_habits):
+    plain = client.get(many_habits)
+    compressed = client.get(many_habits, headers={'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert json.loads(gzip.decompress(compressed.get_data())) == plain.get_json()
+
+def test_small_and_not_modified_responses_are_left_alone(client, user, many_habits):
+    small = client.get(f"/api/users/{user['id']}", headers={'Accept-Encoding': 'gzip'})
+    assert small.status_code == 200
+    assert 'Content-Encoding' not in small.headers
+
+    first = client.get(many_habits, headers={'Accept-Encoding': 'gzip'})
+    again = client.get(many_habits, headers={'Accept-Encoding': 'gzip', 'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert 'Content-Encoding' not in again.headers
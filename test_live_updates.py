@@ -0,0 +1,108 @@
+"""
+Behaviour tests for live dashboard updates over server-sent events
+"""
+import asyncio
+import json
+import time
+from datetime import date
+
+import pytest
+
+from database_service import DatabaseService
+from live_updates import live_updates
+
+@pytest.fixture(autouse=True)
+def quick_heartbeat(monkeypatch):
+    monkeypatch.setattr(live_updates, 'heartbeat', 0.05)
+
+def next_event(chunks, timeout=2):
+    """(name, data) of the next SSE event in a stream body, skipping retry and keepalive lines"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        chunk = next(chunks)
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if chunk.startswith('event: '):
+            name, data = chunk.strip().split('\n')
+            return name[len('event: '):], json.loads(data[len('data: '):])
+    raise AssertionError('No event arrived')
+
+def test_logging_a_habit_pushes_its_streak_to_open_streams(app, client, user, habit):
+    response = client.get(f"/api/users/{user['id']}/events", buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    chunks = iter(response.response)
+    try:
+        assert next(chunks).startswith(b'retry:')
+        client.post('/track_habit', json={'user_id': str(user['id']), 'habit_id': habit['id'], 'completed': True})
+
+        name, data = next_event(chunks)
+        assert name == 'habit_logged'
+        assert data['habit_id'] == habit['id']
+        assert data['date'] == date.today().isoformat()
+        assert data['current_streak'] == 1
+        assert data['today_completed'] == 1
+    finally:
+        response.close()
+    deadline = time.monotonic() + 1
+    while user['id'] in live_updates._subscribers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert user['id'] not in live_updates._subscribers  # Closing the stream unsubscribes
+
+def test_streams_only_carry_their_own_users_events(app, client, user, habit):
+    with app.app_context():
+        other = DatabaseService.get_or_create_user(f"{user['username']}_other").to_dict()
+        other_habit = DatabaseService.create_habit_stack(other['id'], {'new_habit': 'Walk'}).to_dict()
+    response = client.get(f"/api/users/{user['id']}/events", buffered=False)
+    chunks = iter(response.response)
+    try:
+        next(chunks)
+        with app.app_context():
+            DatabaseService.log_habit_completion(other['id'], other_habit['id'], date.today(), True)
+            DatabaseService.log_habit_completion(user['id'], habit['id'], date.today(), True)
+        name, data = next_event(chunks)
+        assert data['habit_id'] == habit['id']
+    finally:
+        response.close()
+
+def test_a_session_cannot_open_another_users_stream(client, user):
+    token = client.post('/api/sessions', json={'username': user['username']}).get_json()['session_token']
+    response = client.get(f"/api/users/{user['id'] + 1000}/events", headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 403
+
+def test_asgi_streams_events_from_the_event_loop(app, user, habit):
+    import asgi
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': f"/api/users/{user['id']}/events",
+        'query_string': b'', 'http_version': '1.1', 'headers': []
+    }
+    sent = []
+
+    async def run():
+        disconnect = asyncio.Event()
+        messages = [{'type': 'http.request', 'body': b''}]
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            if b'habit_logged' in message.get('body', b''):
+                disconnect.set()
+
+        async def log_when_subscribed():
+            while user['id'] not in live_updates._subscribers:
+                await asyncio.sleep(0.01)
+            def log():
+                with app.app_context():
+                    DatabaseService.log_habit_completion(user['id'], habit['id'], date.today(), True)
+            await asyncio.get_running_loop().run_in_executor(None, log)
+
+        await asyncio.wait_for(asyncio.gather(asgi.application(scope, receive, send), log_when_subscribed()), 5)
+
+    asyncio.run(run())
+    assert sent[0]['status'] == 200
+    assert any(b'event: habit_logged' in message.get('body', b'') for message in sent)
+    assert user['id'] not in live_updates._subscribers
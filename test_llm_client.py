@@ -0,0 +1,86 @@
+"""
+Behaviour tests for hedged LLM calls and what they put in the usage ledger
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import llm_client
+import llm_usage
+from llm_client import create_completion, create_completion_async
+from llm_usage import tracked
+
+SLOW, FAST = 0.3, 0.01
+
+def completion(prompt_tokens):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content='{"ok": true}'))],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=1, prompt_cache_hit_tokens=0)
+    )
+
+class FakeCompletions:
+    """The first request is slow and the hedge is fast; prompt_tokens tells them apart"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def answer(self):
+        self.calls += 1
+        return (SLOW, completion(100)) if self.calls == 1 else (FAST, completion(50))
+
+    def create(self, timeout=None, **request):
+        delay, response = self.answer()
+        time.sleep(delay)
+        return response
+
+class FakeAsyncCompletions(FakeCompletions):
+    async def create(self, timeout=None, **request):
+        delay, response = self.answer()
+        await asyncio.sleep(delay)
+        return response
+
+@pytest.fixture
+def rows(monkeypatch):
+    """Hedge every call after 50 ms; returns the usage rows the ledger receives"""
+    recorded = []
+    monkeypatch.setattr(llm_usage.ledger, 'record', recorded.append)
+    monkeypatch.setattr(llm_client.metrics, 'hedge_delay', lambda model: 0.05)
+    monkeypatch.setattr(llm_client.metrics, 'acquire_hedge', lambda: True)
+    return recorded
+
+def wait_for(rows, count):
+    deadline = time.monotonic() + 2
+    while len(rows) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return sorted(rows, key=lambda row: row['prompt_tokens'])
+
+def test_sync_hedge_records_the_losing_attempt(rows):
+    completions = FakeCompletions()
+    fake = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    @tracked('hedge_test')
+    def call():
+        return create_completion({'model': 'test-model', 'messages': []}, fake)
+
+    assert call().usage.prompt_tokens == 50  # The hedge won
+    recorded = wait_for(rows, 2)
+    assert [row['prompt_tokens'] for row in recorded] == [50, 100]
+    assert {row['feature'] for row in recorded} == {'hedge_test'}
+    assert recorded[1]['latency_ms'] >= SLOW * 1000
+
+def test_async_hedge_records_the_losing_attempt(rows, monkeypatch):
+    completions = FakeAsyncCompletions()
+    monkeypatch.setattr(llm_client, 'get_async_client', lambda: SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+
+    @tracked('hedge_test')
+    async def call():
+        response = await create_completion_async({'model': 'test-model', 'messages': []})
+        await asyncio.sleep(SLOW)  # Keep the loop alive until the loser finishes
+        return response
+
+    assert asyncio.run(call()).usage.prompt_tokens == 50
+    recorded = wait_for(rows, 2)
+    assert [row['prompt_tokens'] for row in recorded] == [50, 100]
+    assert recorded[1]['error'] is None
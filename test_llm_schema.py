@@ -0,0 +1,66 @@
+"""
+Behaviour tests for local repair and validation of the model's JSON output
+"""
+from types import SimpleNamespace
+
+import pytest
+
+import habit_builder
+from llm_schema import StructuredOutputError, parse_structured, repair_json, structured_output_stats
+
+HABITS = '{"identity_shift": "You run", "atomic_habits": [{"habit_name": "Jog", "two_minute_version": "Shoes on"}, {"habit_name": "Stretch"}]}'
+
+@pytest.mark.parametrize('content, defect', [
+    ('```json\n' + HABITS + '\n```', 'code_fence'),
+    ('Sure! Here is your plan:\n' + HABITS, 'leading_text'),
+    (HABITS + '\nHope this helps!', 'trailing_text'),
+    (HABITS.replace('"Stretch"}', '"Stretch"},'), 'trailing_comma'),
+])
+def test_common_defects_are_repaired(content, defect):
+    value, defects = repair_json(content)
+    assert defect in defects
+    assert [habit['habit_name'] for habit in value['atomic_habits']] == ['Jog', 'Stretch']
+
+def test_truncated_output_keeps_only_complete_items():
+    truncated = HABITS[:HABITS.index('Stretch') + 3]  # Cut inside the second name
+    assert 'truncated' in repair_json(truncated)[1]
+    value = parse_structured(truncated, 'decomposition')
+    assert [habit['habit_name'] for habit in value['atomic_habits']] == ['Jog']
+
+def test_validation_fills_defaults_renames_keys_and_drops_bad_items():
+    content = '{"atomicHabits": [{"habit_name": "Jog"}, {"rationale": "no name"}, {"habit_name": 42}]}'
+    value = parse_structured(content, 'decomposition')
+    assert value['identity_shift'] == ''
+    assert [habit['habit_name'] for habit in value['atomic_habits']] == ['Jog', '42']
+    assert value['atomic_habits'][0]['two_minute_version'] == ''
+
+def test_a_bare_list_is_wrapped_into_the_schema():
+    assert parse_structured('["Sleep earlier", "Walk after lunch"]', 'adjustment')['suggestions'] == [
+        'Sleep earlier', 'Walk after lunch'
+    ]
+
+@pytest.mark.parametrize('content', [None, 'I cannot help with that.', '{"atomic_habits": []}', '{"atomic_habits": [{"rationale": "x"}]}'])
+def test_unsalvageable_output_is_rejected(content):
+    failed = structured_output_stats().get('decomposition', {}).get('failed', 0)
+    with pytest.raises(StructuredOutputError):
+        parse_structured(content, 'decomposition')
+    assert structured_output_stats()['decomposition']['failed'] == failed + 1
+
+def completion(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+def test_endpoint_stores_habits_from_repaired_output(client, user, monkeypatch):
+    async def fenced(request, task=None):
+        return completion('```json\n' + HABITS.replace('"Stretch"}', '"Stretch"},') + '\n```')
+    monkeypatch.setattr(habit_builder, 'create_completion_async', fenced)
+
+    response = client.post('/decompose_goal', json={'goal': 'Run a 5k', 'user_id': user['id']})
+    assert response.status_code == 200
+    assert [habit['name'] for habit in response.get_json()['created_habits']] == ['Jog', 'Stretch']
+
+def test_endpoint_reports_unrepairable_output(client, user, monkeypatch):
+    async def refusal(request, task=None):
+        return completion('I cannot help with that.')
+    monkeypatch.setattr(habit_builder, 'create_completion_async', refusal)
+
+    assert client.post('/decompose_goal', json={'goal': 'Run a 5k', 'user_id': user['id']}).status_code == 502
@@ -0,0 +1,47 @@
+"""
+Behaviour tests for the User/Habit lookup cache and its invalidation
+Request JSON often carries ids as strings; every write must still evict the
+int-keyed entries the reads cached.
+"""
+import app as app_module
+from database_service import DatabaseService
+
+def fake_decomposition(goal):
+    async def decompose(user_goal):
+        return {
+            'identity_shift': 'You are a runner',
+            'atomic_habits': [{'habit_name': f'Train for: {goal}', 'two_minute_version': 'Put on shoes', 'rationale': 'Start small'}]
+        }
+    return decompose
+
+def test_goal_update_with_string_user_id_is_visible_at_once(client, user, monkeypatch):
+    monkeypatch.setattr(app_module, 'goal_decomposition_async', fake_decomposition('Run a marathon'))
+    assert client.get(f"/api/users/{user['id']}").get_json()['main_goal'] is None  # Now cached
+
+    response = client.post('/decompose_goal', json={'goal': 'Run a marathon', 'user_id': str(user['id'])})
+    assert response.status_code == 200
+
+    assert client.get(f"/api/users/{user['id']}").get_json()['main_goal'] == 'Run a marathon'
+
+def test_deactivate_with_string_ids_evicts_the_cached_habit(app, user, habit):
+    with app.app_context():
+        assert DatabaseService.get_habit(user['id'], habit['id']).is_active  # Cache it
+        assert DatabaseService.get_habit_by_name(user['id'], habit['name'])
+        DatabaseService.deactivate_habit(str(user['id']), str(habit['id']))
+    with app.app_context():
+        assert not DatabaseService.get_habit(user['id'], habit['id']).is_active
+        assert DatabaseService.get_habit_by_name(user['id'], habit['name']) is None
+
+def test_new_habit_is_found_by_name_after_a_cached_miss(app, user):
+    with app.app_context():
+        assert DatabaseService.get_habit_by_name(str(user['id']), 'Stretch') is None
+        created = DatabaseService.create_habit_stack(str(user['id']), {'new_habit': 'Stretch', 'anchor_habit': 'Coffee'})
+    with app.app_context():
+        assert DatabaseService.get_habit_by_name(user['id'], 'Stretch').id == created.id
+        assert DatabaseService.get_habit_by_name(str(user['id']), 'Stretch').id == created.id
+
+def test_cached_habit_is_not_served_to_another_user(app, user, habit):
+    with app.app_context():
+        assert DatabaseService.get_habit(user['id'], habit['id'])
+        assert DatabaseService.get_habit(user['id'] + 1000, habit['id']) is None
+        assert DatabaseService.get_habit(str(user['id']), str(habit['id'])).id == habit['id']
@@ -0,0 +1,106 @@
+"""
+Behaviour tests for importing agent memory documents: rows land once, with
+their dated history, and an interrupted import resumes from its checkpoint
+"""
+import itertools
+import json
+import os
+from datetime import date
+
+import pytest
+
+from database_service import DatabaseService
+from habit_history import month_key, set_day
+from memory_import import import_memory
+from models import db, User, Habit, HabitLog, DailyUserStats
+
+_documents = itertools.count(1)
+
+def history(days):
+    """history_months for {date: completed}"""
+    months = {}
+    for day, completed in days.items():
+        months[month_key(day)] = set_day(months.get(month_key(day), 0), day, completed)
+    return months
+
+def memory_document(**habits):
+    return {
+        'user_id': f"imported_{os.getpid()}_{next(_documents)}",
+        'main_goal': 'Get fit',
+        'identity_shift': 'I am a runner',
+        'habits': habits
+    }
+
+@pytest.fixture
+def dump(tmp_path):
+    """Write documents to a JSON-lines file and return its path"""
+    def write(*documents):
+        path = tmp_path / 'memory.jsonl'
+        path.write_text(''.join(json.dumps(document) + '\n' for document in documents))
+        return str(path)
+    return write
+
+def imported_logs(username):
+    user = User.query.filter_by(username=username).one()
+    return user, {
+        (log.habit.name, log.date): log.completed
+        for log in HabitLog.query.filter_by(user_id=user.id)
+    }
+
+def test_documents_become_users_habits_and_dated_logs(app, dump):
+    document = memory_document(
+        Stretch={'stacked_on': 'Make coffee', 'history_months': history({date(2025, 5, 30): True, date(2025, 6, 2): False})},
+        Journal={'history': [True, False, True]}  # Legacy undated array
+    )
+    source = dump(document, {'habits': {}})  # The second has no user_id
+
+    result = app.test_cli_runner().invoke(args=['import-agent-memory', source])
+    assert result.exit_code == 0, result.output
+    assert 'Skipped 3 undated legacy history entries and 1 invalid documents' in result.output
+
+    with app.app_context():
+        user, logs = imported_logs(document['user_id'])
+        assert (user.main_goal, user.identity_shift) == ('Get fit', 'I am a runner')
+        habits = {habit.name: habit.anchor_habit for habit in Habit.query.filter_by(user_id=user.id)}
+        assert habits == {'Stretch': 'Make coffee', 'Journal': None}
+        assert logs == {('Stretch', date(2025, 5, 30)): True, ('Stretch', date(2025, 6, 2)): False}
+        assert DailyUserStats.query.filter_by(user_id=user.id, date=date(2025, 5, 30)).one().completed == 1
+
+def test_reimporting_inserts_nothing(app, dump):
+    document = memory_document(Stretch={'history_months': history({date(2025, 6, 1): True})})
+    source = dump(document)
+    with app.app_context():
+        first = import_memory(source, report=lambda message: None)
+        again = import_memory(source, report=lambda message: None)
+        assert (first['users'], first['habits'], first['logs']) == (1, 1, 1)
+        assert (again['users'], again['habits'], again['logs']) == (0, 0, 0)
+        assert len(imported_logs(document['user_id'])[1]) == 1
+
+def test_interrupted_import_resumes_after_the_last_committed_chunk(app, dump, tmp_path, monkeypatch):
+    documents = [memory_document(Walk={'history_months': history({date(2025, 6, n): True})}) for n in (1, 2, 3)]
+    source = dump(*documents)
+    checkpoint = str(tmp_path / 'import.ckpt')
+
+    real_import_chunk = DatabaseService.import_memory_chunk
+    chunks = []
+    def crash_on_second_chunk(records):
+        chunks.append(records)
+        if len(chunks) == 2:
+            raise RuntimeError('killed')
+        return real_import_chunk(records)
+
+    with app.app_context():
+        monkeypatch.setattr(DatabaseService, 'import_memory_chunk', staticmethod(crash_on_second_chunk))
+        with pytest.raises(RuntimeError):
+            import_memory(source, chunk_size=1, checkpoint=checkpoint, report=lambda message: None)
+        db.session.rollback()
+        monkeypatch.setattr(DatabaseService, 'import_memory_chunk', staticmethod(real_import_chunk))
+
+        resumed = import_memory(source, chunk_size=1, checkpoint=checkpoint, report=lambda message: None)
+        assert resumed['documents'] == 2  # The first document was committed before the crash
+        assert resumed['users'] == 2
+        for document in documents:
+            assert len(imported_logs(document['user_id'])[1]) == 1
+
+        with pytest.raises(ValueError):
+            import_memory(str(tmp_path / 'other.jsonl'), checkpoint=checkpoint)
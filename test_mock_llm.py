@@ -0,0 +1,65 @@
+"""
+Behaviour tests for benchmarks/mock_llm_server.py: every coaching prompt the
+app sends must get an answer its schema accepts, or load tests measure failures
+"""
+import importlib.util
+import os
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+from openai import OpenAI, InternalServerError, RateLimitError
+
+import habit_builder
+import habit_stacker
+import reduce_friction
+from llm_schema import parse_structured
+
+def load_mock_server():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'mock_llm_server.py')
+    spec = importlib.util.spec_from_file_location('mock_llm_server', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+mock_llm_server = load_mock_server()
+
+@pytest.fixture
+def mock_llm():
+    """Start the mock on a free port; returns (client, handler class) so tests can set its options"""
+    handler = mock_llm_server.MockLLMHandler
+    handler.options = mock_llm_server.parse_args(['--latency-ms', '0', '--seed', '1'])
+    handler.stats = {}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = OpenAI(api_key='mock', base_url=f"http://127.0.0.1:{server.server_address[1]}", max_retries=0)
+    yield client, handler
+    server.shutdown()
+    server.server_close()
+
+REQUESTS = [
+    ('decomposition', habit_builder._completion_request('Run a 5k')),
+    ('stacking', habit_stacker._completion_request(['Make coffee'], ['Stretch', 'Journal'])),
+    ('progression_plan', reduce_friction._deconstruct_request('Run a marathon')),
+    ('adjustment', reduce_friction._adjust_request('Stretch', [True, False, None, False])),
+]
+
+@pytest.mark.parametrize('schema, request_args', REQUESTS, ids=[schema for schema, _ in REQUESTS])
+def test_each_prompt_gets_a_schema_valid_answer(mock_llm, schema, request_args):
+    client, handler = mock_llm
+    response = client.chat.completions.create(model='deepseek-chat', **request_args)
+    assert parse_structured(response.choices[0].message.content, schema)
+    assert response.usage.prompt_tokens > 0
+    assert handler.stats['requests'] == 1
+    assert 'unknown' not in handler.stats
+
+def test_injected_errors_and_truncation(mock_llm):
+    client, handler = mock_llm
+    handler.options.error_rate = 1.0
+    with pytest.raises((RateLimitError, InternalServerError)):
+        client.chat.completions.create(model='deepseek-chat', **habit_builder._completion_request('Run'))
+
+    handler.options.error_rate, handler.options.malformed_rate = 0.0, 1.0
+    response = client.chat.completions.create(model='deepseek-chat', **habit_builder._completion_request('Run'))
+    assert handler.stats['malformed'] == 1
+    assert not response.choices[0].message.content.endswith('}')
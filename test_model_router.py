@@ -0,0 +1,119 @@
+"""
+Behaviour tests for per-task model routing: latency and schema-valid output
+pick the model, and failing models are benched and failed over
+"""
+import json
+from types import SimpleNamespace
+
+import pytest
+from openai import APIConnectionError
+
+import llm_client
+import llm_schema
+import llm_usage
+from habit_stacker import generate_habit_stacks
+from model_router import ModelRouter, load_routes
+
+STACKS = json.dumps({'habit_stacks': [{'anchor_habit': 'Make coffee', 'new_habit': 'Stretch'}]})
+
+def completion(content):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, prompt_cache_hit_tokens=0)
+    )
+
+@pytest.fixture
+def router(monkeypatch):
+    """A fresh router with no exploration or retries, used by both llm_client and llm_schema"""
+    router = ModelRouter({'stacking': ['fast-but-sloppy', 'steady']})
+    router.min_samples, router.explore_rate, router.failures_to_bench = 3, 0.0, 2
+    monkeypatch.setattr(llm_client, 'model_router', router)
+    monkeypatch.setattr(llm_schema, 'model_router', router)
+    monkeypatch.setattr(llm_usage.ledger, 'record', lambda row: None)
+    monkeypatch.setattr(llm_client, 'LLM_MAX_RETRIES', 0)  # Fail over at once; retries are in test_deadlines.py
+    return router
+
+@pytest.fixture
+def models(monkeypatch):
+    """Answers per model: a completion's content, or an exception to raise; records who was called"""
+    answers = {}
+    called = []
+
+    def create(timeout=None, model=None, **request):
+        called.append(model)
+        answer = answers[model]
+        if isinstance(answer, Exception):
+            raise answer
+        return completion(answer)
+    monkeypatch.setattr(llm_client, 'client', SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    return answers, called
+
+def measure(router, model, seconds, ok, times=3):
+    for n in range(times):
+        content = f'answer {n}'
+        router.record_response('stacking', model, seconds, content)
+        router.note_parse(content, ok)
+
+def test_unmeasured_models_keep_list_order_then_the_fastest_wins(router):
+    assert router.candidates('stacking') == ['fast-but-sloppy', 'steady']
+    measure(router, 'fast-but-sloppy', 0.5, True)
+    measure(router, 'steady', 0.1, True)
+    assert router.candidates('stacking') == ['steady', 'fast-but-sloppy']
+    assert router.candidates('unknown-task') == ['deepseek-chat']
+
+def test_schema_invalid_output_disqualifies_a_fast_model(router, models):
+    answers, called = models
+    answers.update({'fast-but-sloppy': 'Sure! Here are your stacks', 'steady': STACKS})
+    measure(router, 'fast-but-sloppy', 0.1, True)
+    measure(router, 'steady', 0.5, True)
+
+    assert generate_habit_stacks(['Make coffee'], ['Stretch']) == {}
+    assert called == ['fast-but-sloppy']
+
+    # 3 of 4 outputs valid is below LLM_ROUTE_MIN_SUCCESS, so the slower model takes over
+    assert generate_habit_stacks(['Make coffee'], ['Stretch'])['habit_stacks'][0]['new_habit'] == 'Stretch'
+    assert called == ['fast-but-sloppy', 'steady']
+    assert router.stats()['stacking'][0]['success_rate'] == 0.75
+
+def test_a_failing_model_is_failed_over_and_benched(router, models):
+    answers, called = models
+    answers.update({'fast-but-sloppy': APIConnectionError(request=None), 'steady': STACKS})
+
+    for _ in range(2):
+        assert generate_habit_stacks(['Make coffee'], ['Stretch'])['habit_stacks']
+    assert called == ['fast-but-sloppy', 'steady'] * 2
+    assert router.stats()['stacking'][0]['benched_seconds'] > 0
+
+    generate_habit_stacks(['Make coffee'], ['Stretch'])
+    assert called[-1:] == ['steady'] and called.count('fast-but-sloppy') == 2  # Benched: not tried
+
+    assert router.candidates('stacking') == ['steady']
+    router._get('stacking', 'fast-but-sloppy').benched_until = 0  # Cooldown over
+    assert 'fast-but-sloppy' in router.candidates('stacking')
+
+def test_an_answer_that_is_never_parsed_takes_no_credit(router, models):
+    answers, called = models
+    answers.update({'fast-but-sloppy': STACKS, 'steady': STACKS})
+    # Routed, then dropped before parsing (as when the caller raises in between)
+    llm_client.create_completion({'messages': []}, task='stacking')
+    llm_schema.parse_structured(json.dumps(json.loads(STACKS)), 'stacking')  # Other output in the same context
+    assert router.stats()['stacking'][0]['samples'] == 0
+
+    generate_habit_stacks(['Make coffee'], ['Stretch'])
+    assert router.stats()['stacking'][0]['samples'] == 1
+
+def test_a_pinned_model_is_not_routed(router, models):
+    answers, called = models
+    answers['pinned'] = STACKS
+    llm_client.create_completion({'model': 'pinned', 'messages': []}, task='stacking')
+    assert called == ['pinned']
+    assert all(entry['routed'] == 0 for entry in router.stats()['stacking'])
+
+def test_routes_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv('LLM_ROUTES', '{"stacking": ["a", "b"], "adjustment": []}')
+    routes = load_routes()
+    assert routes['stacking'] == ['a', 'b']
+    assert routes['adjustment'] == ['deepseek-chat', 'deepseek-coder']  # Empty lists are ignored
+
+    monkeypatch.setenv('LLM_ROUTES', 'not json')
+    assert load_routes()['stacking'] == ['deepseek-coder', 'deepseek-chat']
@@ -0,0 +1,90 @@
+"""
+Behaviour tests for precomputed adjustment suggestions: generated off-peak for
+at-risk habits and served by /adjust_habit only while the history still matches
+"""
+from datetime import date, timedelta
+
+import pytest
+
+import app as app_module
+import reduce_friction
+from database_service import DatabaseService
+
+SUGGESTIONS = {'observation': 'Mornings are hard', 'suggestions': ['Do it after lunch']}
+
+@pytest.fixture
+def at_risk(app, user):
+    """A habit of `user` missed on 3 of the last 4 days"""
+    today = date.today()
+    with app.app_context():
+        habit = DatabaseService.create_habit_stack(user['id'], {'new_habit': f"Stretch for user {user['id']}"}).to_dict()
+        for days_ago, completed in [(1, False), (2, False), (3, True), (4, False)]:
+            DatabaseService.log_habit_completion(user['id'], habit['id'], today - timedelta(days=days_ago), completed)
+    return habit
+
+@pytest.fixture
+def generated(monkeypatch):
+    """Habit names the precompute job asked the model about"""
+    asked = []
+    def analyze(habit, history):
+        asked.append(habit)
+        return SUGGESTIONS
+    monkeypatch.setattr(reduce_friction, 'analyze_and_adjust_habit', analyze)
+    return asked
+
+@pytest.fixture
+def live_calls(monkeypatch):
+    """Habit names /adjust_habit asked the model about"""
+    asked = []
+    async def analyze(habit, history):
+        asked.append(habit)
+        return {'suggestions': ['Live answer']}
+    monkeypatch.setattr(app_module, 'analyze_and_adjust_habit_async', analyze)
+    return asked
+
+def precompute(app):
+    result = app.test_cli_runner().invoke(args=['precompute-adjustments'])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+def test_stored_suggestions_are_served_without_a_model_call(app, client, user, at_risk, generated, live_calls):
+    precompute(app)
+    assert at_risk['name'] in generated
+
+    response = client.post('/adjust_habit', json={'user_id': user['id'], 'habit_id': at_risk['id']})
+    assert response.status_code == 200
+    assert response.headers['X-Precomputed'] == 'true'
+    assert response.get_json() == SUGGESTIONS
+    assert live_calls == []
+
+    # The same name and history sent inline match the same fingerprint
+    with app.app_context():
+        history = DatabaseService.get_recent_history(user['id'], at_risk['id'])
+    inline = client.post('/adjust_habit', json={'user_id': user['id'], 'habit': at_risk['name'], 'history': history})
+    assert inline.headers.get('X-Precomputed') == 'true'
+
+def test_up_to_date_habits_are_skipped_on_the_next_run(app, at_risk, generated):
+    precompute(app)
+    generated.clear()
+    precompute(app)
+    assert at_risk['name'] not in generated
+
+def test_a_new_log_makes_the_stored_suggestions_stale(app, client, user, at_risk, generated, live_calls):
+    precompute(app)
+    client.post('/track_habit', json={'user_id': str(user['id']), 'habit_id': at_risk['id'], 'completed': True})
+
+    response = client.post('/adjust_habit', json={'user_id': user['id'], 'habit_id': at_risk['id']})
+    assert 'X-Precomputed' not in response.headers
+    assert response.get_json() == {'suggestions': ['Live answer']}
+    assert live_calls == [at_risk['name']]
+
+def test_suggestions_are_not_shared_across_users(app, client, user, at_risk, generated, live_calls):
+    precompute(app)
+    with app.app_context():
+        history = DatabaseService.get_recent_history(user['id'], at_risk['id'])
+        other = DatabaseService.get_or_create_user(f"{user['username']}_other").to_dict()
+
+    assert client.post('/adjust_habit', json={'user_id': other['id'], 'habit_id': at_risk['id']}).status_code == 404
+    response = client.post('/adjust_habit', json={'user_id': other['id'], 'habit': at_risk['name'], 'history': history})
+    assert 'X-Precomputed' not in response.headers
+    assert live_calls == [at_risk['name']]
@@ -0,0 +1,44 @@
+"""
+Behaviour tests for the column-projection read path: it must serialize exactly
+like the ORM objects it replaces
+"""
+import json
+from datetime import date, timedelta
+
+from database_service import DatabaseService
+
+def encoded(app, value):
+    return json.loads(app.json.dumps(value))
+
+def test_habit_listing_matches_the_orm_objects(app, client, user, habit):
+    with app.app_context():
+        DatabaseService.create_habit_stack(user['id'], {'new_habit': 'Walk', 'anchor_habit': 'Lunch', 'stack_formula': 'After lunch, walk'})
+        second = DatabaseService.create_habit_stack(user['id'], {'new_habit': 'Stretch'})
+        DatabaseService.deactivate_habit(user['id'], second.id)
+        expected = [habit.to_dict() for habit in DatabaseService.get_user_habits(user['id'])]
+        assert encoded(app, DatabaseService.list_user_habits(user['id'])) == encoded(app, expected)
+        assert len(DatabaseService.list_user_habits(user['id'], active_only=False)) == 3
+    assert client.get(f"/api/users/{user['id']}/habits").get_json() == encoded(app, expected)
+
+def test_progress_listing_matches_the_orm_objects(app, user, habit):
+    today = date.today()
+    with app.app_context():
+        for days_ago, completed in [(0, True), (1, False), (3, True), (40, True)]:
+            DatabaseService.log_habit_completion(user['id'], habit['id'], today - timedelta(days=days_ago), completed, 'note', 3)
+        expected = [log.to_dict() for log in DatabaseService.get_habit_progress(user['id'], habit['id'], days=30)]
+        listed = DatabaseService.list_habit_progress(user['id'], habit['id'], days=30)
+    assert len(listed) == 3
+    assert encoded(app, listed) == encoded(app, expected)
+
+def test_dashboard_streaks_only_for_habits_done_today(app, client, user, habit):
+    today = date.today()
+    with app.app_context():
+        walk = DatabaseService.create_habit_stack(user['id'], {'new_habit': 'Walk'})
+        for days_ago in (0, 1, 2):
+            DatabaseService.log_habit_completion(user['id'], habit['id'], today - timedelta(days=days_ago), True)
+        DatabaseService.log_habit_completion(user['id'], walk.id, today - timedelta(days=1), True)  # Not yet today
+
+    stats = client.get(f"/api/users/{user['id']}/dashboard").get_json()
+    assert stats['habits_with_streaks'] == {habit['name']: 3, 'Walk': 0}
+    assert stats['longest_streak'] == 3
+    assert stats['completed_today'] == 1
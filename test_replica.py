@@ -0,0 +1,65 @@
+"""
+Behaviour tests for routing reads to the replica (a second SQLite file kept in
+step with `flask sync-replica`)
+"""
+from datetime import date
+
+import pytest
+
+from database_service import DatabaseService
+from lookup_cache import LRUCache
+from models import db
+from replica import replica_router, REPLICA_BIND
+
+@pytest.fixture
+def replica(app, tmp_path, monkeypatch):
+    """Route eligible reads to a replica that only changes when sync() is called"""
+    engine = db.create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    with app.app_context():
+        monkeypatch.setitem(db.engines, REPLICA_BIND, engine)
+    monkeypatch.setattr(replica_router, 'enabled', True)
+    monkeypatch.setattr(replica_router, '_recent_writers', LRUCache(maxsize=1024, ttl=60))
+    monkeypatch.setattr(replica_router, 'lag', lambda: 0.0)  # No heartbeat thread in tests
+
+    def sync():
+        result = app.test_cli_runner().invoke(args=['sync-replica'])
+        assert result.exit_code == 0, result.output
+    yield sync
+    engine.dispose()
+
+def log_today(app, user_id, habit_id):
+    with app.app_context():
+        DatabaseService.log_habit_completion(user_id, habit_id, date.today(), True)
+
+def test_lagging_replica_never_serves_an_old_body_under_a_new_etag(app, client, user, habit, replica, monkeypatch):
+    replica()
+    log_today(app, user['id'], habit['id'])
+    # The write was served by another worker, so this one isn't sticky for the user
+    monkeypatch.setattr(replica_router, '_recent_writers', LRUCache(maxsize=1024, ttl=60))
+
+    path = f"/api/users/{user['id']}/dashboard"
+    stale = client.get(path)
+    assert stale.get_json()['completed_today'] == 0  # Served by the replica
+
+    replica()  # The replica catches up
+    fresh = client.get(path, headers={'If-None-Match': stale.headers['ETag']})
+    assert fresh.status_code == 200
+    assert fresh.get_json()['completed_today'] == 1
+
+def test_writers_read_their_own_writes_from_the_primary(app, client, user, habit, replica):
+    replica()
+    sticky = replica_router.stats()['primary_sticky']
+    log_today(app, str(user['id']), habit['id'])  # Form and JSON ids can arrive as strings
+
+    assert client.get(f"/api/users/{user['id']}/dashboard").get_json()['completed_today'] == 1
+    assert replica_router.stats()['primary_sticky'] == sticky + 1
+
+def test_lagging_replica_is_skipped(app, client, user, habit, replica, monkeypatch):
+    replica()
+    log_today(app, user['id'], habit['id'])
+    monkeypatch.setattr(replica_router, '_recent_writers', LRUCache(maxsize=1024, ttl=60))
+    monkeypatch.setattr(replica_router, 'lag', lambda: replica_router.max_lag + 1)
+    lagging = replica_router.stats()['primary_lagging']
+
+    assert client.get(f"/api/users/{user['id']}/dashboard").get_json()['completed_today'] == 1
+    assert replica_router.stats()['primary_lagging'] == lagging + 1
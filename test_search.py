@@ -0,0 +1,108 @@
+"""
+Behaviour tests for full-text search over habits and log notes
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from database_service import DatabaseService
+from lookup_cache import LRUCache
+from models import db
+from replica import replica_router, REPLICA_BIND
+from search_index import search_index
+
+@pytest.fixture(autouse=True)
+def requires_index(app):
+    if not search_index.enabled:  # Set up when the app is created
+        pytest.skip('SQLite was built without FTS5')
+
+def search(client, user, q, **params):
+    response = client.get(f"/api/users/{user['id']}/search", query_string={'q': q, **params})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+def log_note(app, user, habit, days_ago, notes):
+    with app.app_context():
+        return DatabaseService.log_habit_completion(user['id'], habit['id'], date.today() - timedelta(days=days_ago), True, notes).id
+
+@pytest.fixture
+def running(app, user):
+    with app.app_context():
+        return DatabaseService.create_habit_from_decomposition(user['id'], {
+            'habit_name': 'Morning run', 'two_minute_version': 'Put on running shoes', 'rationale': 'Build endurance'
+        }).to_dict()
+
+def test_name_matches_rank_above_notes_and_words_are_stemmed(app, client, user, habit, running):
+    log_id = log_note(app, user, habit, 0, 'Read about how runners pace a marathon')
+
+    body = search(client, user, 'runs')
+    assert [(result['type'], result['habit_id']) for result in body['results']] == [
+        ('habit', running['id']), ('log', habit['id'])
+    ]
+    note = body['results'][1]
+    assert note['log_id'] == log_id
+    assert note['date'] == date.today().isoformat()
+    assert note['habit_name'] == habit['name']
+    assert '[runners]' in note['snippet']
+    assert body['results'][0]['score'] > note['score']
+
+def test_the_last_word_matches_as_a_prefix(client, user, running):
+    assert [result['habit_id'] for result in search(client, user, 'morn')['results']] == [running['id']]
+    assert search(client, user, 'shoes endur')['results'][0]['habit_id'] == running['id']  # Across columns
+    assert search(client, user, 'morning swim')['results'] == []
+
+def test_changing_or_clearing_a_note_updates_the_index(app, client, user, habit):
+    log_note(app, user, habit, 1, 'Fell asleep reading')
+    assert len(search(client, user, 'asleep')['results']) == 1
+
+    log_note(app, user, habit, 1, 'Finished the chapter')
+    assert search(client, user, 'asleep')['results'] == []
+    assert len(search(client, user, 'chapter')['results']) == 1
+
+    log_note(app, user, habit, 1, '')
+    assert search(client, user, 'chapter')['results'] == []
+
+def test_users_only_find_their_own_habits(app, client, user, running):
+    with app.app_context():
+        other = DatabaseService.get_or_create_user(f"{user['username']}_other").to_dict()
+    assert search(client, other, 'run')['results'] == []
+
+def test_pages_and_etags(app, client, user, habit):
+    for days_ago in range(5):
+        log_note(app, user, habit, days_ago, f'Chapter {days_ago} was gripping')
+
+    first = search(client, user, 'gripping', per_page=3)
+    second = search(client, user, 'gripping', per_page=3, page=2)
+    assert (len(first['results']), first['has_more']) == (3, True)
+    assert (len(second['results']), second['has_more']) == (2, False)
+    assert {r['log_id'] for r in first['results']}.isdisjoint(r['log_id'] for r in second['results'])
+
+    url = f"/api/users/{user['id']}/search?q=gripping"
+    etag = client.get(url).headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    log_note(app, user, habit, 6, 'Also gripping')
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
+
+def test_query_syntax_is_treated_as_words(client, user, running):
+    assert search(client, user, 'run" OR NEAR(x')['results'] == []
+    assert search(client, user, '"morning" -run*')['results'][0]['habit_id'] == running['id']
+    assert client.get(f"/api/users/{user['id']}/search?q=%20").status_code == 400
+
+def test_rebuilding_the_index_keeps_results(app, client, user, habit, running):
+    log_note(app, user, habit, 0, 'Skimmed a poem')
+    before = search(client, user, 'poem')
+    result = app.test_cli_runner().invoke(args=['rebuild-search-index'])
+    assert result.exit_code == 0, result.output
+    assert search(client, user, 'poem')['results'] == before['results']
+    assert search(client, user, 'run')['results'][0]['habit_id'] == running['id']
+
+def test_search_reads_the_primary_when_a_replica_is_configured(app, client, user, running, tmp_path, monkeypatch):
+    empty = db.create_engine(f"sqlite:///{tmp_path / 'replica.db'}")  # No index, no habits
+    with app.app_context():
+        monkeypatch.setitem(db.engines, REPLICA_BIND, empty)
+    monkeypatch.setattr(replica_router, 'enabled', True)
+    monkeypatch.setattr(replica_router, '_recent_writers', LRUCache(maxsize=1024, ttl=60))
+    monkeypatch.setattr(replica_router, 'lag', lambda: 0.0)
+
+    assert search(client, user, 'run')['results'][0]['habit_id'] == running['id']
+    empty.dispose()
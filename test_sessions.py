@@ -0,0 +1,121 @@
+"""
+Behaviour tests for session-token authentication, under WSGI and asgi.py
+"""
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+import app as app_module
+from database_service import DatabaseService
+from live_updates import LiveUpdates, SocketBroker
+from session_auth import SessionAuth, session_auth
+
+@pytest.fixture
+def token(client, user):
+    response = client.post('/api/sessions', json={'username': user['username']})
+    assert response.status_code == 200
+    return response.get_json()['session_token']
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+def track(client, token, habit):
+    return client.post('/track_habit', headers=bearer(token), json={'habit_id': habit['id'], 'completed': True})
+
+def test_tokens_are_checked_against_the_path_user(client, user, token):
+    assert client.get(f"/api/users/{user['id']}/habits", headers=bearer(token)).status_code == 200
+    assert client.get(f"/api/users/{user['id'] + 1000}/habits", headers=bearer(token)).status_code == 403
+    assert client.get(f"/api/users/{user['id']}/habits", headers=bearer('not-a-token')).status_code == 401
+
+def test_reads_use_the_cache(client, user, token):
+    lookups = session_auth.stats()['db_lookups']
+    for _ in range(3):
+        assert client.get(f"/api/users/{user['id']}/habits", headers=bearer(token)).status_code == 200
+    assert session_auth.stats()['db_lookups'] == lookups + 1
+
+def test_session_user_replaces_the_body_user(client, user, habit, token):
+    response = track(client, token, habit)
+    assert response.status_code == 200
+    assert response.get_json()['log']['user_id'] == user['id']
+
+def test_writes_use_the_cache_too(client, user, habit, token):
+    lookups = session_auth.stats()['db_lookups']
+    for _ in range(3):
+        assert track(client, token, habit).status_code == 200
+    assert session_auth.stats()['db_lookups'] == lookups + 1
+
+def test_logout_through_the_broker_stops_reads_and_writes_at_once(app, client, user, habit, token):
+    assert client.get(f"/api/users/{user['id']}/habits", headers=bearer(token)).status_code == 200  # Now cached
+    with app.app_context():
+        DatabaseService.end_session(token)  # As another worker would: not through this worker's view
+
+    assert track(client, token, habit).status_code == 401
+    assert client.get(f"/api/users/{user['id']}/habits", headers=bearer(token)).status_code == 401
+
+def test_session_ends_reach_other_workers_over_sockets(app, monkeypatch):
+    socket_dir = tempfile.mkdtemp(prefix='sessions-')  # Short enough for a unix socket path
+    listener, auth = LiveUpdates(), SessionAuth()
+    listener.app, listener.broker = app, SocketBroker(socket_dir)
+    listener.on_session_end(auth.invalidate)
+    listener.ensure_started()
+    auth._cache.set('ended-token', (1, None))
+
+    # Another worker: its socket is named after its own pid
+    other = LiveUpdates()
+    other.app, other.broker = app, SocketBroker(socket_dir)
+    with monkeypatch.context() as patched:
+        patched.setattr(os, 'getpid', lambda: -1)
+        other.publish_session_end('ended-token')
+        deadline = time.monotonic() + 2
+        while auth.cached('ended-token') is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert auth.cached('ended-token') is None
+
+def test_logout_here_stops_reads_at_once(client, user, token):
+    assert client.get(f"/api/users/{user['id']}/habits", headers=bearer(token)).status_code == 200
+    assert client.delete('/api/sessions', headers=bearer(token)).status_code == 200
+    assert client.get(f"/api/users/{user['id']}/habits", headers=bearer(token)).status_code == 401
+
+def call_asgi(method, path, headers, body=b''):
+    """Run one request through asgi.application; returns (status, body)"""
+    import asgi
+    headers = {**headers, 'Content-Length': str(len(body))}
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'http_version': '1.1',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    }
+    messages = [{'type': 'http.request', 'body': body}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.application(scope, receive, send))
+    return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+def test_asgi_looks_sessions_up_off_the_event_loop(token, monkeypatch):
+    async def deconstruct(habit):
+        return {'progression_plan': []}
+    monkeypatch.setattr(app_module, 'deconstruct_complex_habit_async', deconstruct)
+    real = DatabaseService.get_session_user
+    threads = []
+    def recording(session_token):
+        threads.append(threading.current_thread().name)
+        return real(session_token)
+    monkeypatch.setattr(DatabaseService, 'get_session_user', staticmethod(recording))
+
+    headers = {**bearer(token), 'Content-Type': 'application/json'}
+    status, body = call_asgi('POST', '/reduce_friction', headers, json.dumps({'habit': 'Run'}).encode())
+    assert status == 200, body
+    assert len(threads) == 1 and threads[0].startswith('db')
+
+    status, _ = call_asgi('POST', '/reduce_friction', bearer('not-a-token'), b'{}')
+    assert status == 401
@@ -0,0 +1,73 @@
+"""
+Behaviour tests for the slow-query log and the admin token in front of it
+"""
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+import slow_query
+from database_service import DatabaseService
+from models import db
+from slow_query import slow_query_log
+
+ADMIN = {'X-Admin-Token': 'test-admin-token'}
+
+@pytest.fixture
+def admin(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'ADMIN_TOKEN', ADMIN['X-Admin-Token'])
+
+def test_admin_endpoints_need_the_admin_token(client, admin):
+    for headers in ({}, {'X-Admin-Token': 'guess'}):
+        assert client.get('/api/admin/slow_queries', headers=headers).status_code == 403
+        assert client.delete('/api/admin/slow_queries', headers=headers).status_code == 403
+        assert client.get('/api/admin/llm_usage', headers=headers).status_code == 403
+    assert client.get('/api/admin/slow_queries', headers=ADMIN).status_code == 200
+    assert client.delete('/api/admin/slow_queries', headers=ADMIN).status_code == 200
+
+def test_admin_endpoints_are_off_without_a_configured_token(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'ADMIN_TOKEN', None)
+    assert client.get('/api/admin/cache_stats', headers={'X-Admin-Token': ''}).status_code == 403
+
+def test_slow_statements_are_logged_without_their_values(app, client, user, habit, admin, monkeypatch):
+    monkeypatch.setattr(slow_query_log, 'threshold', 0.0)  # Every statement is "slow"
+    client.delete('/api/admin/slow_queries', headers=ADMIN)
+
+    token = client.post('/api/sessions', json={'username': user['username']}).get_json()['session_token']
+    with app.app_context():
+        DatabaseService.log_habit_completion(user['id'], habit['id'], date.today(), True, 'private note about my day')
+
+    response = client.get('/api/admin/slow_queries?limit=500', headers=ADMIN)
+    report = response.get_data(as_text=True)
+    assert response.get_json()['recent']
+    assert token not in report
+    assert 'private note' not in report
+    assert user['username'] not in report
+    assert all('parameters' not in entry for entry in response.get_json()['recent'])
+
+def test_a_failing_explain_leaves_the_callers_transaction_usable(app, user, habit, monkeypatch):
+    monkeypatch.setattr(slow_query_log, 'threshold', 0.0)
+    monkeypatch.setitem(slow_query.EXPLAIN_PREFIXES, 'sqlite', 'NOT AN EXPLAIN ')
+    slow_query_log.reset()
+    with app.app_context():
+        traced = []
+        db.session.connection().connection.dbapi_connection.set_trace_callback(traced.append)
+        try:
+            DatabaseService.log_habit_completion(user['id'], habit['id'], date.today(), True, 'in a savepoint')
+            assert DatabaseService.get_habit_progress(user['id'], habit['id'], days=1)[0].notes == 'in a savepoint'
+        finally:
+            db.session.connection().connection.dbapi_connection.set_trace_callback(None)
+    assert any(statement.startswith('ROLLBACK TO SAVEPOINT') for statement in traced)
+    plans = [entry['plan'] for entry in slow_query_log.report()['recent']]
+    assert plans and all(plan.startswith('EXPLAIN failed') for plan in plans if plan)
+
+def test_plans_are_capped_with_the_fingerprints(app, monkeypatch):
+    monkeypatch.setattr(slow_query_log, 'threshold', 0.0)
+    monkeypatch.setattr(slow_query, 'MAX_FINGERPRINTS', 3)
+    slow_query_log.reset()
+    with app.app_context():
+        for n in range(6):
+            db.session.execute(text(f"SELECT {'1, ' * n}1 FROM users LIMIT 1"))
+        db.session.rollback()
+    assert len(slow_query_log._totals) <= 3
+    assert slow_query_log._plans and set(slow_query_log._plans) <= set(slow_query_log._totals)
@@ -0,0 +1,43 @@
+"""
+Behaviour tests for serving the React build from the in-memory manifest
+"""
+import gzip
+
+import pytest
+
+import app as app_module
+from static_assets import StaticAssetManifest
+
+INDEX_HTML = b'<!doctype html><title>HabitBuilder</title>'
+BUNDLE = b'console.log("habit");' * 200
+
+@pytest.fixture
+def build_dir(tmp_path, monkeypatch):
+    (tmp_path / 'static' / 'js').mkdir(parents=True)
+    (tmp_path / 'index.html').write_bytes(INDEX_HTML)
+    (tmp_path / 'static' / 'js' / 'main.3f2a1b4c.js').write_bytes(BUNDLE)
+    monkeypatch.setattr(app_module, 'static_assets', StaticAssetManifest(str(tmp_path)).build())
+    return tmp_path
+
+@pytest.mark.parametrize('path', ['/', '/dashboard', '/habits/v1.2', '/users/jane.doe', '/favicon.ico'])
+def test_client_routes_get_the_index(client, build_dir, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.get_data() == INDEX_HTML
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+@pytest.mark.parametrize('path', ['/static/js/main.00000000.js', '/static/js/missing.js', '/assets/app.1234abcd.css'])
+def test_missing_build_files_are_404(client, build_dir, path):
+    assert client.get(path).status_code == 404
+
+def test_fingerprinted_bundles_are_immutable_and_precompressed(client, build_dir):
+    response = client.get('/static/js/main.3f2a1b4c.js', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert gzip.decompress(response.get_data()) == BUNDLE
+
+    again = client.get('/static/js/main.3f2a1b4c.js', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']
+    })
+    assert again.status_code == 304